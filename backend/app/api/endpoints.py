@@ -1,11 +1,32 @@
-from fastapi import APIRouter, UploadFile, File, Form, BackgroundTasks, HTTPException
-from fastapi.responses import FileResponse
-from pydantic import BaseModel, EmailStr
-from typing import List, Optional
-import shutil
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Request, Header, Query
+from fastapi.responses import FileResponse, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
+from starlette.background import BackgroundTask
+from pydantic import BaseModel, EmailStr, Field, ValidationError
+from typing import Dict, List, Optional
 import os
-import pandas as pd
+import threading
+import uuid
+import time
+import asyncio
+from contextlib import asynccontextmanager
 from app.services.email_service import email_service
+from app.services.send_engine import send_engine, CampaignPaused, CampaignAborted, MAX_BATCH_RECIPIENTS
+from app.services.scheduler import campaign_scheduler
+from app.services.mime_cache import part_caches
+from app.services.template_engine import CampaignTemplates, CompiledTemplate
+from app.services.recipient_store import load_recipients
+from app.services.recipient_validation import MXResolver, skipped_report_rows
+from app.services.job_store import job_store, SORTABLE_FIELDS
+from app.services.report_export import iter_csv, write_xlsx, xlsx_filename
+from app.services.asset_store import asset_store, upload_sessions, attachment_order, UploadSession
+from app.services.upload_io import upload_slot, run_io, save_upload, UploadsBusy
+from app.services.progress import progress_hub
+from app.services.image_optimizer import optimize_image
+from app.services.certificate_generator import (certificate_jobs, CertificateJob, prepare_template, TEMPLATE_DIR,
+                                                OUTPUT_FORMATS, FONT_FILES)
+from app.services.smtp_pool import MAX_IDLE_PER_KEY
+from app.services.download_links import link_signer, resolve_file, InvalidLink, LinkExpired, LINK_EXPIRY_HOURS
 import json
 import logging
 
@@ -13,18 +34,118 @@ logger = logging.getLogger("uvicorn")
 
 router = APIRouter()
 
+# Live progress stream: how often new rows are checked for, and how often
+# counters are pushed while nothing else happens
+PROGRESS_POLL = 0.5
+PROGRESS_INTERVAL = 2.0
+
+# Resumable uploads: request body bytes collected before each disk write
+UPLOAD_WRITE_SIZE = 1024 * 1024
+
+# Report rows per page (the Dashboard table) and the most a client may ask for
+REPORT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# RESU_SEND_WORKER=1: campaigns are queued in the job store and sent by
+# separate `python -m app.worker` processes instead of this one
+SEND_IN_WORKER = os.environ.get("RESU_SEND_WORKER") == "1"
+
 # --- Models ---
+class SenderConfig(BaseModel):
+    """An extra sender account the campaign is spread over"""
+    sender_email: EmailStr
+    password: str
+    # None uses the campaign's concurrency / no limit (provider_limits: the
+    # SMTP host defaults)
+    concurrency: Optional[int] = Field(None, ge=1, le=MAX_IDLE_PER_KEY)
+    rate_per_minute: Optional[int] = Field(None, ge=1)
+    daily_quota: Optional[int] = Field(None, ge=0)
+
 class EmailConfig(BaseModel):
     sender_email: EmailStr
     password: str
     subject: str
     body_html: str
     footer_html: Optional[str] = ""
+    # Parallel SMTP sessions for this sender account
+    concurrency: int = Field(4, ge=1, le=MAX_IDLE_PER_KEY)
+    # Throttling for this sender account; None = no limit (or the SMTP
+    # host's defaults with provider_limits), daily_quota=0 disables the quota
+    rate_per_minute: Optional[int] = Field(None, ge=1)
+    daily_quota: Optional[int] = Field(None, ge=0)
+    # Apply the known providers' rates and daily quotas (scheduler.HOST_LIMITS)
+    # to every sender account that doesn't set its own
+    provider_limits: bool = False
+    # Send recipients of the same domain one after another
+    group_by_domain: bool = False
+    # Recipients per message when nobody gets personalized content
+    # (no {{...}} placeholders, no per-row attachments); 1 = one message each
+    batch_size: int = Field(1, ge=1, le=MAX_BATCH_RECIPIENTS)
+    # Build every message ahead of the SMTP workers in separate processes
+    prerender: bool = False
+    # Only build every message (report: "Validado"), nothing is sent
+    dry_run: bool = False
+    # More accounts to send from: rows are spread over sender_email and
+    # these, each with its own SMTP host, sessions and daily quota
+    senders: List[SenderConfig] = []
+    # Put signed download links to folder1/folder2 files in the body
+    # ({{enlaces}}, or the end of the body) instead of attaching them
+    attachment_links: bool = False
+    link_expiry_hours: int = Field(LINK_EXPIRY_HOURS, ge=1, le=90 * 24)
+    # Address recipients reach this server at; defaults to RESU_PUBLIC_URL,
+    # or the URL the campaign was started from
+    public_url: Optional[str] = None
+
+    def stored(self) -> dict:
+        """Config as saved with the campaign: no passwords"""
+        return self.model_dump(exclude={"password": True, "senders": {"__all__": {"password"}}})
+
+    def sender_passwords(self) -> Dict[str, str]:
+        return {sender.sender_email: sender.password for sender in self.senders}
+
+    def sender_emails(self) -> List[str]:
+        return [self.sender_email] + [sender.sender_email for sender in self.senders]
+
+    @classmethod
+    def from_stored(cls, stored: dict, password: str, sender_passwords: Dict[str, str]) -> "EmailConfig":
+        """Saved campaign config with its passwords put back"""
+        senders = [dict(sender, password=sender_passwords.get(sender["sender_email"], ""))
+                   for sender in stored.get("senders", [])]
+        return cls(**{**stored, "senders": senders}, password=password)
 
 class LoginRequest(BaseModel):
     username: str
     password: str
 
+class ResumeRequest(BaseModel):
+    password: str
+    # Passwords of the campaign's extra sender accounts, by address
+    sender_passwords: Dict[str, str] = {}
+
+class UploadFileSpec(BaseModel):
+    name: str
+    size: int = Field(..., ge=0)
+    sha256: Optional[str] = Field(None, pattern=r"^[0-9a-fA-F]{64}$")
+
+class UploadSessionRequest(BaseModel):
+    folder_type: str
+    files: List[UploadFileSpec]
+
+class CertificateField(BaseModel):
+    # Text drawn on the template, e.g. "{{NombreConstancia}}"
+    text: str
+    # Position and box width as fractions of the template (0-1); y is the
+    # middle of the line, text wider than width shrinks to fit
+    x: float = Field(..., ge=0, le=1)
+    y: float = Field(..., ge=0, le=1)
+    width: Optional[float] = Field(None, gt=0, le=1)
+    # Font size as a fraction of the template height
+    size: float = Field(0.04, gt=0, le=1)
+    color: str = "#000000"
+    align: str = Field("center", pattern=r"^(left|center|right)$")
+    # regular, bold, serif, or custom (the font uploaded with the template)
+    font: str = "regular"
+
 # --- In-memory state (for simplicity in this iteration) ---
 # In a real app, use a database.
 current_campaign = {
@@ -42,226 +163,339 @@ def login(creds: LoginRequest):
     raise HTTPException(status_code=401, detail="Invalid credentials")
 
 # --- Uploads ---
-@router.post("/upload/excel")
-async def upload_excel(file: UploadFile = File(...)):
-    file_location = f"temp/uploads/{file.filename}"
-    with open(file_location, "wb+") as file_object:
-        shutil.copyfileobj(file.file, file_object)
-    
-    # Parse Excel
+# Disk writes and parsing run in the bounded upload executor, so a large
+# upload never stalls other requests on the event loop.
+@asynccontextmanager
+async def _upload_slot():
     try:
-        df = pd.read_excel(file_location)
-        # Expecting columns like 'Correo', 'NombreConstancia' etc.
-        # Convert to list of dicts
-        recipients = df.to_dict(orient="records")
-        # Clean keys (strip spaces)
-        recipients = [{k.strip(): v for k, v in r.items()} for r in recipients]
+        async with upload_slot():
+            yield
+    except UploadsBusy as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+
+@router.post("/upload/excel")
+async def upload_excel(file: UploadFile = File(...), check_domains: bool = Form(False)):
+    async with _upload_slot():
+        file_location = f"temp/uploads/{file.filename}"
+        await save_upload(file, file_location)
         
-        current_campaign["recipients"] = recipients
-        return {"count": len(recipients), "preview": recipients[:5]}
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Error parsing Excel: {str(e)}")
+        # Parse Excel/CSV in chunks into a column-oriented table
+        try:
+            # Expecting columns like 'Correo', 'NombreConstancia' etc.
+            # Addresses are validated and deduplicated here, before /send
+            resolver = MXResolver() if check_domains else None
+            recipients, summary = await run_io(load_recipients, file_location, resolver=resolver)
+            
+            current_campaign["recipients"] = recipients
+            current_campaign["skip_rows"] = summary["skip"]
+            return {
+                "count": len(recipients),
+                "preview": recipients.preview(5),
+                "columns": summary["columns"],
+                "valid_count": summary["valid_count"],
+                "invalid_count": summary["invalid_count"],
+                "invalid": summary["invalid"],
+                "duplicate_count": summary["duplicate_count"],
+                "duplicates": summary["duplicates"],
+                "domains": summary["domains"],
+                "mail_servers": summary["mail_servers"]
+            }
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=f"Error parsing Excel: {str(e)}")
 
 @router.post("/upload/asset")
 async def upload_asset(file: UploadFile = File(...), type: str = Form(...)):
-    try:
-        # type: 'logo', 'flyer'
-        os.makedirs("temp/assets", exist_ok=True)
-        file_location = f"temp/assets/{file.filename}"
-        with open(file_location, "wb+") as file_object:
-            shutil.copyfileobj(file.file, file_object)
-        
-        current_campaign["assets"][type] = file_location
-        
-        return {"status": "uploaded", "path": file_location}
-    except Exception as e:
-        logger.error(f"Error uploading asset: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+    async with _upload_slot():
+        try:
+            # type: 'logo', 'flyer'
+            file_location = f"temp/assets/{file.filename}"
+            await save_upload(file, file_location)
+            
+            # Every email embeds the image: send a copy sized for the template
+            optimized = await run_io(optimize_image, file_location, type)
+            current_campaign["assets"][type] = optimized
+            
+            return {
+                "status": "uploaded",
+                "path": optimized,
+                "original_size": os.path.getsize(file_location),
+                "size": os.path.getsize(optimized)
+            }
+        except Exception as e:
+            logger.error(f"Error uploading asset: {e}")
+            raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/upload/assets-folder")
 async def upload_assets_folder(files: List[UploadFile] = File(...), folder_type: str = Form(...)):
-    try:
-        # folder_type: 'folder1', 'folder2'
-        saved_paths = []
-        
-        # Sort files numerically by extracting ONLY the number from filename
-        # Works with: "1_archivo.pdf", "2.docx", "10_documento.xlsx", etc.
-        import re
-        def extract_number(filename):
-            # Extract the first number found in the filename
-            match = re.search(r'(\d+)', filename)
-            return int(match.group(1)) if match else 999999
-        
-        # Sort files by the extracted number
-        sorted_files = sorted(files, key=lambda f: extract_number(f.filename))
-        
-        target_dir = f"temp/assets/{folder_type}"
-        os.makedirs(target_dir, exist_ok=True)
-        
-        logger.info(f"Uploading {len(sorted_files)} files to {folder_type}")
-        
-        for file in sorted_files:
-            # Get just the filename, removing any path components
-            # This handles cases where the browser sends the full path
-            filename = os.path.basename(file.filename)
+    async with _upload_slot():
+        try:
+            # folder_type: 'folder1', 'folder2'
+            saved_paths = []
             
-            # Save directly in the target directory (no subdirectories)
-            file_location = os.path.join(target_dir, filename)
+            # Sort files numerically by extracting ONLY the number from filename
+            sorted_files = sorted(files, key=lambda f: attachment_order(f.filename))
             
-            logger.info(f"Saving file: {filename} -> {file_location}")
+            target_dir = f"temp/assets/{folder_type}"
             
-            with open(file_location, "wb+") as file_object:
-                shutil.copyfileobj(file.file, file_object)
+            logger.info(f"Uploading {len(sorted_files)} files to {folder_type}")
             
-            saved_paths.append(file_location)
-        
-        if folder_type == "folder1":
-            current_campaign["attachments_folder1"] = saved_paths
-        elif folder_type == "folder2":
-            current_campaign["attachments_folder2"] = saved_paths
+            for file in sorted_files:
+                # Get just the filename, removing any path components
+                # This handles cases where the browser sends the full path
+                filename = os.path.basename(file.filename)
+                
+                # Save directly in the target directory (no subdirectories)
+                file_location = os.path.join(target_dir, filename)
+                
+                logger.info(f"Saving file: {filename} -> {file_location}")
+                await save_upload(file, file_location)
+                
+                saved_paths.append(file_location)
             
-        logger.info(f"Successfully uploaded {len(saved_paths)} files to {folder_type}")
-        logger.info(f"File paths: {saved_paths}")
-        return {"status": "uploaded", "count": len(saved_paths)}
-    except Exception as e:
-        logger.error(f"Error uploading assets folder: {e}")
-        import traceback
-        logger.error(traceback.format_exc())
-        raise HTTPException(status_code=500, detail=str(e))
+            if folder_type == "folder1":
+                current_campaign["attachments_folder1"] = saved_paths
+            elif folder_type == "folder2":
+                current_campaign["attachments_folder2"] = saved_paths
+                
+            logger.info(f"Successfully uploaded {len(saved_paths)} files to {folder_type}")
+            logger.info(f"File paths: {saved_paths}")
+            return {"status": "uploaded", "count": len(saved_paths)}
+        except Exception as e:
+            logger.error(f"Error uploading assets folder: {e}")
+            import traceback
+            logger.error(traceback.format_exc())
+            raise HTTPException(status_code=500, detail=str(e))
+
+# --- Resumable uploads (content-addressed store) ---
+def _upload_session(session_id: str) -> UploadSession:
+    session = upload_sessions.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Upload session not found")
+    return session
+
+@router.post("/upload/sessions")
+def create_upload_session(req: UploadSessionRequest):
+    """Declare the files of an attachment folder before sending them.
+
+    Files whose sha256 is already in the store come back as done and
+    don't have to be uploaded again.
+    """
+    if req.folder_type not in ("folder1", "folder2"):
+        raise HTTPException(status_code=400, detail="folder_type must be folder1 or folder2")
+    session = upload_sessions.create(req.folder_type, [f.model_dump() for f in req.files])
+    logger.info(f"Upload session {session.id}: {len(req.files)} files for {req.folder_type}")
+    return session.info()
+
+@router.get("/upload/sessions/{session_id}")
+def get_upload_session(session_id: str):
+    """Offsets to resume from after an interrupted upload"""
+    return _upload_session(session_id).info()
+
+@router.put("/upload/sessions/{session_id}/files/{index}")
+async def upload_session_chunk(session_id: str, index: int, request: Request, offset: int = Query(0, ge=0)):
+    """Append the raw request body to file `index` starting at `offset`"""
+    session = _upload_session(session_id)
+    if not 0 <= index < len(session.files):
+        raise HTTPException(status_code=404, detail="File not in this upload session")
+
+    # Disk writes and hashing run in the upload executor, never on the event loop
+    async with _upload_slot():
+        buffered = bytearray()
+        try:
+            async for data in request.stream():
+                buffered += data
+                if len(buffered) >= UPLOAD_WRITE_SIZE:
+                    await run_io(session.write, index, offset, bytes(buffered))
+                    offset += len(buffered)
+                    buffered.clear()
+            if buffered:
+                await run_io(session.write, index, offset, bytes(buffered))
+        except ValueError as e:
+            raise HTTPException(status_code=409, detail={"message": str(e), "offset": session.files[index].info()["offset"]})
+    return session.files[index].info()
+
+@router.post("/upload/sessions/{session_id}/complete")
+def complete_upload_session(session_id: str):
+    """Use the uploaded folder for the campaign: row i gets manifest[i]"""
+    session = _upload_session(session_id)
+    if not session.complete:
+        raise HTTPException(status_code=409, detail=session.info())
+    manifest = session.manifest()
+    current_campaign[f"attachments_{session.folder_type}"] = [item["path"] for item in manifest]
+    upload_sessions.close(session_id)
+    logger.info(f"Upload session {session_id} complete: {len(manifest)} files for {session.folder_type}")
+    return {"status": "uploaded", "count": len(manifest), "manifest": manifest}
+
+# --- Certificates (constancias) generated from one template ---
+def _certificate_job(job_id: str) -> CertificateJob:
+    job = certificate_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Certificate job not found")
+    return job
+
+def _certificate_target(folder_type: str) -> tuple:
+    """What a certificate job is generated for: this campaign, its recipients and the folder it replaces"""
+    return current_campaign, current_campaign["recipients"], current_campaign.get(f"attachments_{folder_type}")
+
+def _use_certificates(job: CertificateJob, target: tuple) -> bool:
+    # Same as uploading the folder: row i gets certificate i. Unless the
+    # campaign was cleared, or its recipients or that folder replaced, while
+    # the job ran: row i may no longer be the same person.
+    if any(now is not then for now, then in zip(_certificate_target(job.folder_type), target)):
+        logger.warning(f"Certificate job {job.id}: the campaign changed while it ran, not using its files")
+        return False
+    current_campaign[f"attachments_{job.folder_type}"] = job.paths
+    return True
+
+@router.post("/certificates")
+async def generate_certificates(template: UploadFile = File(...), fields: str = Form(...),
+                                folder_type: str = Form("folder1"), output_format: str = Form("pdf"),
+                                file_name: str = Form("{{n}}_constancia"),
+                                font: Optional[UploadFile] = File(None)):
+    """Render one certificate per recipient row into an attachment folder.
+
+    template is an image (or a PDF, with PyMuPDF installed) and fields a
+    JSON list of CertificateField. Runs in the background: poll
+    /certificates/{job_id}; when it completes, folder_type is set for the
+    campaign as if the files had been uploaded. If the campaign was cleared
+    or its recipients or that folder replaced meanwhile, the job ends as
+    "discarded" instead.
+    """
+    recipients = current_campaign["recipients"]
+    if not recipients:
+        raise HTTPException(status_code=400, detail="No recipients loaded")
+    if folder_type not in ("folder1", "folder2"):
+        raise HTTPException(status_code=400, detail="folder_type must be folder1 or folder2")
+    if output_format not in OUTPUT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"output_format must be one of: {', '.join(OUTPUT_FORMATS)}")
+    try:
+        field_specs = [CertificateField(**field).model_dump() for field in json.loads(fields)]
+    except (ValueError, TypeError, ValidationError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid fields: {e}")
+    if not field_specs:
+        raise HTTPException(status_code=400, detail="No fields to draw on the template")
+    fonts = set(FONT_FILES) | ({"custom"} if font is not None else set())
+    bad_fonts = sorted({field["font"] for field in field_specs} - fonts)
+    if bad_fonts:
+        raise HTTPException(status_code=400, detail=f"Unknown fonts: {', '.join(bad_fonts)}")
+    # {{n}} is the row position; every other placeholder must be a column
+    placeholders = set().union(*(CompiledTemplate(text).placeholders
+                                 for text in [file_name] + [field["text"] for field in field_specs]))
+    unknown = sorted(placeholders - set(recipients.columns) - {"n"})
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown placeholders: {', '.join('{{' + name + '}}' for name in unknown)}"
+        )
+
+    async with _upload_slot():
+        prefix = uuid.uuid4().hex[:8]
+        template_location = os.path.join(TEMPLATE_DIR, f"{prefix}_{os.path.basename(template.filename)}")
+        await save_upload(template, template_location)
+        font_location = None
+        if font is not None:
+            font_location = os.path.join(TEMPLATE_DIR, f"{prefix}_{os.path.basename(font.filename)}")
+            await save_upload(font, font_location)
+        try:
+            background = await run_io(prepare_template, template_location)
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=f"Invalid template: {e}")
+
+    target = _certificate_target(folder_type)
+    job = certificate_jobs.start(CertificateJob(folder_type, background, field_specs, recipients, output_format,
+                                                file_name, font_location,
+                                                on_complete=lambda job: _use_certificates(job, target)))
+    return job.info()
+
+@router.get("/certificates/{job_id}")
+def get_certificate_job(job_id: str, manifest: bool = False):
+    """Progress of a certificate job (and the generated files once completed)"""
+    job = _certificate_job(job_id)
+    info = job.info()
+    if manifest and job.status == "completed":
+        info["manifest"] = job.manifest()
+    return info
+
+@router.delete("/certificates/{job_id}")
+def cancel_certificate_job(job_id: str):
+    job = _certificate_job(job_id)
+    job.cancel.set()
+    return job.info()
 
 # --- Sending ---
-def background_send_emails(config: EmailConfig, recipients: List[dict], assets: dict, folder1: List[str], folder2: List[str]):
-    from datetime import datetime
-    import time
-    
-    logger.info(f"Starting background email send for {len(recipients)} recipients")
+def background_send_emails(campaign_id: str, config: EmailConfig, templates: Optional[CampaignTemplates] = None,
+                           cancel: Optional[threading.Event] = None):
+    """Send a stored campaign. cancel stops it (the worker then decides its status)"""
+    campaign = job_store.get_campaign(campaign_id)
+    processed = job_store.processed_count(campaign_id)
+    logger.info(f"Starting background email send for {campaign['total'] - processed} recipients (campaign {campaign_id})")
     logger.info(f"Config: Subject='{config.subject}', Sender='{config.sender_email}'")
+    current_campaign["campaign_id"] = campaign_id
+    job_store.set_status(campaign_id, "running")
     
-    total_recipients = len(recipients)
-    report_data = []  # Store report as list of dicts for JSON response
+    # Live report: /get-report and the SSE stream see rows as they finish
+    buffer = progress_hub.start(campaign_id, campaign["total"], processed)
+    current_campaign["report_data"] = buffer.rows
+    status = "failed"
     
     try:
-        for i, recipient in enumerate(recipients):
-            # Basic logic: assume 'Correo' column exists
-            email_addr = recipient.get("Correo") or recipient.get("Email") or recipient.get("correo")
-            nombre = recipient.get("Nombre") or recipient.get("nombre") or "N/A"
-            
-            if not email_addr:
-                logger.warning(f"Skipping recipient {i}: No email address found in {recipient}")
-                continue
-
-            # Dynamic replacement in body (e.g. {{Nombre}})
-            body_content = config.body_html
-            for key, value in recipient.items():
-                if value:
-                    body_content = body_content.replace(f"{{{{{key}}}}}", str(value))
-            
-            # Create complete HTML email with template
-            html_email = f"""<!DOCTYPE html>
-<html lang="es">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-</head>
-<body style="font-family: Arial, sans-serif; margin: 0; padding: 0; background-color: #f6f7fb;">
-    <div style="max-width: 600px; margin: 30px auto; background-color: #ffffff; border-radius: 12px; overflow: hidden; box-shadow: 0 4px 10px rgba(0,0,0,0.08);">
-        <div style="background-color: rgb(45,54,111); text-align: center; padding: 20px;">
-            <img src="cid:upt_logo" alt="Logo" style="max-height: 70px;">
-        </div>
-        <div style="padding: 30px; line-height: 1.6; font-size: 15px; color: #333;">
-            {body_content}
-        </div>
-        <div style="text-align: center; padding: 0 30px 10px 30px;">
-            <img src="cid:flyer_img" alt="Flyer" style="width: 100%; max-width: 540px; border-radius: 10px;">
-        </div>
-        <div style="padding: 20px 30px; line-height: 1.4; font-size: 13px; color: #666; border-top: 1px solid #eee;">
-            {config.footer_html}
-        </div>
-    </div>
-</body>
-</html>"""
-
-            # Determine attachments
-            attachments = []
-            adj1_name = ""
-            adj2_name = ""
-
-            # Sequential Mapping: Row i gets File i
-            if i < len(folder1):
-                attachments.append(folder1[i])
-                adj1_name = os.path.basename(folder1[i])
-            
-            if i < len(folder2):
-                attachments.append(folder2[i])
-                adj2_name = os.path.basename(folder2[i])
-            
-            # Try sending with retries
-            intentos = 0
-            estado = "Error"
-            duracion = 0
-            max_intentos = 2
-            
-            while intentos < max_intentos:
-                inicio = time.time()
-                intentos += 1
-                
-                logger.info(f"Sending to {email_addr}, attempt {intentos}")
-                
-                try:
-                    success = email_service.send_email(
-                        sender_email=config.sender_email,
-                        password=config.password,
-                        recipient_email=email_addr,
-                        subject=config.subject,
-                        html_body=html_email,
-                        images=assets,
-                        attachments=attachments
-                    )
-                except Exception as e:
-                    logger.error(f"CRITICAL ERROR calling email_service: {e}")
-                    import traceback
-                    logger.error(traceback.format_exc())
-                    success = False
-                
-                duracion = round(time.time() - inicio, 2)
-                
-                if success:
-                    estado = "Enviado"
-                    logger.info(f"Successfully sent to {email_addr}")
-                    break
-                else:
-                    logger.warning(f"Failed to send to {email_addr}, attempt {intentos}")
-                
-                time.sleep(1)  # Wait before retry
-            
-            # Add to report data
-            fecha = datetime.now().strftime("%Y-%m-%d")
-            hora = datetime.now().strftime("%H:%M:%S")
-            report_data.append({
-                "correo": email_addr,
-                "nombre": nombre,
-                "estado": estado,
-                "fecha": fecha,
-                "hora": hora,
-                "intentos": intentos,
-                "duracion": duracion,
-                "adjunto1": adj1_name,
-                "adjunto2": adj2_name
-            })
-        
-        # Store report in memory
-        current_campaign["report_data"] = report_data
-        logger.info(f"Reporte generado con {len(report_data)} registros")
+        # Progress is committed to the job store in batches, so a restart
+        # can resume from the last undelivered row
+        send_engine.run(
+            config,
+            job_store.pending_rows(campaign_id, by_domain=config.group_by_domain),
+            campaign["assets"],
+            campaign["folder1"],
+            campaign["folder2"],
+            templates,
+            on_progress=lambda batch: job_store.record_deliveries(campaign_id, batch),
+            campaign_id=campaign_id,
+            sent_today={email: job_store.sent_today(email) for email in config.sender_emails()},
+            progress=buffer,
+            cancel=cancel
+        )
+        status = "completed"
 
+    except CampaignAborted as e:
+        # e.g. rejected credentials: unsent rows stay pending for /resume
+        logger.error(f"Campaign {campaign_id} aborted: {e}")
+    except CampaignPaused as e:
+        # Unsent rows stay pending, /resume continues later
+        status = "paused"
+        logger.warning(f"Campaign {campaign_id} paused: {e}")
     except Exception as e:
         logger.error(f"GLOBAL ERROR in background_send_emails: {e}")
         import traceback
         logger.error(traceback.format_exc())
+    finally:
+        # A cancelled run may already belong to another worker
+        if status == "completed" or cancel is None or not cancel.is_set():
+            job_store.set_status(campaign_id, status)
+        buffer.finish(status)
+        # Store report in memory, in sheet order (includes rows sent before a resume)
+        report_data = job_store.report(campaign_id)
+        current_campaign["report_data"] = report_data
+        logger.info(f"Reporte generado con {len(report_data)} registros")
+        # Don't keep authenticated sessions open after the campaign
+        email_service.pool.close_all()
 
 @router.post("/send")
-async def send_campaign(config: EmailConfig, background_tasks: BackgroundTasks):
+async def send_campaign(config: EmailConfig, request: Request):
     if not current_campaign["recipients"]:
         raise HTTPException(status_code=400, detail="No recipients loaded")
+    if config.attachment_links and not config.public_url:
+        # Stored with the campaign, so a resume sends the same links
+        config.public_url = os.environ.get("RESU_PUBLIC_URL") or str(request.base_url)
+    
+    # Parse subject/body/footer once and reject placeholders with no matching column
+    templates = CampaignTemplates(config.subject, config.body_html, config.footer_html,
+                                  links=config.attachment_links)
+    unknown = templates.unknown_placeholders(current_campaign["recipients"].columns)
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown placeholders: {', '.join('{{' + name + '}}' for name in unknown)}"
+        )
     
     assets_map = {}
     if "logo" in current_campaign["assets"]:
@@ -269,25 +503,236 @@ async def send_campaign(config: EmailConfig, background_tasks: BackgroundTasks):
     if "flyer" in current_campaign["assets"]:
         assets_map["flyer_img"] = current_campaign["assets"]["flyer"]
 
-    background_tasks.add_task(
-        background_send_emails,
-        config,
-        current_campaign["recipients"],
+    folder1 = current_campaign.get("attachments_folder1", [])
+    folder2 = current_campaign.get("attachments_folder2", [])
+    if config.attachment_links:
+        # Links stay valid for days: they must keep serving these bytes even
+        # if another upload reuses a file name, so serve copies from the store
+        async with _upload_slot():
+            folder1 = await run_io(asset_store.pin_all, folder1)
+            folder2 = await run_io(asset_store.pin_all, folder2)
+
+    # The SMTP passwords are not part of the stored campaign: a queued job
+    # keeps them encrypted until a worker is done with it, otherwise
+    # /resume asks for them again
+    recipients = current_campaign["recipients"]
+    # One transaction with every recipient row: off the event loop
+    campaign_id = await run_in_threadpool(
+        job_store.create_campaign,
+        config.stored(),
+        recipients,
         assets_map,
-        current_campaign.get("attachments_folder1", []),
-        current_campaign.get("attachments_folder2", [])
+        folder1,
+        folder2
     )
+    # Invalid and duplicate rows found at upload are reported, never sent
+    skip = current_campaign.get("skip_rows") or {}
+    if skip:
+        await run_in_threadpool(lambda: job_store.record_deliveries(campaign_id, skipped_report_rows(recipients, skip)))
+
+    if SEND_IN_WORKER:
+        # Picked up by the next free send worker
+        job_store.enqueue_job(campaign_id, config.password, config.sender_passwords())
+        current_campaign["campaign_id"] = campaign_id
+    else:
+        # Campaigns run through the scheduler queue (fair share + rate limits)
+        campaign_scheduler.submit(campaign_id, background_send_emails, campaign_id, config, templates)
     
-    return {"message": "Sending started in background", "recipient_count": len(current_campaign["recipients"])}
+    return {
+        "message": "Dry run started in background" if config.dry_run else "Sending started in background",
+        "recipient_count": len(recipients) - len(skip),
+        "skipped_count": len(skip),
+        "campaign_id": campaign_id
+    }
 
 @router.get("/get-report")
-async def get_report():
-    """Get the report data as JSON for display in the UI"""
+def get_report(page: Optional[int] = Query(None, ge=1),
+               page_size: int = Query(REPORT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+               estado: Optional[str] = None, desde: Optional[str] = None, hasta: Optional[str] = None,
+               dominio: Optional[str] = None, sort: str = "row_index", order: str = "asc"):
+    """Get the report data as JSON for display in the UI.
+
+    The whole report of the current campaign, or one page of it when page
+    is given.
+    """
+    campaign_id = current_campaign.get("campaign_id")
+    filtered = estado or desde or hasta or dominio
+    if campaign_id and page is not None:
+        result = _report_page(campaign_id, page, page_size, estado, desde, hasta, dominio, sort, order)
+        if result["total"] or filtered:
+            return result
+    elif campaign_id:
+        _check_sort(sort)
+        rows = list(job_store.iter_report(campaign_id, sort, order == "desc",
+                                          estado=estado, desde=desde, hasta=hasta, dominio=dominio))
+        if rows or filtered:
+            return {"report": rows, "total": len(rows)}
+
     if "report_data" not in current_campaign or not current_campaign["report_data"]:
         return {"report": [], "message": "No report available yet"}
     
     return {"report": current_campaign["report_data"], "total": len(current_campaign["report_data"])}
 
+# --- Campaigns (persistent job store) ---
+@router.get("/campaigns")
+async def list_campaigns():
+    return {"campaigns": job_store.list_campaigns()}
+
+@router.get("/campaigns/{campaign_id}")
+async def get_campaign_status(campaign_id: str):
+    campaign = job_store.get_campaign(campaign_id)
+    if campaign is None:
+        raise HTTPException(status_code=404, detail="Campaign not found")
+    return {
+        "id": campaign["id"],
+        "status": campaign["status"],
+        "created_at": campaign["created_at"],
+        "sender_email": campaign["sender_email"],
+        "total": campaign["total"],
+        "processed": job_store.processed_count(campaign_id)
+    }
+
+def _check_sort(sort: str):
+    if sort not in SORTABLE_FIELDS:
+        raise HTTPException(status_code=400, detail=f"sort must be one of: {', '.join(SORTABLE_FIELDS)}")
+
+def _report_page(campaign_id: str, page: int, page_size: int, estado: Optional[str], desde: Optional[str],
+                 hasta: Optional[str], dominio: Optional[str], sort: str, order: str) -> dict:
+    _check_sort(sort)
+    rows, total = job_store.report_page(
+        campaign_id, (page - 1) * page_size, page_size, sort, order == "desc",
+        estado=estado, desde=desde, hasta=hasta, dominio=dominio
+    )
+    return {"report": rows, "total": total, "page": page, "page_size": page_size,
+            "pages": (total + page_size - 1) // page_size}
+
+@router.get("/campaigns/{campaign_id}/report")
+async def get_campaign_report(campaign_id: str, page: int = Query(1, ge=1),
+                              page_size: int = Query(REPORT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                              estado: Optional[str] = None, desde: Optional[str] = None, hasta: Optional[str] = None,
+                              dominio: Optional[str] = None, sort: str = "row_index", order: str = "asc"):
+    """Paginated report; filter by estado, date range (YYYY-MM-DD) and recipient domain"""
+    if job_store.get_campaign(campaign_id) is None:
+        raise HTTPException(status_code=404, detail="Campaign not found")
+    return _report_page(campaign_id, page, page_size, estado, desde, hasta, dominio, sort, order)
+
+@router.get("/campaigns/{campaign_id}/report/export")
+def export_campaign_report(campaign_id: str, format: str = "xlsx", estado: Optional[str] = None,
+                           desde: Optional[str] = None, hasta: Optional[str] = None,
+                           dominio: Optional[str] = None, sort: str = "row_index", order: str = "asc"):
+    """Download the (filtered) report as CSV or Excel without loading it all in memory"""
+    if job_store.get_campaign(campaign_id) is None:
+        raise HTTPException(status_code=404, detail="Campaign not found")
+    _check_sort(sort)
+    rows = job_store.iter_report(campaign_id, sort, order == "desc",
+                                 estado=estado, desde=desde, hasta=hasta, dominio=dominio)
+
+    if format == "csv":
+        return StreamingResponse(
+            iter_csv(rows),
+            media_type="text/csv; charset=utf-8",
+            headers={"Content-Disposition": f'attachment; filename="reporte_envios_{campaign_id}.csv"'}
+        )
+    if format == "xlsx":
+        path = write_xlsx(rows)
+        # The file only exists for this response
+        return FileResponse(
+            path,
+            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+            filename=xlsx_filename(campaign_id),
+            background=BackgroundTask(os.remove, path)
+        )
+    raise HTTPException(status_code=400, detail="format must be csv or xlsx")
+
+def _sse(event: str, data: dict, event_id: Optional[int] = None) -> str:
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data, default=str)}")
+    return "\n".join(lines) + "\n\n"
+
+@router.get("/campaigns/{campaign_id}/events")
+async def campaign_events(campaign_id: str, request: Request, offset: int = 0,
+                          last_event_id: Optional[str] = Header(None)):
+    """Server-Sent Events stream of results and counters for a campaign.
+
+    Every result event carries the offset to reconnect from; browsers send
+    it back automatically as Last-Event-ID. Campaigns sent by another
+    process (RESU_SEND_WORKER=1) are followed through the job store.
+    """
+    # One source per stream: offsets of the two kinds don't mix
+    buffer = progress_hub.watch(campaign_id)
+    if buffer is None:
+        raise HTTPException(status_code=404, detail="Campaign not found")
+    if last_event_id and last_event_id.isdigit():
+        offset = int(last_event_id)
+
+    async def stream():
+        position = offset
+        last_counters = 0.0
+        while True:
+            if await request.is_disconnected():
+                return
+            finished = await run_in_threadpool(lambda: buffer.finished)
+            rows = await run_in_threadpool(buffer.read, position)
+            for position, row in rows:
+                yield _sse("result", row, position)
+            now = time.monotonic()
+            if rows or finished or now - last_counters >= PROGRESS_INTERVAL:
+                last_counters = now
+                yield _sse("progress", await run_in_threadpool(buffer.snapshot))
+            if finished and not rows:
+                yield _sse("done", await run_in_threadpool(buffer.snapshot))
+                return
+            await asyncio.sleep(PROGRESS_POLL)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.get("/campaigns/{campaign_id}/progress")
+async def campaign_progress(campaign_id: str):
+    """Current counters without opening a stream"""
+    buffer = progress_hub.watch(campaign_id)
+    if buffer is None:
+        raise HTTPException(status_code=404, detail="Campaign not found")
+    return await run_in_threadpool(buffer.snapshot)
+
+@router.get("/scheduler")
+async def scheduler_status():
+    """Queued/active campaigns and the current per-sender and per-host rates"""
+    return campaign_scheduler.status()
+
+@router.post("/campaigns/{campaign_id}/resume")
+async def resume_campaign(campaign_id: str, request: ResumeRequest):
+    """Continue a crashed, failed or paused campaign from its last undelivered row"""
+    campaign = job_store.get_campaign(campaign_id)
+    if campaign is None:
+        raise HTTPException(status_code=404, detail="Campaign not found")
+    if campaign["status"] == "completed":
+        raise HTTPException(status_code=400, detail="Campaign already completed")
+    if campaign_scheduler.is_scheduled(campaign_id) or not job_store.claim(campaign_id):
+        raise HTTPException(status_code=409, detail="Campaign is still running")
+    
+    missing = [sender["sender_email"] for sender in campaign["config"].get("senders", [])
+               if sender["sender_email"] not in request.sender_passwords]
+    if missing:
+        raise HTTPException(status_code=400, detail=f"Missing sender_passwords for: {', '.join(missing)}")
+    config = EmailConfig.from_stored(campaign["config"], request.password, request.sender_passwords)
+    if SEND_IN_WORKER:
+        job_store.enqueue_job(campaign_id, config.password, config.sender_passwords())
+    else:
+        campaign_scheduler.submit(campaign_id, background_send_emails, campaign_id, config)
+    
+    return {
+        "message": "Resuming campaign in background",
+        "campaign_id": campaign_id,
+        "pending": campaign["total"] - job_store.processed_count(campaign_id)
+    }
+
 @router.post("/clear-campaign")
 async def clear_campaign():
     """Clear all current campaign data"""
@@ -298,9 +743,35 @@ async def clear_campaign():
         "attachments": [],
         "report_data": []
     }
+    part_caches.clear()
     # Optional: Clean up temp files if desired, but for now just clearing memory
     return {"message": "Campaign data cleared successfully"}
 
+# --- Attachment downloads (link delivery) ---
+@router.api_route("/files/{token}", methods=["GET", "HEAD"])
+def download_attachment(token: str, request: Request):
+    """A campaign attachment behind a signed, expiring link.
+
+    Range requests (resumed downloads, PDF viewers) are answered with 206
+    by FileResponse, which hands the file to the server for zero-copy
+    sending when it supports the ASGI pathsend extension. Each download
+    is counted in the campaign report.
+    """
+    try:
+        campaign_id, row, slot = link_signer.verify(token)
+    except LinkExpired as e:
+        raise HTTPException(status_code=410, detail=str(e))
+    except InvalidLink as e:
+        raise HTTPException(status_code=403, detail=str(e))
+    path = resolve_file(campaign_id, row, slot)
+    if path is None:
+        raise HTTPException(status_code=404, detail="File not found")
+    # Count downloads, not the follow-up range requests of the same download
+    range_header = request.headers.get("range", "").replace(" ", "")
+    if request.method == "GET" and (not range_header or range_header.startswith("bytes=0-")):
+        job_store.record_download(campaign_id, row, slot)
+    return FileResponse(path, filename=os.path.basename(path), headers={"Cache-Control": "private, max-age=3600"})
+
 @router.get("/download-template")
 async def download_template():
     """Download Excel template for recipients"""
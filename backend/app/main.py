@@ -1,12 +1,14 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, PlainTextResponse
 from app.api import endpoints
+from app.services.metrics import metrics, http_requests_total, http_request_seconds
+from app.services.static_frontend import StaticFrontend
 import os
 from pathlib import Path
 import mimetypes
 import logging
+import time
 
 # Fix MIME types on Windows
 mimetypes.add_type("text/css", ".css")
@@ -18,11 +20,23 @@ logger = logging.getLogger("uvicorn")
 
 app = FastAPI(title="Bulk Email Sender API")
 
+# Requests slower than this are logged at INFO even when they succeed
+SLOW_REQUEST_SECONDS = 1.0
+
 @app.middleware("http")
 async def log_requests(request, call_next):
-    logger.info(f"Request: {request.method} {request.url.path}")
+    start = time.perf_counter()
     response = await call_next(request)
-    logger.info(f"Response: {response.status_code}")
+    elapsed = time.perf_counter() - start
+    # Route template, not the raw path, so ids don't explode the label set
+    route = getattr(request.scope.get("route"), "path", "unmatched")
+    http_requests_total.inc(request.method, route, response.status_code)
+    http_request_seconds.observe(elapsed, request.method, route)
+    # One line per request, and only errors/slow requests at INFO
+    if response.status_code >= 400 or elapsed >= SLOW_REQUEST_SECONDS:
+        logger.info(f"{request.method} {request.url.path} -> {response.status_code} ({elapsed * 1000:.0f} ms)")
+    else:
+        logger.debug("%s %s -> %s (%.0f ms)", request.method, request.url.path, response.status_code, elapsed * 1000)
     return response
 
 # CORS Configuration
@@ -44,33 +58,35 @@ app.add_middleware(
 os.makedirs("temp/uploads", exist_ok=True)
 os.makedirs("temp/assets", exist_ok=True)
 
-# Mount temp directory for serving uploaded assets
-app.mount("/temp", StaticFiles(directory="temp"), name="temp")
+# Logo/flyer previews for the UI. Only the current campaign's images:
+# temp/ also holds attachments and the upload store, which only leave
+# through the API (signed download links).
+@app.get("/temp/{path:path}")
+def uploaded_image(path: str):
+    location = f"temp/{path}"
+    if location not in endpoints.current_campaign["assets"].values():
+        raise HTTPException(status_code=404, detail="Not Found")
+    return FileResponse(location)
 
 app.include_router(endpoints.router, prefix="/api")
 
+@app.get("/metrics", response_class=PlainTextResponse)
+def prometheus_metrics():
+    """Counters and histograms in the Prometheus text format"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 # Serve React Frontend
 # Resolve absolute path: backend/app/main.py -> backend/app -> backend -> root
 BASE_DIR = Path(__file__).resolve().parent.parent.parent
 frontend_dist = BASE_DIR / "frontend" / "dist"
-assets_dir = frontend_dist / "assets"
 
 logger.info(f"Frontend Dist: {frontend_dist}")
-logger.info(f"Assets Dir: {assets_dir}")
-logger.info(f"Assets exist: {assets_dir.exists()}")
 
 if frontend_dist.exists():
-    # Mount assets specifically
-    if assets_dir.exists():
-        app.mount("/assets", StaticFiles(directory=str(assets_dir)), name="assets")
-    
-    @app.get("/{full_path:path}")
-    async def serve_react_app(full_path: str):
-        file_path = frontend_dist / full_path
-        if file_path.exists() and file_path.is_file():
-            return FileResponse(file_path)
-            
-        return FileResponse(frontend_dist / "index.html")
+    # Indexed once here; /assets and client-side routes are answered from
+    # memory (compressed variants, ETag/304, immutable hashed bundles).
+    # Mounted last, so /api, /temp and /metrics keep precedence.
+    app.mount("/", StaticFrontend(frontend_dist), name="frontend")
 else:
     @app.get("/")
     def read_root():
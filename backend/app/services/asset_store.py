@@ -0,0 +1,406 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+import logging
+from typing import BinaryIO, List, Optional, Tuple
+
+from app.services.job_store import DATA_DIR
+
+logger = logging.getLogger(__name__)
+
+STORE_DIR = "temp/store"
+PARTIAL_DIR = "temp/store/partial"
+# Bytes read per step when a file is copied into the store
+COPY_CHUNK = 1024 * 1024
+# Unfinished upload sessions are dropped (with their partial files) after this
+SESSION_TTL = 24 * 3600
+# Upload session state (declared files and offsets), kept across restarts
+SESSIONS_DIR = os.path.join(DATA_DIR, "uploads")
+
+
+def attachment_order(filename: str) -> int:
+    """Sort key for attachment folders: the first number in the name.
+
+    Works with: "1_archivo.pdf", "2.docx", "10_documento.xlsx", etc.
+    Files without a number go last.
+    """
+    match = re.search(r'(\d+)', filename)
+    return int(match.group(1)) if match else 999999
+
+
+def safe_filename(filename: str) -> str:
+    # Browsers may send the relative path of a folder upload
+    name = os.path.basename(filename.replace("\\", "/")).strip()
+    return name or "archivo"
+
+
+class AssetStore:
+    """Content-addressed file store: temp/store/<sha256[:2]>/<sha256>/<name>.
+
+    The original filename is kept as the last path component because it is
+    the attachment name recipients see. Identical content is stored once;
+    another name for the same bytes is a hard link.
+    """
+
+    def __init__(self, root: str = STORE_DIR):
+        self.root = root
+
+    def _dir(self, sha256: str) -> str:
+        return os.path.join(self.root, sha256[:2], sha256)
+
+    def path_for(self, sha256: str, filename: str) -> str:
+        return os.path.join(self._dir(sha256), safe_filename(filename))
+
+    def lookup(self, sha256: str, filename: str) -> Optional[str]:
+        """Path of already stored content under this name, or None"""
+        directory = self._dir(sha256)
+        if not os.path.isdir(directory):
+            return None
+        path = self.path_for(sha256, filename)
+        if os.path.exists(path):
+            return path
+        existing = [n for n in os.listdir(directory) if not n.startswith(".")]
+        if not existing:
+            return None
+        source = os.path.join(directory, existing[0])
+        try:
+            os.link(source, path)
+        except OSError:
+            shutil.copyfile(source, path)
+        return path
+
+    def commit(self, tmp_path: str, sha256: str, filename: str) -> Tuple[str, bool]:
+        """Move a fully written temp file into the store.
+
+        Returns (path, deduped); deduped means the content was already there
+        and the temp file was discarded.
+        """
+        path = self.lookup(sha256, filename)
+        if path is not None:
+            os.remove(tmp_path)
+            return path, True
+        path = self.path_for(sha256, filename)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(tmp_path, path)
+        return path, False
+
+    def contains(self, path: str) -> bool:
+        """True for a finished file of the store (not a partial upload)"""
+        root = os.path.realpath(self.root)
+        real = os.path.realpath(path)
+        if os.path.commonpath([root, real]) != root:
+            return False
+        partial = os.path.realpath(PARTIAL_DIR)
+        return os.path.commonpath([partial, real]) != partial
+
+    def pin(self, path: str) -> str:
+        """Path of a file's current content in the store, copied in if needed.
+
+        Files under temp/assets are overwritten by the next upload with the
+        same name; the stored copy never changes. Missing files (and "" for
+        rows without one) are returned as they are.
+        """
+        if not path or self.contains(path):
+            return path
+        try:
+            with open(path, "rb") as f:
+                return self.put(f, os.path.basename(path))["path"]
+        except FileNotFoundError:
+            return path
+
+    def pin_all(self, paths: List[str]) -> List[str]:
+        return [self.pin(path) for path in paths]
+
+    def put(self, fileobj: BinaryIO, filename: str) -> dict:
+        """Copy a file object into the store, hashing while it is written"""
+        os.makedirs(PARTIAL_DIR, exist_ok=True)
+        tmp_path = os.path.join(PARTIAL_DIR, uuid.uuid4().hex)
+        hasher = hashlib.sha256()
+        size = 0
+        with open(tmp_path, "wb") as out:
+            while True:
+                chunk = fileobj.read(COPY_CHUNK)
+                if not chunk:
+                    break
+                hasher.update(chunk)
+                out.write(chunk)
+                size += len(chunk)
+        sha256 = hasher.hexdigest()
+        path, deduped = self.commit(tmp_path, sha256, filename)
+        return {"name": safe_filename(filename), "path": path, "sha256": sha256, "size": size, "deduped": deduped}
+
+
+class UploadEntry:
+    """One file of an upload session, written chunk by chunk"""
+
+    def __init__(self, index: int, name: str, size: int, sha256: Optional[str], partial_path: str):
+        self.index = index
+        self.name = safe_filename(name)
+        self.size = size
+        self.expected_sha256 = sha256.lower() if sha256 else None
+        self.partial_path = partial_path
+        self.offset = 0
+        self.hasher = hashlib.sha256()
+        self.path = None
+        self.sha256 = None
+        self.deduped = False
+        self.lock = threading.Lock()
+
+    @property
+    def done(self) -> bool:
+        return self.path is not None
+
+    def state(self) -> dict:
+        return {
+            "index": self.index,
+            "name": self.name,
+            "size": self.size,
+            "expected_sha256": self.expected_sha256,
+            "offset": self.offset,
+            "path": self.path,
+            "sha256": self.sha256,
+            "deduped": self.deduped,
+        }
+
+    def resume(self, offset: int):
+        """Pick up the partial file after a restart.
+
+        The hash is recomputed from the bytes on disk; bytes written after
+        the last saved offset are dropped (their chunk was never confirmed
+        to the client, which sends it again).
+        """
+        self.offset = 0
+        self.hasher = hashlib.sha256()
+        try:
+            with open(self.partial_path, "r+b") as f:
+                f.truncate(min(offset, os.fstat(f.fileno()).st_size))
+                while True:
+                    chunk = f.read(COPY_CHUNK)
+                    if not chunk:
+                        break
+                    self.hasher.update(chunk)
+                    self.offset += len(chunk)
+        except FileNotFoundError:
+            pass
+
+    def info(self) -> dict:
+        return {
+            "index": self.index,
+            "name": self.name,
+            "size": self.size,
+            "offset": self.size if self.done else self.offset,
+            "done": self.done,
+            "deduped": self.deduped,
+            "sha256": self.sha256,
+        }
+
+
+class UploadSession:
+    """A resumable upload of an attachment folder.
+
+    The client declares the files first (optionally with their sha256, so
+    content already in the store is never sent again), then sends each
+    file in chunks at the offset the server reports. The state is saved
+    in state_dir after every chunk so an upload survives a restart.
+    """
+
+    def __init__(self, folder_type: str, files: List[dict], store: AssetStore,
+                 state_dir: str = SESSIONS_DIR, session_id: Optional[str] = None):
+        self.id = session_id or uuid.uuid4().hex
+        self.folder_type = folder_type
+        self.store = store
+        self.state_path = os.path.join(state_dir, f"{self.id}.json")
+        self.created_at = time.time()
+        self.files = []
+        self._state_lock = threading.Lock()
+        os.makedirs(PARTIAL_DIR, exist_ok=True)
+        if session_id is not None:
+            return  # Restored: see load()
+        for index, spec in enumerate(files):
+            entry = UploadEntry(index, spec["name"], spec["size"], spec.get("sha256"),
+                               os.path.join(PARTIAL_DIR, f"{self.id}_{index}"))
+            if entry.expected_sha256:
+                path = store.lookup(entry.expected_sha256, entry.name)
+                if path is not None:
+                    entry.path, entry.sha256, entry.deduped = path, entry.expected_sha256, True
+            if not entry.done and entry.size == 0:
+                self._finish(entry)
+            self.files.append(entry)
+        self._save()
+
+    @classmethod
+    def load(cls, state_path: str, store: AssetStore) -> "UploadSession":
+        """Restore a session saved by _save (after a restart)"""
+        with open(state_path, encoding="utf-8") as f:
+            state = json.load(f)
+        session = cls(state["folder_type"], [], store, os.path.dirname(state_path), state["id"])
+        session.created_at = state["created_at"]
+        for spec in state["files"]:
+            entry = UploadEntry(spec["index"], spec["name"], spec["size"], spec["expected_sha256"],
+                                os.path.join(PARTIAL_DIR, f"{session.id}_{spec['index']}"))
+            if spec["path"] and os.path.exists(spec["path"]):
+                entry.offset = entry.size
+                entry.path, entry.sha256, entry.deduped = spec["path"], spec["sha256"], spec["deduped"]
+            else:
+                entry.resume(spec["offset"])
+                if entry.offset == entry.size:
+                    # Stopped between the last chunk and the commit
+                    try:
+                        session._finish(entry)
+                    except ValueError as e:
+                        logger.warning(f"Upload session {session.id}: {e}")
+            session.files.append(entry)
+        return session
+
+    def _save(self):
+        state = {
+            "id": self.id,
+            "folder_type": self.folder_type,
+            "created_at": self.created_at,
+            "files": [entry.state() for entry in self.files],
+        }
+        with self._state_lock:
+            os.makedirs(os.path.dirname(self.state_path), exist_ok=True)
+            tmp_path = f"{self.state_path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(state, f)
+            os.replace(tmp_path, self.state_path)
+
+    def write(self, index: int, offset: int, chunk: bytes) -> UploadEntry:
+        """Append a chunk at offset (must be the current end of the file).
+
+        Raises ValueError on a wrong offset or size so the client can resume
+        from info()["offset"].
+        """
+        entry = self.files[index]
+        with entry.lock:
+            if entry.done:
+                return entry
+            if offset != entry.offset:
+                raise ValueError(f"Expected offset {entry.offset}, got {offset}")
+            if entry.offset + len(chunk) > entry.size:
+                raise ValueError(f"Chunk goes past the declared size of {entry.name}")
+            with open(entry.partial_path, "ab") as out:
+                out.write(chunk)
+            entry.hasher.update(chunk)
+            entry.offset += len(chunk)
+            try:
+                if entry.offset == entry.size:
+                    self._finish(entry)
+            finally:
+                self._save()
+        return entry
+
+    def _finish(self, entry: UploadEntry):
+        if entry.size == 0:
+            # Nothing was written, but the store still needs a file
+            open(entry.partial_path, "ab").close()
+        sha256 = entry.hasher.hexdigest()
+        if entry.expected_sha256 and sha256 != entry.expected_sha256:
+            # Corrupted upload: start this file over
+            os.remove(entry.partial_path)
+            entry.offset = 0
+            entry.hasher = hashlib.sha256()
+            raise ValueError(f"Checksum mismatch for {entry.name}")
+        entry.path, entry.deduped = self.store.commit(entry.partial_path, sha256, entry.name)
+        entry.sha256 = sha256
+
+    @property
+    def complete(self) -> bool:
+        return all(entry.done for entry in self.files)
+
+    def manifest(self) -> List[dict]:
+        """Stored files in send order (row i gets file i)"""
+        ordered = sorted(self.files, key=lambda entry: attachment_order(entry.name))
+        return [
+            {"row": row, "name": entry.name, "path": entry.path, "sha256": entry.sha256, "size": entry.size}
+            for row, entry in enumerate(ordered)
+        ]
+
+    def discard(self):
+        for entry in self.files:
+            if not entry.done and os.path.exists(entry.partial_path):
+                os.remove(entry.partial_path)
+        with self._state_lock:
+            if os.path.exists(self.state_path):
+                os.remove(self.state_path)
+
+    def info(self) -> dict:
+        return {
+            "session_id": self.id,
+            "folder_type": self.folder_type,
+            "complete": self.complete,
+            "files": [entry.info() for entry in self.files],
+        }
+
+
+class UploadSessions:
+    """Open upload sessions by id.
+
+    Sessions saved by an earlier process are loaded from state_dir the
+    first time they are asked for.
+    """
+
+    def __init__(self, store: AssetStore, ttl: float = SESSION_TTL, state_dir: str = SESSIONS_DIR):
+        self.store = store
+        self.ttl = ttl
+        self.state_dir = state_dir
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def create(self, folder_type: str, files: List[dict]) -> UploadSession:
+        session = UploadSession(folder_type, files, self.store, self.state_dir)
+        with self._lock:
+            self._expire()
+            self._sessions[session.id] = session
+        return session
+
+    def get(self, session_id: str) -> Optional[UploadSession]:
+        if not re.fullmatch(r"[0-9a-f]{32}", session_id):
+            return None
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = self._load(session_id)
+            return session
+
+    def _load(self, session_id: str) -> Optional[UploadSession]:
+        try:
+            session = UploadSession.load(os.path.join(self.state_dir, f"{session_id}.json"), self.store)
+        except FileNotFoundError:
+            return None
+        if session.created_at < time.time() - self.ttl:
+            session.discard()
+            return None
+        self._sessions[session_id] = session
+        return session
+
+    def close(self, session_id: str):
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+        if session is not None:
+            session.discard()
+
+    def _expire(self):
+        cutoff = time.time() - self.ttl
+        for session_id in [s for s, session in self._sessions.items() if session.created_at < cutoff]:
+            logger.info(f"Dropping expired upload session {session_id}")
+            self._sessions.pop(session_id).discard()
+        # Sessions of earlier processes that were never resumed
+        try:
+            names = os.listdir(self.state_dir)
+        except FileNotFoundError:
+            return
+        for name in names:
+            session_id, ext = os.path.splitext(name)
+            if ext == ".json" and session_id not in self._sessions:
+                self._load(session_id)
+
+
+asset_store = AssetStore()
+upload_sessions = UploadSessions(asset_store)
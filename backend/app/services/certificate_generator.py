@@ -0,0 +1,332 @@
+import hashlib
+import io
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+import logging
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Tuple
+
+from app.services.asset_store import PARTIAL_DIR, AssetStore, asset_store, safe_filename
+from app.services.template_engine import CompiledTemplate
+
+logger = logging.getLogger(__name__)
+
+TEMPLATE_DIR = "temp/certificates"
+# Certificates are independent: use every core
+CERTIFICATE_PROCESSES = max(1, os.cpu_count() or 1)
+# Rows per task sent to a render process, and tasks in flight per process
+CHUNK_ROWS = 50
+CHUNKS_PER_PROCESS = 2
+# Resolution of PDF templates once rasterized, and the default for images without DPI info
+RENDER_DPI = 150
+OUTPUT_FORMATS = ("pdf", "png", "jpg")
+JPEG_QUALITY = 90
+# Text never shrinks below this (in pixels) to fit its box
+MIN_FONT_PX = 8
+# Fonts looked up by name; "custom" is the font uploaded with the template
+FONT_FILES = {
+    "regular": ["DejaVuSans.ttf", "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+                "/usr/share/fonts/TTF/DejaVuSans.ttf", "arial.ttf"],
+    "bold": ["DejaVuSans-Bold.ttf", "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf",
+             "/usr/share/fonts/TTF/DejaVuSans-Bold.ttf", "arialbd.ttf"],
+    "serif": ["DejaVuSerif.ttf", "/usr/share/fonts/truetype/dejavu/DejaVuSerif.ttf",
+              "/usr/share/fonts/TTF/DejaVuSerif.ttf", "times.ttf"],
+}
+ANCHORS = {"left": "lm", "center": "mm", "right": "rm"}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+# Per render process: decoded template backgrounds by (path, mtime)
+_backgrounds: Dict[Tuple[str, float], object] = {}
+
+
+def prepare_template(path: str) -> str:
+    """Return an image to draw on: the file itself, or page 1 of a PDF as PNG.
+
+    PDF templates need PyMuPDF (optional dependency); images only need Pillow.
+    """
+    try:
+        from PIL import Image
+    except ImportError:
+        raise RuntimeError("Pillow is required to generate certificates")
+
+    if not path.lower().endswith(".pdf"):
+        with Image.open(path) as img:
+            img.verify()
+        return path
+    try:
+        import fitz
+    except ImportError:
+        raise RuntimeError("PDF templates need PyMuPDF (pip install pymupdf); upload the template as PNG/JPG")
+    with fitz.open(path) as doc:
+        if doc.page_count == 0:
+            raise ValueError("The PDF template has no pages")
+        pixmap = doc[0].get_pixmap(dpi=RENDER_DPI, alpha=False)
+        raster = f"{os.path.splitext(path)[0]}.png"
+        pixmap.save(raster)
+    # Page size is kept through the DPI when the certificate is saved as PDF
+    with Image.open(raster) as img:
+        img.save(raster, dpi=(RENDER_DPI, RENDER_DPI))
+    return raster
+
+
+@lru_cache(maxsize=64)
+def _font(name: str, size: int, custom_path: Optional[str]):
+    from PIL import ImageFont
+    candidates = [custom_path] if name == "custom" and custom_path else FONT_FILES.get(name, FONT_FILES["regular"])
+    for candidate in candidates:
+        try:
+            return ImageFont.truetype(candidate, size)
+        except OSError:
+            continue
+    logger.warning(f"Font {name} not found, using Pillow's default font")
+    return ImageFont.load_default(size)
+
+
+@lru_cache(maxsize=256)
+def _compiled(text: str) -> CompiledTemplate:
+    return CompiledTemplate(text)
+
+
+def _background(path: str):
+    key = (path, os.path.getmtime(path))
+    image = _backgrounds.get(key)
+    if image is None:
+        from PIL import Image
+        with Image.open(path) as img:
+            image = img.convert("RGB")
+            image.info["dpi"] = img.info.get("dpi", (RENDER_DPI, RENDER_DPI))
+        # One campaign's template at a time is the usual case
+        _backgrounds.clear()
+        _backgrounds[key] = image
+    return image
+
+
+def _fit_font(draw, text: str, field: dict, height: int, max_width: Optional[float], custom_font: Optional[str]):
+    """Font at the field's size, smaller if that's what it takes for text to fit in max_width"""
+    name = field.get("font", "regular")
+    size = max(MIN_FONT_PX, round(field.get("size", 0.04) * height))
+    font = _font(name, size, custom_font)
+    if not max_width:
+        return font
+    text_width = draw.textlength(text, font=font)
+    if text_width > max_width:
+        # Text width is nearly proportional to the size: one guess, then fine-tune
+        size = max(MIN_FONT_PX, int(size * max_width / text_width))
+        font = _font(name, size, custom_font)
+        while size > MIN_FONT_PX and draw.textlength(text, font=font) > max_width:
+            size -= 1
+            font = _font(name, size, custom_font)
+    return font
+
+
+def render_certificate(template_path: str, fields: List[dict], values: dict, output_format: str = "pdf",
+                       custom_font: Optional[str] = None) -> bytes:
+    """Draw a row's values on the template and return the encoded file.
+
+    Field positions (x, y, width) and the font size are fractions of the
+    template's width/height, so the same layout works at any resolution.
+    y is the middle of the text line; long text shrinks to fit width.
+    """
+    from PIL import ImageDraw
+
+    background = _background(template_path)
+    image = background.copy()
+    draw = ImageDraw.Draw(image)
+    width, height = image.size
+    for field in fields:
+        text = _compiled(field.get("text", "")).render(values).strip()
+        if not text:
+            continue
+        align = field.get("align", "center")
+        max_width = field["width"] * width if field.get("width") else None
+        font = _fit_font(draw, text, field, height, max_width, custom_font)
+        draw.text((field["x"] * width, field["y"] * height), text, font=font,
+                  fill=field.get("color", "#000000"), anchor=ANCHORS.get(align, "mm"))
+
+    out = io.BytesIO()
+    dpi = background.info["dpi"]
+    if output_format == "pdf":
+        image.save(out, "PDF", resolution=float(dpi[0]), quality=JPEG_QUALITY)
+    elif output_format == "jpg":
+        image.save(out, "JPEG", quality=JPEG_QUALITY, optimize=True, dpi=dpi)
+    else:
+        image.save(out, "PNG", dpi=dpi)
+    return out.getvalue()
+
+
+def render_chunk(spec: dict, rows: List[Tuple[int, dict]]) -> List[Tuple[int, str, Optional[str]]]:
+    """Render and store the certificates of some rows, in a render process.
+
+    Returns (row, stored path or "", error) per row. Files go straight into
+    the attachment store, so only paths travel back to the web process.
+    """
+    store = AssetStore(spec["store_root"])
+    name_template = _compiled(spec["file_name"])
+    extension = spec["output_format"]
+    os.makedirs(PARTIAL_DIR, exist_ok=True)
+    results = []
+    for i, recipient in rows:
+        # {{n}}: position of the row (1, 2, ...), unless the sheet has an "n" column
+        values = {"n": i + 1, **recipient}
+        try:
+            data = render_certificate(spec["template"], spec["fields"], values, extension, spec.get("font"))
+            sha256 = hashlib.sha256(data).hexdigest()
+            filename = f"{safe_filename(name_template.render(values))}.{extension}"
+            tmp_path = os.path.join(PARTIAL_DIR, f"{uuid.uuid4().hex}.{os.getpid()}")
+            with open(tmp_path, "wb") as out:
+                out.write(data)
+            path, _ = store.commit(tmp_path, sha256, filename)
+            results.append((i, path, None))
+        except Exception as e:
+            results.append((i, "", str(e)))
+    return results
+
+
+def certificate_executor(reset: bool = False) -> ProcessPoolExecutor:
+    """The shared render pool (spawned, so it is safe next to the send threads)"""
+    global _executor
+    with _executor_lock:
+        if reset and _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=CERTIFICATE_PROCESSES,
+                                            mp_context=multiprocessing.get_context("spawn"))
+        return _executor
+
+
+class CertificateJob:
+    """Generates one certificate per recipient row in the render processes.
+
+    paths[i] is row i's certificate ("" when it failed), which is what an
+    attachment folder expects: row i gets file i.
+    """
+
+    def __init__(self, folder_type: str, template: str, fields: List[dict], recipients, output_format: str,
+                 file_name: str, font: Optional[str] = None, on_complete: Optional[Callable] = None):
+        self.id = uuid.uuid4().hex
+        self.folder_type = folder_type
+        self.recipients = recipients
+        self.total = len(recipients)
+        self.spec = {
+            "template": template,
+            "fields": fields,
+            "output_format": output_format,
+            "file_name": file_name,
+            "font": font,
+            "store_root": asset_store.root,
+        }
+        self.on_complete = on_complete
+        self.paths: List[str] = [""] * self.total
+        self.errors: Dict[int, str] = {}
+        self.done = 0
+        self.status = "running"
+        self.started_at = time.time()
+        self.finished_at = None
+        self.cancel = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"certificates-{self.id[:6]}", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def _chunks(self):
+        for start in range(0, self.total, CHUNK_ROWS):
+            yield [(i, self.recipients[i]) for i in range(start, min(start + CHUNK_ROWS, self.total))]
+
+    def _submit(self, rows):
+        try:
+            return certificate_executor().submit(render_chunk, self.spec, rows)
+        except BrokenProcessPool:
+            logger.warning("Certificate process pool broke, restarting it")
+            return certificate_executor(reset=True).submit(render_chunk, self.spec, rows)
+
+    def _run(self):
+        logger.info(f"Certificate job {self.id}: {self.total} rows with {CERTIFICATE_PROCESSES} processes")
+        try:
+            chunks = self._chunks()
+            pending = {}
+            max_pending = CERTIFICATE_PROCESSES * CHUNKS_PER_PROCESS
+            while True:
+                while len(pending) < max_pending and not self.cancel.is_set():
+                    rows = next(chunks, None)
+                    if rows is None:
+                        break
+                    pending[self._submit(rows)] = rows
+                if not pending:
+                    break
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    rows = pending.pop(future)
+                    try:
+                        results = future.result()
+                    except Exception as e:
+                        # The process died (or the pool broke) on this chunk
+                        results = [(i, "", str(e) or type(e).__name__) for i, _ in rows]
+                    for i, path, error in results:
+                        self.paths[i] = path
+                        if error:
+                            self.errors[i] = error
+                    self.done += len(results)
+            if self.cancel.is_set():
+                self.status = "cancelled"
+            else:
+                self.status = "completed"
+                # on_complete returns whether the files were used
+                if self.on_complete is not None and not self.on_complete(self):
+                    self.status = "discarded"
+        except Exception as e:
+            logger.error(f"Certificate job {self.id} failed: {e}")
+            self.status = "failed"
+            self.errors[-1] = str(e)
+        finally:
+            self.finished_at = time.time()
+            logger.info(f"Certificate job {self.id} {self.status}: {self.done - len(self.errors)} generated, "
+                        f"{len(self.errors)} errors in {self.finished_at - self.started_at:.1f}s")
+
+    def info(self, max_errors: int = 50) -> dict:
+        elapsed = (self.finished_at or time.time()) - self.started_at
+        return {
+            "job_id": self.id,
+            "folder_type": self.folder_type,
+            "status": self.status,
+            "total": self.total,
+            "done": self.done,
+            "errors": len(self.errors),
+            "error_rows": [{"row": i, "detalle": error} for i, error in sorted(self.errors.items())[:max_errors]],
+            "rate": round(self.done / elapsed, 1) if elapsed > 0 else 0.0,
+        }
+
+    def manifest(self) -> List[dict]:
+        return [{"row": i, "name": os.path.basename(path), "path": path} for i, path in enumerate(self.paths)]
+
+
+class CertificateJobs:
+    """Certificate jobs by id (the finished ones are kept for their result)"""
+
+    def __init__(self, keep: int = 20):
+        self.keep = keep
+        self._jobs: Dict[str, CertificateJob] = {}
+        self._lock = threading.Lock()
+
+    def start(self, job: CertificateJob) -> CertificateJob:
+        with self._lock:
+            finished = [j for j in self._jobs.values() if j.finished_at is not None]
+            for old in sorted(finished, key=lambda j: j.finished_at)[:max(0, len(self._jobs) - self.keep + 1)]:
+                self._jobs.pop(old.id)
+            self._jobs[job.id] = job
+        job.start()
+        return job
+
+    def get(self, job_id: str) -> Optional[CertificateJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+
+certificate_jobs = CertificateJobs()
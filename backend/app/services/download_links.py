@@ -0,0 +1,172 @@
+import base64
+import hashlib
+import hmac
+import html
+import os
+import secrets
+import threading
+import time
+import logging
+from datetime import datetime
+from functools import lru_cache
+from typing import List, Optional, Tuple
+
+from app.services.asset_store import asset_store
+from app.services.job_store import job_store, DATA_DIR
+from app.templates.email_template import ATTACHMENT_LINKS_BLOCK, ATTACHMENT_LINK_ITEM
+
+logger = logging.getLogger(__name__)
+
+# Shared by the web process and the send workers, next to the credentials key
+SECRET_PATH = os.path.join(DATA_DIR, "link_secret.key")
+# Where earlier versions kept it (moved on first use, so old links stay valid)
+LEGACY_SECRET_PATH = ".link_secret"
+# Default lifetime of a download link
+LINK_EXPIRY_HOURS = 7 * 24
+# Bytes of HMAC-SHA256 kept in the token (128 bits)
+SIGNATURE_BYTES = 16
+DOWNLOAD_PATH = "/api/files"
+
+
+class LinkExpired(Exception):
+    """The link was valid but its expiry date has passed"""
+
+
+class InvalidLink(Exception):
+    """Malformed token or bad signature"""
+
+
+def _b64(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def _load_secret() -> bytes:
+    env = os.environ.get("RESU_LINK_SECRET")
+    if env:
+        return env.encode()
+    try:
+        with open(SECRET_PATH, "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        pass
+    os.makedirs(os.path.dirname(SECRET_PATH) or ".", mode=0o700, exist_ok=True)
+    if os.path.exists(LEGACY_SECRET_PATH):
+        try:
+            os.replace(LEGACY_SECRET_PATH, SECRET_PATH)
+            os.chmod(SECRET_PATH, 0o600)
+            logger.info(f"Moved the download link key to {SECRET_PATH}")
+        except FileNotFoundError:
+            # Another process moved it first
+            pass
+        with open(SECRET_PATH, "rb") as f:
+            return f.read()
+    secret = secrets.token_bytes(32)
+    # O_EXCL: if another process won the race, use its key
+    try:
+        fd = os.open(SECRET_PATH, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        with open(SECRET_PATH, "rb") as f:
+            return f.read()
+    with os.fdopen(fd, "wb") as f:
+        f.write(secret)
+    logger.info(f"Created a new download link key in {SECRET_PATH}")
+    return secret
+
+
+def format_size(size: int) -> str:
+    if size >= 1024 * 1024:
+        return f"{size / (1024 * 1024):.1f} MB"
+    return f"{max(1, round(size / 1024))} KB"
+
+
+class LinkSigner:
+    """Signed, expiring download links for campaign attachments.
+
+    A token is "<campaign>.<row>.<slot>.<expires>.<signature>": it names a
+    file of the campaign (row i, folder1 or folder2) rather than a path, so
+    it can't be used for anything else, and the HMAC makes it unforgeable.
+    Set RESU_LINK_SECRET to share the key between servers; otherwise one
+    is generated in SECRET_PATH on first use.
+    """
+
+    def __init__(self, secret: Optional[bytes] = None):
+        self._secret = secret
+        self._lock = threading.Lock()
+
+    @property
+    def secret(self) -> bytes:
+        with self._lock:
+            if self._secret is None:
+                self._secret = _load_secret()
+            return self._secret
+
+    def _signature(self, payload: str) -> str:
+        return _b64(hmac.new(self.secret, payload.encode(), hashlib.sha256).digest()[:SIGNATURE_BYTES])
+
+    def sign(self, campaign_id: str, row: int, slot: int, expires: int) -> str:
+        payload = f"{campaign_id}.{row}.{slot}.{expires}"
+        return f"{payload}.{self._signature(payload)}"
+
+    def verify(self, token: str) -> Tuple[str, int, int]:
+        """Return (campaign_id, row, slot) of a token; raises InvalidLink/LinkExpired"""
+        payload, _, signature = token.rpartition(".")
+        parts = payload.split(".")
+        if len(parts) != 4 or not hmac.compare_digest(signature, self._signature(payload)):
+            raise InvalidLink("Invalid download link")
+        campaign_id, row, slot, expires = parts
+        try:
+            row, slot, expires = int(row), int(slot), int(expires)
+        except ValueError:
+            raise InvalidLink("Invalid download link")
+        if expires < time.time():
+            raise LinkExpired("This download link has expired")
+        return campaign_id, row, slot
+
+    def links_html(self, base_url: str, campaign_id: str, row: int, files: List[Tuple[int, str]],
+                   expires: int) -> str:
+        """Download block for a row's body: one link per (slot, path)"""
+        items = []
+        for slot, path in files:
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                logger.warning(f"Attachment not found, no link for it: {path}")
+                continue
+            url = f"{base_url.rstrip('/')}{DOWNLOAD_PATH}/{self.sign(campaign_id, row, slot, expires)}"
+            items.append(ATTACHMENT_LINK_ITEM.format(url=html.escape(url), name=html.escape(os.path.basename(path)),
+                                                     size=format_size(size)))
+        if not items:
+            return ""
+        return ATTACHMENT_LINKS_BLOCK.format(items="\n    ".join(items),
+                                             expires=datetime.fromtimestamp(expires).strftime("%d/%m/%Y"))
+
+
+@lru_cache(maxsize=32)
+def campaign_files(campaign_id: str) -> Optional[Tuple[List[str], List[str]]]:
+    """(folder1, folder2) of a campaign; they never change once it is created"""
+    campaign = job_store.get_campaign(campaign_id)
+    if campaign is None:
+        return None
+    return campaign["folder1"], campaign["folder2"]
+
+
+def resolve_file(campaign_id: str, row: int, slot: int) -> Optional[str]:
+    """Path of the file a verified link points to, None if it is gone.
+
+    Only files in the asset store are served: their path is their content
+    hash, so a link keeps pointing at the bytes the campaign was sent with
+    even when a later upload reuses the file name.
+    """
+    files = campaign_files(campaign_id)
+    if files is None:
+        return None
+    folder = files[slot - 1] if slot in (1, 2) else []
+    if not 0 <= row < len(folder) or not folder[row]:
+        return None
+    path = folder[row]
+    if not asset_store.contains(path) or not os.path.isfile(path):
+        return None
+    return path
+
+
+link_signer = LinkSigner()
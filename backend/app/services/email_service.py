@@ -1,28 +1,44 @@
-import smtplib
 import os
+import smtplib
 import time
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
-from email.mime.application import MIMEApplication
-from email.mime.image import MIMEImage
 from typing import List, Optional
 import logging
 import re 
+from app.services.smtp_pool import smtp_pool
+from app.services.mime_cache import CampaignPartCache, build_image_part, build_attachment_part
+from app.services.mime_stream import StreamedMessage, SpooledMessage, should_stream, streamed_attachment_part
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Compiled once; also used by the upload-time validation over whole columns
+EMAIL_RE = re.compile(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$')
+
+# To header of batch messages: the real addresses are only in the envelope
+UNDISCLOSED_RECIPIENTS = "undisclosed-recipients:;"
+
 def is_valid_email(email: str) -> bool:
     """Validate email format"""
-    pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
-    return re.match(pattern, email) is not None
+    return EMAIL_RE.match(email) is not None
+
+def smtp_reply_code(exc: Exception) -> Optional[int]:
+    """SMTP reply code carried by an smtplib exception, if any"""
+    if isinstance(exc, smtplib.SMTPResponseException):
+        return exc.smtp_code
+    if isinstance(exc, smtplib.SMTPRecipientsRefused) and exc.recipients:
+        return next(iter(exc.recipients.values()))[0]
+    return None
 
 class EmailService:
     def __init__(self):
         # Will be configured based on sender email
         self.smtp_server = "smtp.gmail.com"
         self.smtp_port = 465
+        # Authenticated sessions are reused across messages
+        self.pool = smtp_pool
     
     def get_smtp_config(self, sender_email: str):
         """Detect SMTP server based on email domain"""
@@ -44,6 +60,45 @@ class EmailService:
         else:
             return f"smtp.{domain}", 587
 
+    def build_message(self, sender_email: str, to_header: str, subject: str, html_body: str,
+                      images: dict = None, attachments: List[str] = None,
+                      part_cache: Optional[CampaignPartCache] = None):
+        """Return (MIME message, {placeholder token: path} of streamed attachments)"""
+        msg_root = MIMEMultipart("related")
+        msg_root["From"] = sender_email
+        msg_root["To"] = to_header
+        msg_root["Subject"] = subject
+
+        msg_alternative = MIMEMultipart("alternative")
+        msg_root.attach(msg_alternative)
+        msg_alternative.attach(MIMEText(html_body, "html", "utf-8"))
+
+        # Embed images (shared parts come pre-encoded from the campaign cache)
+        if images:
+            for cid, path in images.items():
+                if part_cache is not None:
+                    mime_img = part_cache.image_part(cid, path)
+                else:
+                    mime_img = build_image_part(cid, path)
+                if mime_img is not None:
+                    msg_root.attach(mime_img)
+
+        # Attach files (any extension). Large files are only encoded
+        # while the message is sent, a block at a time.
+        streamed = {}
+        if attachments:
+            for file_path in attachments:
+                if should_stream(file_path):
+                    adj, token = streamed_attachment_part(file_path)
+                    streamed[token] = file_path
+                elif part_cache is not None:
+                    adj = part_cache.attachment_part(file_path)
+                else:
+                    adj = build_attachment_part(file_path)
+                if adj is not None:
+                    msg_root.attach(adj)
+        return msg_root, streamed
+
     def send_email(
         self,
         sender_email: str,
@@ -52,8 +107,16 @@ class EmailService:
         subject: str,
         html_body: str,
         images: dict = None,
-        attachments: List[str] = None
+        attachments: List[str] = None,
+        part_cache: Optional[CampaignPartCache] = None,
+        raise_errors: bool = False,
+        timings: Optional[dict] = None
     ) -> bool:
+        """Send one HTML email.
+
+        timings, if given, is filled with the seconds spent per stage
+        (mime_build, smtp_connect, smtp_login, smtp_data).
+        """
         try:
             # Validate recipient email
             if not is_valid_email(recipient_email):
@@ -62,66 +125,79 @@ class EmailService:
             
             # Get SMTP configuration
             smtp_server, smtp_port = self.get_smtp_config(sender_email)
-            logger.info(f"Using SMTP: {smtp_server}:{smtp_port} for {sender_email}")
+            # Per-message lines only at DEBUG: at volume they cost real time
+            logger.debug("Using SMTP: %s:%s for %s", smtp_server, smtp_port, sender_email)
             
-            msg_root = MIMEMultipart("related")
-            msg_root["From"] = sender_email
-            msg_root["To"] = recipient_email
-            msg_root["Subject"] = subject
-
-            msg_alternative = MIMEMultipart("alternative")
-            msg_root.attach(msg_alternative)
-            msg_alternative.attach(MIMEText(html_body, "html", "utf-8"))
-
-            # Embed images
-            if images:
-                for cid, path in images.items():
-                    if os.path.exists(path):
-                        with open(path, "rb") as img:
-                            mime_img = MIMEImage(img.read())
-                            mime_img.add_header("Content-ID", f"<{cid}>")
-                            mime_img.add_header("Content-Disposition", 'inline; filename=""')
-                            msg_root.attach(mime_img)
-                    else:
-                        logger.warning(f"Image not found: {path}")
-
-            # Attach files (any extension)
-            if attachments:
-                for file_path in attachments:
-                    if os.path.exists(file_path):
-                        with open(file_path, "rb") as f:
-                            # Get file extension
-                            ext = os.path.splitext(file_path)[1][1:]  # Remove the dot
-                            adj = MIMEApplication(f.read(), _subtype=ext if ext else "octet-stream")
-                            adj.add_header(
-                                "Content-Disposition", 
-                                "attachment", 
-                                filename=os.path.basename(file_path)
-                            )
-                            msg_root.attach(adj)
-                    else:
-                        logger.warning(f"Attachment not found: {file_path}")
-
-            # Send using proven SMTP logic (from user's working code)
-            if smtp_port == 465:
-                with smtplib.SMTP_SSL(smtp_server, smtp_port, timeout=30) as server:
-                    server.login(sender_email, password)
-                    server.send_message(msg_root)
+            build_start = time.perf_counter()
+            msg_root, streamed = self.build_message(sender_email, recipient_email, subject, html_body,
+                                                    images, attachments, part_cache)
+            if timings is not None:
+                timings["mime_build"] = time.perf_counter() - build_start
+
+            # Send over a pooled, already authenticated session
+            if streamed:
+                self.pool.send_message(smtp_server, smtp_port, sender_email, password,
+                                       StreamedMessage(msg_root, streamed), to_addrs=[recipient_email], timings=timings)
             else:
-                with smtplib.SMTP(smtp_server, smtp_port, timeout=30) as server:
-                    server.starttls()
-                    server.login(sender_email, password)
-                    server.send_message(msg_root)
+                self.pool.send_message(smtp_server, smtp_port, sender_email, password, msg_root, timings=timings)
             
-            logger.info(f"Email sent successfully to {recipient_email}")
+            logger.debug("Email sent successfully to %s", recipient_email)
             return True
 
         except Exception as e:
-            logger.error(f"Error sending email to {recipient_email}: {e}")
-            logger.error(f"Error type: {type(e).__name__}")
-            import traceback
-            logger.error(f"Traceback: {traceback.format_exc()}")
+            if raise_errors:
+                # The caller inspects the SMTP reply (throttling, rejects...) and logs it
+                logger.debug("Error sending email to %s: %s: %s", recipient_email, type(e).__name__, e)
+                raise
+            logger.error(f"Error sending email to {recipient_email}: {type(e).__name__}: {e}")
+            # Full traceback only when debugging
+            logger.debug("Traceback", exc_info=True)
             return False
 
+    def send_batch(
+        self,
+        sender_email: str,
+        password: str,
+        recipient_emails: List[str],
+        subject: str,
+        html_body: str,
+        images: dict = None,
+        part_cache: Optional[CampaignPartCache] = None,
+        timings: Optional[dict] = None
+    ) -> dict:
+        """Send the same message to many recipients in one SMTP transaction.
+
+        The addresses only go in the envelope (one RCPT TO each), so no
+        recipient sees the others. Returns {address: (code, reply)} for the
+        recipients the server refused; raises like smtplib when the whole
+        transaction fails (SMTPRecipientsRefused if nobody was accepted).
+        """
+        smtp_server, smtp_port = self.get_smtp_config(sender_email)
+        logger.debug("Using SMTP: %s:%s for %s (%d recipients)", smtp_server, smtp_port, sender_email,
+                     len(recipient_emails))
+
+        build_start = time.perf_counter()
+        msg_root, _ = self.build_message(sender_email, UNDISCLOSED_RECIPIENTS, subject, html_body,
+                                         images, part_cache=part_cache)
+        if timings is not None:
+            timings["mime_build"] = time.perf_counter() - build_start
+
+        refused = self.pool.send_message(smtp_server, smtp_port, sender_email, password, msg_root,
+                                         to_addrs=recipient_emails, timings=timings)
+        logger.debug("Batch sent to %d of %d recipients", len(recipient_emails) - len(refused),
+                     len(recipient_emails))
+        return refused
+
+    def send_spooled(self, sender_email: str, password: str, recipient_email: str, path: str,
+                     timings: Optional[dict] = None):
+        """Send a message pre-rendered to an .eml file; its bytes go out as they are.
+
+        Raises like smtplib on failure.
+        """
+        smtp_server, smtp_port = self.get_smtp_config(sender_email)
+        self.pool.send_message(smtp_server, smtp_port, sender_email, password, SpooledMessage(path),
+                               to_addrs=[recipient_email], timings=timings)
+        logger.debug("Email sent successfully to %s", recipient_email)
+
 email_service = EmailService()
 
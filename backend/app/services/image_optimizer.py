@@ -0,0 +1,107 @@
+import hashlib
+import io
+import os
+import logging
+from typing import Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+OPTIMIZED_DIR = "temp/assets/optimized"
+# Display size in the email template (app/templates/email_template.py):
+# (max width, max height) in pixels, None = not constrained
+DISPLAY_SIZES = {
+    "logo": (None, 70),
+    "flyer": (540, None),
+}
+JPEG_QUALITY = 85
+HASH_CHUNK = 1024 * 1024
+
+
+def file_sha256(path: str) -> str:
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def target_size(size: Tuple[int, int], box: Tuple[Optional[int], Optional[int]]) -> Tuple[int, int]:
+    """Scale (width, height) down to fit the box, keeping the aspect ratio (never up)"""
+    width, height = size
+    scale = 1.0
+    if box[0]:
+        scale = min(scale, box[0] / width)
+    if box[1]:
+        scale = min(scale, box[1] / height)
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def optimize_image(path: str, kind: str) -> str:
+    """Return the path of a copy of an uploaded logo/flyer sized for the email.
+
+    Resized to the template's display size, recompressed and without EXIF
+    or other metadata (the colour profile is kept). Results are cached by
+    the hash of the original bytes, so uploading the same image again
+    costs one read. Falls back to the original when Pillow isn't
+    installed, the file isn't a still image, or optimizing doesn't make
+    it smaller.
+    """
+    box = DISPLAY_SIZES.get(kind)
+    if box is None:
+        return path
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:
+        logger.warning("Pillow is not installed, images are sent as uploaded")
+        return path
+
+    sha256 = file_sha256(path)
+    for ext in ("jpg", "png"):
+        cached = os.path.join(OPTIMIZED_DIR, f"{sha256}-{kind}.{ext}")
+        if os.path.exists(cached):
+            return cached
+
+    try:
+        with Image.open(path) as img:
+            if getattr(img, "n_frames", 1) > 1:
+                # Animated GIF/WebP: resizing would drop the animation
+                return path
+            # JPEG can decode straight at a fraction of its size (much faster).
+            # Square request: the EXIF orientation may still swap the sides.
+            side = max(target_size(img.size, box))
+            img.draft("RGB", (side, side))
+            icc_profile = img.info.get("icc_profile")
+            img = ImageOps.exif_transpose(img)
+            size = target_size(img.size, box)
+            if img.size != size:
+                img = img.resize(size, Image.LANCZOS)
+
+            out = io.BytesIO()
+            has_alpha = img.mode in ("RGBA", "LA", "PA") or (img.mode == "P" and "transparency" in img.info)
+            if has_alpha:
+                # Transparent logos stay PNG
+                ext = "png"
+                img.save(out, "PNG", optimize=True, icc_profile=icc_profile)
+            else:
+                ext = "jpg"
+                if img.mode != "RGB":
+                    img = img.convert("RGB")
+                img.save(out, "JPEG", quality=JPEG_QUALITY, optimize=True, progressive=True,
+                         icc_profile=icc_profile)
+    except Exception as e:
+        logger.warning(f"Could not optimize {path}, using it as uploaded: {e}")
+        return path
+
+    data = out.getvalue()
+    original_size = os.path.getsize(path)
+    if len(data) >= original_size:
+        return path
+    os.makedirs(OPTIMIZED_DIR, exist_ok=True)
+    optimized = os.path.join(OPTIMIZED_DIR, f"{sha256}-{kind}.{ext}")
+    tmp_path = f"{optimized}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, optimized)
+    logger.info(f"Optimized {kind} {os.path.basename(path)}: {original_size // 1024} KB -> {len(data) // 1024} KB "
+                f"({size[0]}x{size[1]})")
+    return optimized
@@ -0,0 +1,630 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from cryptography.fernet import Fernet, InvalidToken
+
+from app.services.recipient_validation import recipient_email
+
+logger = logging.getLogger(__name__)
+
+# Private state (job store, spool, keys). Not under temp/: that directory
+# holds uploads and must never contain anything the web server could publish.
+DATA_DIR = os.environ.get("RESU_DATA_DIR", "data")
+DB_PATH = os.path.join(DATA_DIR, "campaigns.db")
+# Where earlier versions kept the database
+LEGACY_DB_PATH = "temp/campaigns.db"
+# Key of the SMTP passwords queued for the send workers, kept apart from
+# the database (RESU_CREDENTIALS_KEY overrides it)
+CREDENTIALS_KEY_PATH = os.path.join(DATA_DIR, "credentials.key")
+# Recipients inserted per executemany() call when a campaign is created
+INSERT_CHUNK = 1000
+# A "running" or "queued" campaign whose row hasn't been touched for this
+# long is considered orphaned (its process died) and can be resumed. The
+# process that owns it refreshes the row well within this (see touch()).
+STALE_AFTER = 120
+# Seconds a send worker owns a queued campaign without renewing its lease
+LEASE_SECONDS = 60
+# A job whose workers keep dying is given up after this many leases
+MAX_LEASES = 5
+
+# Rows without an address are recorded so resume skips them, but they are
+# not part of the report (the send loop never reported them either).
+ESTADO_OMITIDO = "Omitido"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS campaigns (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    sender_email TEXT NOT NULL,
+    config_json TEXT NOT NULL,
+    assets_json TEXT NOT NULL,
+    columns_json TEXT NOT NULL,
+    total INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS recipients (
+    campaign_id TEXT NOT NULL,
+    row_index INTEGER NOT NULL,
+    data_json TEXT NOT NULL,
+    dominio TEXT,
+    PRIMARY KEY (campaign_id, row_index)
+);
+CREATE TABLE IF NOT EXISTS deliveries (
+    campaign_id TEXT NOT NULL,
+    row_index INTEGER NOT NULL,
+    correo TEXT,
+    nombre TEXT,
+    estado TEXT NOT NULL,
+    fecha TEXT,
+    hora TEXT,
+    intentos INTEGER,
+    duracion REAL,
+    adjunto1 TEXT,
+    adjunto2 TEXT,
+    detalle TEXT,
+    remitente TEXT,
+    PRIMARY KEY (campaign_id, row_index)
+);
+CREATE TABLE IF NOT EXISTS downloads (
+    campaign_id TEXT NOT NULL,
+    row_index INTEGER NOT NULL,
+    adjunto INTEGER NOT NULL,
+    descargas INTEGER NOT NULL DEFAULT 0,
+    primera TEXT,
+    ultima TEXT,
+    PRIMARY KEY (campaign_id, row_index, adjunto)
+);
+CREATE TABLE IF NOT EXISTS send_jobs (
+    campaign_id TEXT PRIMARY KEY,
+    password TEXT NOT NULL,
+    sender_passwords TEXT,
+    enqueued_at REAL NOT NULL,
+    worker_id TEXT,
+    lease_until REAL,
+    leases INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+# Row fields stored in the deliveries table, in report order
+REPORT_FIELDS = ("correo", "nombre", "estado", "fecha", "hora", "intentos", "duracion", "adjunto1", "adjunto2", "detalle",
+                 "remitente")
+# Report columns from the downloads table (link delivery), after REPORT_FIELDS
+DOWNLOAD_FIELDS = ("descargas", "ultima_descarga")
+REPORT_COLUMNS = REPORT_FIELDS + DOWNLOAD_FIELDS
+DOWNLOAD_COLUMNS_SQL = (
+    "(SELECT SUM(w.descargas) FROM downloads w"
+    " WHERE w.campaign_id = deliveries.campaign_id AND w.row_index = deliveries.row_index) AS descargas,"
+    " (SELECT MAX(w.ultima) FROM downloads w"
+    " WHERE w.campaign_id = deliveries.campaign_id AND w.row_index = deliveries.row_index) AS ultima_descarga"
+)
+
+# Report queries filter by status, date and recipient domain within a campaign
+INDEXES = """
+CREATE INDEX IF NOT EXISTS idx_deliveries_estado ON deliveries (campaign_id, estado, row_index);
+CREATE INDEX IF NOT EXISTS idx_deliveries_fecha ON deliveries (campaign_id, fecha, hora);
+CREATE INDEX IF NOT EXISTS idx_deliveries_dominio ON deliveries (campaign_id, dominio);
+CREATE INDEX IF NOT EXISTS idx_recipients_dominio ON recipients (campaign_id, dominio, row_index);
+CREATE INDEX IF NOT EXISTS idx_deliveries_remitente ON deliveries (remitente, fecha, estado);
+"""
+INSERT_RECIPIENT = "INSERT INTO recipients (campaign_id, row_index, data_json, dominio) VALUES (?, ?, ?, ?)"
+
+# Columns the report can be sorted by (anything else would be SQL injection)
+SORTABLE_FIELDS = ("row_index",) + REPORT_COLUMNS
+# Rows read per query when a whole report is iterated (exports)
+REPORT_PAGE = 1000
+
+
+def email_domain(correo: Optional[str]) -> Optional[str]:
+    if not correo or "@" not in correo:
+        return None
+    return correo.rsplit("@", 1)[1].strip().lower()
+
+
+class CredentialBox:
+    """Encrypts the SMTP passwords a queued campaign needs (Fernet).
+
+    The key is shared by the web process and the send workers: set
+    RESU_CREDENTIALS_KEY, or one is generated in an owner-only file next
+    to the database on first use, so a copy of the database alone doesn't
+    give the passwords away.
+    """
+
+    def __init__(self, key_path: str = CREDENTIALS_KEY_PATH):
+        self.key_path = key_path
+        self._fernet = None
+        self._lock = threading.Lock()
+
+    def _load_key(self) -> bytes:
+        env = os.environ.get("RESU_CREDENTIALS_KEY")
+        if env:
+            return env.encode()
+        try:
+            with open(self.key_path, "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            pass
+        os.makedirs(os.path.dirname(self.key_path) or ".", mode=0o700, exist_ok=True)
+        key = Fernet.generate_key()
+        # O_EXCL: if another process won the race, use its key
+        try:
+            fd = os.open(self.key_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        except FileExistsError:
+            with open(self.key_path, "rb") as f:
+                return f.read()
+        with os.fdopen(fd, "wb") as f:
+            f.write(key)
+        logger.info(f"Created a new credentials key in {self.key_path}")
+        return key
+
+    @property
+    def fernet(self) -> Fernet:
+        with self._lock:
+            if self._fernet is None:
+                self._fernet = Fernet(self._load_key())
+            return self._fernet
+
+    def seal(self, secret: str) -> str:
+        return self.fernet.encrypt(secret.encode()).decode()
+
+    def unseal(self, token: str) -> str:
+        """Decrypt a sealed secret; ValueError if it wasn't sealed with this key"""
+        try:
+            return self.fernet.decrypt(token.encode()).decode()
+        except InvalidToken:
+            raise ValueError("Credentials sealed with another key")
+
+
+class JobStore:
+    """SQLite store for campaigns, their recipients and delivery progress.
+
+    The database runs in WAL mode so the send loop can commit progress
+    while other requests (or other uvicorn workers) read reports.
+    """
+
+    def __init__(self, path: str = DB_PATH, credentials: Optional[CredentialBox] = None):
+        self.path = path
+        self.credentials = credentials or CredentialBox()
+        self._local = threading.local()
+        self._init_lock = threading.Lock()
+        self._initialized = False
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            with self._init_lock:
+                if not self._initialized:
+                    self._prepare_path()
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            with self._init_lock:
+                if not self._initialized:
+                    conn.executescript(SCHEMA)
+                    self._migrate(conn)
+                    self._initialized = True
+        return conn
+
+    def _prepare_path(self):
+        """Create the data directory (owner only) and move a database left in temp/"""
+        os.makedirs(os.path.dirname(self.path) or ".", mode=0o700, exist_ok=True)
+        if self.path == DB_PATH and not os.path.exists(self.path) and os.path.exists(LEGACY_DB_PATH):
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(LEGACY_DB_PATH + suffix):
+                    os.replace(LEGACY_DB_PATH + suffix, self.path + suffix)
+                    os.chmod(self.path + suffix, 0o600)
+            logger.info(f"Moved the job store from {LEGACY_DB_PATH} to {self.path}")
+        if not os.path.exists(self.path):
+            os.close(os.open(self.path, os.O_WRONLY | os.O_CREAT, 0o600))
+
+    def _migrate(self, conn: sqlite3.Connection):
+        """Add columns introduced after a database was first created"""
+        existing = {row["name"] for row in conn.execute("PRAGMA table_info(deliveries)")}
+        for column in REPORT_FIELDS:
+            if column not in existing:
+                conn.execute(f"ALTER TABLE deliveries ADD COLUMN {column} TEXT")
+        if "dominio" not in existing:
+            conn.execute("ALTER TABLE deliveries ADD COLUMN dominio TEXT")
+            conn.execute(
+                "UPDATE deliveries SET dominio = lower(substr(correo, instr(correo, '@') + 1))"
+                " WHERE instr(correo, '@') > 0"
+            )
+        if "dominio" not in {row["name"] for row in conn.execute("PRAGMA table_info(recipients)")}:
+            conn.execute("ALTER TABLE recipients ADD COLUMN dominio TEXT")
+        if "sender_passwords" not in {row["name"] for row in conn.execute("PRAGMA table_info(send_jobs)")}:
+            conn.execute("ALTER TABLE send_jobs ADD COLUMN sender_passwords TEXT")
+        conn.executescript(INDEXES)
+        conn.commit()
+
+    # --- Campaigns ---
+    def create_campaign(self, config: dict, recipients, assets: dict, folder1: List[str], folder2: List[str]) -> str:
+        """Persist a campaign with all its recipients, return its id.
+
+        config must not contain the SMTP passwords: only enqueue_job()
+        keeps them, encrypted, until a send worker is done with the job.
+        """
+        campaign_id = uuid.uuid4().hex[:12]
+        columns = list(getattr(recipients, "columns", []) or [])
+        assets_json = json.dumps({"images": assets, "folder1": folder1, "folder2": folder2})
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "INSERT INTO campaigns (id, status, created_at, updated_at, sender_email, config_json,"
+                " assets_json, columns_json, total) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (campaign_id, "queued", datetime.now().isoformat(timespec="seconds"), time.time(),
+                 config["sender_email"], json.dumps(config), assets_json, json.dumps(columns), len(recipients)),
+            )
+            chunk = []
+            for i, recipient in enumerate(recipients):
+                email = recipient_email(recipient)
+                chunk.append((campaign_id, i, json.dumps(recipient, default=str), email_domain(email)))
+                if len(chunk) >= INSERT_CHUNK:
+                    conn.executemany(INSERT_RECIPIENT, chunk)
+                    chunk = []
+            if chunk:
+                conn.executemany(INSERT_RECIPIENT, chunk)
+        return campaign_id
+
+    def get_campaign(self, campaign_id: str) -> Optional[dict]:
+        row = self._conn().execute("SELECT * FROM campaigns WHERE id = ?", (campaign_id,)).fetchone()
+        if row is None:
+            return None
+        assets = json.loads(row["assets_json"])
+        return {
+            "id": row["id"],
+            "status": row["status"],
+            "created_at": row["created_at"],
+            "updated_at": row["updated_at"],
+            "sender_email": row["sender_email"],
+            "config": json.loads(row["config_json"]),
+            "assets": assets["images"],
+            "folder1": assets["folder1"],
+            "folder2": assets["folder2"],
+            "columns": json.loads(row["columns_json"]),
+            "total": row["total"],
+        }
+
+    def list_campaigns(self, limit: int = 50) -> List[dict]:
+        rows = self._conn().execute(
+            "SELECT c.id, c.status, c.created_at, c.sender_email, c.total,"
+            " (SELECT COUNT(*) FROM deliveries d WHERE d.campaign_id = c.id) AS processed"
+            " FROM campaigns c ORDER BY c.created_at DESC LIMIT ?",
+            (limit,),
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def set_status(self, campaign_id: str, status: str):
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "UPDATE campaigns SET status = ?, updated_at = ? WHERE id = ?",
+                (status, time.time(), campaign_id),
+            )
+
+    def claim(self, campaign_id: str) -> bool:
+        """Mark a campaign as running unless a live process owns it.
+
+        Running and queued campaigns are owned by whoever keeps touching
+        them (the scheduler's heartbeat, a worker's lease); only once that
+        stops for STALE_AFTER seconds can another process take over.
+        """
+        now = time.time()
+        conn = self._conn()
+        with conn:
+            cursor = conn.execute(
+                "UPDATE campaigns SET status = 'running', updated_at = ? WHERE id = ?"
+                " AND status != 'completed' AND (status NOT IN ('running', 'queued') OR updated_at < ?)",
+                (now, campaign_id, now - STALE_AFTER),
+            )
+        return cursor.rowcount == 1
+
+    def touch(self, campaign_ids: List[str]):
+        """Heartbeat of the campaigns a process is sending or has queued, see claim()"""
+        now = time.time()
+        conn = self._conn()
+        with conn:
+            conn.executemany("UPDATE campaigns SET updated_at = ? WHERE id = ?",
+                             [(now, campaign_id) for campaign_id in campaign_ids])
+
+    def processed_count(self, campaign_id: str) -> int:
+        row = self._conn().execute(
+            "SELECT COUNT(*) FROM deliveries WHERE campaign_id = ?", (campaign_id,)
+        ).fetchone()
+        return row[0]
+
+    def delivery_progress(self, campaign_id: str) -> Tuple[dict, int]:
+        """Recorded results of a campaign by estado, and the position of the
+        last one (see deliveries_since)"""
+        rows = self._conn().execute(
+            "SELECT estado, COUNT(*), MAX(rowid) FROM deliveries WHERE campaign_id = ? GROUP BY estado",
+            (campaign_id,),
+        ).fetchall()
+        return {estado: count for estado, count, _ in rows}, max((last for _, _, last in rows), default=0)
+
+    def deliveries_since(self, campaign_id: str, position: int, limit: int = REPORT_PAGE) -> List[Tuple[int, int, dict]]:
+        """(position, row_index, report row) of results recorded after position, in recording order.
+
+        The position is the table's rowid: it grows with every result
+        written, so another process can follow a campaign as it is sent.
+        """
+        rows = self._conn().execute(
+            "SELECT rowid, row_index, " + ", ".join(REPORT_FIELDS) + " FROM deliveries"
+            " WHERE campaign_id = ? AND rowid > ? ORDER BY rowid LIMIT ?",
+            (campaign_id, position, limit),
+        ).fetchall()
+        return [(row[0], row[1], {f: row[f] for f in REPORT_FIELDS}) for row in rows]
+
+    # --- Recipients / progress ---
+    def pending_rows(self, campaign_id: str, page_size: int = INSERT_CHUNK,
+                     by_domain: bool = False) -> Iterator[Tuple[int, dict]]:
+        """Recipients that have no delivery result yet, in sheet order.
+
+        by_domain groups recipients of the same domain together (sheet
+        order within a domain). Read page by page so progress can be
+        committed on the same connection while the campaign is iterated.
+        """
+        last_domain, last = "", -1
+        order = "COALESCE(r.dominio, ''), r.row_index"
+        while True:
+            rows = self._conn().execute(
+                "SELECT r.row_index, r.data_json, COALESCE(r.dominio, '') FROM recipients r"
+                " LEFT JOIN deliveries d ON d.campaign_id = r.campaign_id AND d.row_index = r.row_index"
+                " WHERE r.campaign_id = ? AND d.row_index IS NULL AND "
+                + (f"({order}) > (?, ?) ORDER BY {order}" if by_domain else "r.row_index > ? ORDER BY r.row_index")
+                + " LIMIT ?",
+                (campaign_id, last_domain, last, page_size) if by_domain else (campaign_id, last, page_size),
+            ).fetchall()
+            if not rows:
+                return
+            for row_index, data_json, _ in rows:
+                yield row_index, json.loads(data_json)
+            last, last_domain = rows[-1][0], rows[-1][2]
+
+    def record_deliveries(self, campaign_id: str, results: Iterable[Tuple[int, Optional[dict]]]):
+        """Commit a batch of (row_index, report row) results in one transaction"""
+        values = []
+        for row_index, row in results:
+            if row is None:
+                values.append((campaign_id, row_index, None) + (None,) * 2 + (ESTADO_OMITIDO,)
+                              + (None,) * (len(REPORT_FIELDS) - 3))
+            else:
+                values.append((campaign_id, row_index, email_domain(row.get("correo")))
+                              + tuple(row.get(f) for f in REPORT_FIELDS))
+        conn = self._conn()
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO deliveries (campaign_id, row_index, dominio, " + ", ".join(REPORT_FIELDS) + ")"
+                " VALUES (?, ?, ?, " + ", ".join("?" * len(REPORT_FIELDS)) + ")",
+                values,
+            )
+            # Progress heartbeat, see claim()
+            conn.execute("UPDATE campaigns SET updated_at = ? WHERE id = ?", (time.time(), campaign_id))
+
+    # --- Send queue (python -m app.worker) ---
+    def enqueue_job(self, campaign_id: str, password: str, sender_passwords: Optional[dict] = None):
+        """Queue a campaign for the send workers.
+
+        The SMTP passwords (the sender's, and the extra accounts' by address)
+        have to reach the worker, so they are kept in the job row, encrypted
+        (see CredentialBox), and only until a worker is done with the job.
+        """
+        now = time.time()
+        sealed = (self.credentials.seal(password), self.credentials.seal(json.dumps(sender_passwords or {})))
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO send_jobs (campaign_id, password, sender_passwords, enqueued_at)"
+                " VALUES (?, ?, ?, ?)",
+                (campaign_id, *sealed, now),
+            )
+            conn.execute("UPDATE campaigns SET status = 'queued', updated_at = ? WHERE id = ?", (now, campaign_id))
+
+    def lease_job(self, worker_id: str, lease_seconds: float = LEASE_SECONDS) -> Optional[Tuple[str, str, dict]]:
+        """Take the oldest queued job, or one whose worker stopped renewing its lease.
+
+        Returns (campaign_id, password, sender_passwords) or None when there
+        is nothing to do.
+        """
+        now = time.time()
+        conn = self._conn()
+        with conn:
+            # Write lock up front, so two workers can't take the same job
+            conn.execute("BEGIN IMMEDIATE")
+            while True:
+                row = conn.execute(
+                    "SELECT campaign_id, password, sender_passwords, leases FROM send_jobs"
+                    " WHERE worker_id IS NULL OR lease_until < ? ORDER BY enqueued_at LIMIT 1",
+                    (now,),
+                ).fetchone()
+                if row is None:
+                    return None
+                try:
+                    password = self.credentials.unseal(row["password"])
+                    sender_passwords = json.loads(self.credentials.unseal(row["sender_passwords"] or ""))
+                except ValueError:
+                    # Queued before encryption, or the key was replaced: /resume asks for the passwords again
+                    logger.warning(f"Cannot read the passwords of queued campaign {row['campaign_id']}; "
+                                   "it is paused until resumed")
+                    status = "paused"
+                else:
+                    if row["leases"] < MAX_LEASES:
+                        break
+                    status = "failed"
+                conn.execute("DELETE FROM send_jobs WHERE campaign_id = ?", (row["campaign_id"],))
+                conn.execute("UPDATE campaigns SET status = ?, updated_at = ? WHERE id = ?",
+                             (status, now, row["campaign_id"]))
+            conn.execute(
+                "UPDATE send_jobs SET worker_id = ?, lease_until = ?, leases = leases + 1 WHERE campaign_id = ?",
+                (worker_id, now + lease_seconds, row["campaign_id"]),
+            )
+        return row["campaign_id"], password, sender_passwords
+
+    def renew_lease(self, campaign_id: str, worker_id: str, lease_seconds: float = LEASE_SECONDS) -> bool:
+        """Heartbeat of a worker; False if the job is no longer leased to it"""
+        now = time.time()
+        conn = self._conn()
+        with conn:
+            cursor = conn.execute(
+                "UPDATE send_jobs SET lease_until = ? WHERE campaign_id = ? AND worker_id = ?",
+                (now + lease_seconds, campaign_id, worker_id),
+            )
+            if cursor.rowcount == 1:
+                # Also keeps claim() from treating the campaign as orphaned
+                conn.execute("UPDATE campaigns SET updated_at = ? WHERE id = ?", (now, campaign_id))
+        return cursor.rowcount == 1
+
+    def release_job(self, campaign_id: str, worker_id: str, requeue: bool = False):
+        """Drop a finished job (and its password), or give it back to the queue"""
+        conn = self._conn()
+        with conn:
+            if requeue:
+                cursor = conn.execute(
+                    "UPDATE send_jobs SET worker_id = NULL, lease_until = NULL WHERE campaign_id = ? AND worker_id = ?",
+                    (campaign_id, worker_id),
+                )
+                if cursor.rowcount == 1:
+                    conn.execute("UPDATE campaigns SET status = 'queued', updated_at = ? WHERE id = ?",
+                                 (time.time(), campaign_id))
+            else:
+                conn.execute("DELETE FROM send_jobs WHERE campaign_id = ? AND worker_id = ?", (campaign_id, worker_id))
+
+    def sent_today(self, sender_email: str) -> int:
+        """Messages accepted today for a sender account, across campaigns.
+
+        Rows recorded before deliveries had a remitente count for the
+        campaign's sender.
+        """
+        today = datetime.now().strftime("%Y-%m-%d")
+        row = self._conn().execute(
+            "SELECT (SELECT COUNT(*) FROM deliveries WHERE remitente = ? AND fecha = ? AND estado = 'Enviado')"
+            " + (SELECT COUNT(*) FROM deliveries d JOIN campaigns c ON c.id = d.campaign_id"
+            "    WHERE d.remitente IS NULL AND c.sender_email = ? AND d.estado = 'Enviado' AND d.fecha = ?)",
+            (sender_email, today, sender_email, today),
+        ).fetchone()
+        return row[0]
+
+    # --- Download links ---
+    def record_download(self, campaign_id: str, row_index: int, adjunto: int):
+        """Count one download of a row's attachment (1 or 2) through its link"""
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "INSERT INTO downloads (campaign_id, row_index, adjunto, descargas, primera, ultima)"
+                " VALUES (?, ?, ?, 1, ?, ?) ON CONFLICT (campaign_id, row_index, adjunto)"
+                " DO UPDATE SET descargas = descargas + 1, ultima = excluded.ultima",
+                (campaign_id, row_index, adjunto, now, now),
+            )
+
+    def report(self, campaign_id: str) -> List[dict]:
+        rows = self._conn().execute(
+            "SELECT " + ", ".join(REPORT_FIELDS) + ", " + DOWNLOAD_COLUMNS_SQL + " FROM deliveries"
+            " WHERE campaign_id = ? AND estado != ? ORDER BY row_index",
+            (campaign_id, ESTADO_OMITIDO),
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    # --- Report queries ---
+    def _report_filter(self, campaign_id: str, estado: Optional[str] = None, desde: Optional[str] = None,
+                       hasta: Optional[str] = None, dominio: Optional[str] = None) -> Tuple[str, list]:
+        """WHERE clause and parameters shared by count/page/iterate"""
+        where = ["campaign_id = ?"]
+        params = [campaign_id]
+        if estado:
+            where.append("estado = ?")
+            params.append(estado)
+        else:
+            where.append("estado != ?")
+            params.append(ESTADO_OMITIDO)
+        if desde:
+            where.append("fecha >= ?")
+            params.append(desde)
+        if hasta:
+            where.append("fecha <= ?")
+            params.append(hasta)
+        if dominio:
+            where.append("dominio = ?")
+            params.append(dominio.strip().lower().lstrip("@"))
+        return " AND ".join(where), params
+
+    def _report_rows(self, campaign_id: str, offset: int, limit: int, sort: str, descending: bool,
+                     filters: dict, after: Optional[Tuple[object, int]] = None) -> List[dict]:
+        """Rows of the report in (sort, row_index) order; after = (sort value, row_index)
+        of the last row already read, instead of an offset"""
+        if sort not in SORTABLE_FIELDS:
+            raise ValueError(f"Cannot sort by {sort}")
+        where, params = self._report_filter(campaign_id, **filters)
+        if after is not None:
+            clause, after_params = self._after(sort, descending, *after)
+            where += f" AND {clause}"
+            params = params + after_params
+        direction = "DESC" if descending else "ASC"
+        # row_index breaks ties so pages never overlap
+        rows = self._conn().execute(
+            "SELECT row_index, " + ", ".join(REPORT_FIELDS) + ", " + DOWNLOAD_COLUMNS_SQL
+            + f" FROM deliveries WHERE {where}"
+            f" ORDER BY {sort} {direction}, row_index {direction} LIMIT ? OFFSET ?",
+            params + [limit, offset],
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    @staticmethod
+    def _after(sort: str, descending: bool, value, row_index: int) -> Tuple[str, list]:
+        """Keyset condition: rows that come after (value, row_index) in the report order.
+
+        SQLite puts NULLs first when sorting ascending and last descending.
+        """
+        op = "<" if descending else ">"
+        if sort == "row_index":
+            return f"row_index {op} ?", [row_index]
+        if value is None:
+            clause = f"({sort} IS NULL AND row_index {op} ?)"
+            return (clause if descending else f"({clause} OR {sort} IS NOT NULL)"), [row_index]
+        clause = f"({sort} {op} ? OR ({sort} = ? AND row_index {op} ?))"
+        return (f"({clause} OR {sort} IS NULL)" if descending else clause), [value, value, row_index]
+
+    def report_page(self, campaign_id: str, offset: int = 0, limit: int = 100, sort: str = "row_index",
+                    descending: bool = False, **filters) -> Tuple[List[dict], int]:
+        """One page of a campaign report and the number of rows matching the filters.
+
+        filters: estado, desde/hasta (YYYY-MM-DD) and dominio (recipient domain).
+        """
+        rows = self._report_rows(campaign_id, offset, limit, sort, descending, filters)
+        for row in rows:
+            del row["row_index"]
+        where, params = self._report_filter(campaign_id, **filters)
+        total = self._conn().execute(f"SELECT COUNT(*) FROM deliveries WHERE {where}", params).fetchone()[0]
+        return rows, total
+
+    def iter_report(self, campaign_id: str, sort: str = "row_index", descending: bool = False,
+                    page_size: int = REPORT_PAGE, **filters) -> Iterator[dict]:
+        """Every matching report row, read page by page (constant memory).
+
+        Each page starts after the last row of the previous one (keyset
+        paging), so reading the whole report is linear, unlike OFFSET.
+        Short queries rather than one open cursor: the caller may resume
+        the iteration from another thread (streamed responses).
+        """
+        after = None
+        while True:
+            rows = self._report_rows(campaign_id, 0, page_size, sort, descending, filters, after)
+            if rows:
+                last = rows[-1]
+                after = (last[sort], last["row_index"])
+            for row in rows:
+                del row["row_index"]
+                yield row
+            if len(rows) < page_size:
+                return
+
+
+job_store = JobStore()
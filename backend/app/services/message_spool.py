@@ -0,0 +1,112 @@
+import multiprocessing
+import os
+import shutil
+import threading
+import logging
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List
+
+from app.services.job_store import DATA_DIR
+
+logger = logging.getLogger(__name__)
+
+# Personalized messages with their attachments: private, never under temp/
+SPOOL_DIR = os.path.join(DATA_DIR, "spool")
+# Render processes shared by every campaign; one core is left to the send loop
+SPOOL_PROCESSES = max(1, (os.cpu_count() or 2) - 1)
+# Rows the spool may render ahead of the SMTP workers
+SPOOL_LOOKAHEAD = 64
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def render_to_spool(campaign_id: str, path: str, sender_email: str, recipient_email: str, subject: str,
+                    html_body: str, images: dict, attachments: List[str], strict: bool = False) -> int:
+    """Build one message and write it to path as an .eml file, return its size.
+
+    Runs in a spool process: MIME assembly, base64 and flattening happen
+    here instead of in the SMTP workers. strict (dry runs) fails on
+    missing attachments instead of sending the message without them.
+    """
+    # Imported here: this runs in a freshly spawned process
+    from app.services.email_service import email_service
+    from app.services.mime_cache import part_caches
+    from app.services.mime_stream import StreamedMessage
+
+    if strict:
+        for attachment in attachments:
+            if not os.path.exists(attachment):
+                raise FileNotFoundError(f"Adjunto no encontrado: {os.path.basename(attachment)}")
+    msg, streamed = email_service.build_message(sender_email, recipient_email, subject, html_body,
+                                                images, attachments, part_caches.get(campaign_id))
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as out:
+        size = StreamedMessage(msg, streamed).write_to(out)
+    os.replace(tmp_path, path)
+    return size
+
+
+def spool_executor(reset: bool = False) -> ProcessPoolExecutor:
+    """The shared render pool (spawned, so it is safe next to the send threads)"""
+    global _executor
+    with _executor_lock:
+        if reset and _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=SPOOL_PROCESSES,
+                                            mp_context=multiprocessing.get_context("spawn"))
+        return _executor
+
+
+class CampaignSpool:
+    """Ready-to-send messages of one campaign: data/spool/<campaign_id>/<row>.eml.
+
+    A row is submitted when the send loop picks it up, so at most the send
+    loop's look-ahead window is rendered (and on disk) at a time. Files are
+    dropped once their row has a final result.
+    """
+
+    def __init__(self, campaign_id: str, strict: bool = False):
+        self.campaign_id = campaign_id
+        self.dir = os.path.join(SPOOL_DIR, campaign_id)
+        self.strict = strict
+        self._futures: Dict[int, Future] = {}
+        self._lock = threading.Lock()
+        os.makedirs(self.dir, mode=0o700, exist_ok=True)
+
+    def path(self, i: int) -> str:
+        return os.path.join(self.dir, f"{i}.eml")
+
+    def submit(self, i: int, sender_email: str, recipient_email: str, subject: str, html_body: str,
+               images: dict, attachments: List[str]) -> Future:
+        args = (self.campaign_id, self.path(i), sender_email, recipient_email, subject, html_body, images, attachments, self.strict)
+        try:
+            future = spool_executor().submit(render_to_spool, *args)
+        except BrokenProcessPool:
+            # A render process died (e.g. out of memory): start a new pool
+            logger.warning("Spool process pool broke, restarting it")
+            future = spool_executor(reset=True).submit(render_to_spool, *args)
+        with self._lock:
+            self._futures[i] = future
+        return future
+
+    def discard(self, i: int):
+        with self._lock:
+            future = self._futures.pop(i, None)
+        if future is not None and future.cancel():
+            return
+        try:
+            os.remove(self.path(i))
+        except FileNotFoundError:
+            pass
+
+    def close(self):
+        """Drop everything still spooled (the run finished or stopped)"""
+        with self._lock:
+            futures, self._futures = list(self._futures.values()), {}
+        for future in futures:
+            future.cancel()
+        shutil.rmtree(self.dir, ignore_errors=True)
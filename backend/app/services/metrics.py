@@ -0,0 +1,145 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, Optional, Tuple
+
+# Seconds; covers a template render (sub-millisecond) up to a slow SMTP DATA
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    """Monotonic counter with labels (Prometheus text format)"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labelvalues: str, amount: float = 1):
+        key = tuple(str(v) for v in labelvalues)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, *labelvalues: str) -> float:
+        return self._values.get(tuple(str(v) for v in labelvalues), 0)
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.labelnames, key)} {value:g}")
+        return "\n".join(lines)
+
+
+class Histogram:
+    """Cumulative-bucket histogram with labels (Prometheus text format)"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [per-bucket counts (+Inf last), sum, count]
+        self._series: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labelvalues: str):
+        key = tuple(str(v) for v in labelvalues)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, *labelvalues: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labelvalues)
+
+    def count(self, *labelvalues: str) -> int:
+        series = self._series.get(tuple(str(v) for v in labelvalues))
+        return series[2] if series else 0
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += bucket_count
+                    le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                    labels = _labels(self.labelnames, key, f'le="{le}"')
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {total:.6f}")
+                lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {count}")
+        return "\n".join(lines)
+
+
+class MetricsRegistry:
+    """Metrics served by /metrics"""
+
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+        metric = Counter(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                  buckets: Optional[Tuple[float, ...]] = None) -> Histogram:
+        metric = Histogram(name, documentation, labelnames, buckets or DEFAULT_BUCKETS)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self._metrics) + "\n"
+
+
+metrics = MetricsRegistry()
+
+# --- Send path ---
+# stage: render, mime_build, spool_wait, smtp_connect, smtp_login, smtp_data, slot_wait, retry_wait
+send_stage_seconds = metrics.histogram(
+    "resu_send_stage_seconds", "Time spent per stage of sending one message",
+    ("stage", "campaign", "host")
+)
+messages_total = metrics.counter(
+    "resu_messages_total", "Send attempts by outcome (Enviado, Error, retry, Validado)",
+    ("campaign", "host", "outcome")
+)
+smtp_errors_total = metrics.counter(
+    "resu_smtp_errors_total", "Failed send attempts by error kind",
+    ("host", "kind")
+)
+
+# --- HTTP ---
+http_requests_total = metrics.counter(
+    "resu_http_requests_total", "HTTP requests by route and status",
+    ("method", "route", "status")
+)
+http_request_seconds = metrics.histogram(
+    "resu_http_request_seconds", "HTTP request latency by route",
+    ("method", "route")
+)
@@ -0,0 +1,177 @@
+import os
+import threading
+import logging
+from collections import OrderedDict
+from email.mime.application import MIMEApplication
+from email.mime.image import MIMEImage
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Upper bound for the base64 payloads kept alive by one campaign
+MAX_CACHE_BYTES = 64 * 1024 * 1024
+# Campaign caches a process keeps at once (spool processes never hear that
+# a campaign ended, so the least recently used one goes)
+MAX_CAMPAIGNS = 4
+# Attachment keys remembered for "second row with the same file" (a campaign
+# of per-row certificates sees one new key per row)
+MAX_SEEN = 10000
+
+
+def build_image_part(cid: str, path: str) -> Optional[MIMEImage]:
+    """Inline image referenced from the HTML as cid:<cid>"""
+    if not os.path.exists(path):
+        logger.warning(f"Image not found: {path}")
+        return None
+    with open(path, "rb") as img:
+        mime_img = MIMEImage(img.read())
+    mime_img.add_header("Content-ID", f"<{cid}>")
+    mime_img.add_header("Content-Disposition", 'inline; filename=""')
+    return mime_img
+
+
+def build_attachment_part(file_path: str) -> Optional[MIMEApplication]:
+    """Attachment part for a file of any extension"""
+    if not os.path.exists(file_path):
+        logger.warning(f"Attachment not found: {file_path}")
+        return None
+    with open(file_path, "rb") as f:
+        ext = os.path.splitext(file_path)[1][1:]  # Remove the dot
+        adj = MIMEApplication(f.read(), _subtype=ext if ext else "octet-stream")
+    adj.add_header(
+        "Content-Disposition",
+        "attachment",
+        filename=os.path.basename(file_path)
+    )
+    return adj
+
+
+def _encoded_size(part) -> int:
+    payload = part.get_payload()
+    return len(payload) if isinstance(payload, (str, bytes)) else 0
+
+
+class CampaignPartCache:
+    """Campaign-scoped cache of encoded MIME parts.
+
+    Inline images are identical for every recipient, so they are read and
+    base64-encoded once and the same part is attached to every message.
+    Attachments are only cached once a second row references the same
+    file, so per-row certificates don't fill the cache. Parts that don't
+    fit in the byte budget are simply built per message.
+    """
+
+    def __init__(self, max_bytes: int = MAX_CACHE_BYTES, max_seen: int = MAX_SEEN):
+        self.max_bytes = max_bytes
+        self.max_seen = max_seen
+        self.size = 0
+        self._parts = {}
+        self._seen = OrderedDict()
+        self._building = {}
+        self._lock = threading.Lock()
+
+    def _key(self, kind: str, path: str, cid: str = ""):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        # A re-uploaded file with the same name must not hit a stale entry
+        return (kind, cid, os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+
+    def _get_or_build(self, key, build, always_cache: bool):
+        if key is None:
+            return build()
+        with self._lock:
+            part = self._parts.get(key)
+            if part is not None:
+                return part
+            cache_it = always_cache or key in self._seen
+            if not cache_it:
+                self._seen[key] = None
+                # Files shared by rows repeat soon; forget the oldest ones
+                while len(self._seen) > self.max_seen:
+                    self._seen.popitem(last=False)
+            if not cache_it:
+                key_lock = None
+            else:
+                key_lock = self._building.setdefault(key, threading.Lock())
+        if key_lock is None:
+            return build()
+        # Concurrent workers wait for the first one instead of encoding again
+        with key_lock:
+            with self._lock:
+                part = self._parts.get(key)
+            if part is not None:
+                return part
+            try:
+                part = build()
+                if part is None:
+                    return None
+                size = _encoded_size(part)
+                with self._lock:
+                    if self.size + size <= self.max_bytes:
+                        self._parts[key] = part
+                        self.size += size
+                return part
+            finally:
+                # Also when the build failed: the next caller tries again
+                with self._lock:
+                    self._building.pop(key, None)
+
+    def image_part(self, cid: str, path: str) -> Optional[MIMEImage]:
+        return self._get_or_build(
+            self._key("image", path, cid), lambda: build_image_part(cid, path), always_cache=True
+        )
+
+    def attachment_part(self, path: str) -> Optional[MIMEApplication]:
+        return self._get_or_build(
+            self._key("attachment", path), lambda: build_attachment_part(path), always_cache=False
+        )
+
+    def clear(self):
+        """Drop every cached part (campaign finished or cleared)"""
+        with self._lock:
+            self._parts.clear()
+            self._seen.clear()
+            self._building.clear()
+            self.size = 0
+
+
+class PartCaches:
+    """One CampaignPartCache per campaign.
+
+    Every campaign gets its own byte budget and its parts are dropped when
+    it ends, so a long campaign never holds on to another one's parts.
+    """
+
+    def __init__(self, max_bytes: int = MAX_CACHE_BYTES, max_campaigns: int = MAX_CAMPAIGNS):
+        self.max_bytes = max_bytes
+        self.max_campaigns = max_campaigns
+        self._caches = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, campaign_id: str) -> CampaignPartCache:
+        with self._lock:
+            cache = self._caches.pop(campaign_id, None) or CampaignPartCache(self.max_bytes)
+            self._caches[campaign_id] = cache
+            # A run keeps its own reference: only the registry forgets it
+            while len(self._caches) > self.max_campaigns:
+                self._caches.popitem(last=False)
+            return cache
+
+    def drop(self, campaign_id: str):
+        """The campaign ended: free its parts"""
+        with self._lock:
+            cache = self._caches.pop(campaign_id, None)
+        if cache is not None:
+            cache.clear()
+
+    def clear(self):
+        with self._lock:
+            caches = list(self._caches.values())
+            self._caches.clear()
+        for cache in caches:
+            cache.clear()
+
+
+part_caches = PartCaches()
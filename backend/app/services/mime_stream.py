@@ -0,0 +1,173 @@
+import base64
+import io
+import mmap
+import os
+import re
+import smtplib
+import uuid
+from email.generator import BytesGenerator
+from email.mime.base import MIMEBase
+from typing import BinaryIO, Dict, Iterator, List, Tuple
+
+# Attachments above this size are streamed from disk instead of being
+# read and base64-encoded in memory (and never go to the part cache)
+STREAM_THRESHOLD = 1024 * 1024
+# Raw bytes encoded per step: a multiple of 57 so every chunk is made of
+# whole 76-character base64 lines (~78 KB of output per step)
+ENCODE_BLOCK = 57 * 1024
+LINE = 76
+# Bytes read per step from a spooled message file
+SPOOL_READ = 64 * 1024
+
+_DOT_LINE = re.compile(rb"(?m)^\.")
+
+
+def should_stream(path: str) -> bool:
+    try:
+        return os.path.getsize(path) > STREAM_THRESHOLD
+    except OSError:
+        return False
+
+
+def streamed_attachment_part(path: str) -> Tuple[MIMEBase, str]:
+    """Attachment part whose body is a placeholder token.
+
+    Headers match build_attachment_part; the token is replaced with the
+    base64 of the file while the message is written out.
+    """
+    ext = os.path.splitext(path)[1][1:]
+    part = MIMEBase("application", ext if ext else "octet-stream")
+    token = f"STREAMED-ATTACHMENT-{uuid.uuid4().hex}"
+    part.set_payload(token)
+    part["Content-Transfer-Encoding"] = "base64"
+    part.add_header("Content-Disposition", "attachment", filename=os.path.basename(path))
+    return part, token
+
+
+def iter_base64_file(path: str) -> Iterator[bytes]:
+    """Base64 lines (CRLF terminated) of a file, one block at a time.
+
+    The file is memory-mapped, so only one block of input and output is
+    held in memory however large the file is.
+    """
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            for start in range(0, size, ENCODE_BLOCK):
+                encoded = base64.b64encode(data[start:start + ENCODE_BLOCK])
+                yield b"".join(encoded[i:i + LINE] + b"\r\n" for i in range(0, len(encoded), LINE))
+
+
+class StreamedMessage:
+    """A MIME message whose large attachments are encoded while it is sent.
+
+    msg is a regular email.message with streamed_attachment_part()
+    placeholders; only that skeleton (headers, HTML, small parts) is
+    flattened in memory.
+    """
+
+    def __init__(self, msg, streamed: Dict[str, str]):
+        self.msg = msg
+        self.streamed = streamed
+        self._skeleton = None
+
+    def skeleton(self) -> bytes:
+        if self._skeleton is None:
+            buffer = io.BytesIO()
+            BytesGenerator(buffer, policy=self.msg.policy.clone(linesep="\r\n")).flatten(self.msg)
+            self._skeleton = buffer.getvalue()
+        return self._skeleton
+
+    def chunks(self, dot_stuff: bool = False) -> Iterator[bytes]:
+        """The message bytes in pieces; dot_stuff for the SMTP DATA phase"""
+        tokens = {token.encode(): path for token, path in self.streamed.items()}
+        if not tokens:
+            segments = [self.skeleton()]
+        else:
+            # Capturing split: the tokens themselves come back as segments
+            pattern = b"(" + b"|".join(re.escape(t) for t in tokens) + b")\r\n"
+            segments = re.split(pattern, self.skeleton())
+        for segment in segments:
+            if segment in tokens:
+                # base64 lines never start with a dot
+                yield from iter_base64_file(tokens[segment])
+            elif segment:
+                yield _DOT_LINE.sub(b"..", segment) if dot_stuff else segment
+
+    def write_to(self, out: BinaryIO) -> int:
+        """Write the message (e.g. to a spool file), return its size"""
+        size = 0
+        for chunk in self.chunks():
+            out.write(chunk)
+            size += len(chunk)
+        return size
+
+
+class SpooledMessage:
+    """A message serialized ahead of time to a file (see message_spool)"""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def chunks(self, dot_stuff: bool = False) -> Iterator[bytes]:
+        at_line_start = True
+        with open(self.path, "rb") as f:
+            for block in iter(lambda: f.read(SPOOL_READ), b""):
+                if dot_stuff:
+                    stuffed = _DOT_LINE.sub(b"..", block)
+                    if block.startswith(b".") and not at_line_start:
+                        # The previous block ended mid-line: not a line start
+                        stuffed = stuffed[1:]
+                    at_line_start = block.endswith(b"\n")
+                    block = stuffed
+                yield block
+
+
+def send_streamed(client: smtplib.SMTP, from_addr: str, to_addrs: List[str], message) -> dict:
+    """smtplib's sendmail(), but the DATA phase is written chunk by chunk.
+
+    message is a StreamedMessage or a SpooledMessage.
+
+    Same error handling as sendmail(): returns the refused recipients and
+    raises SMTPRecipientsRefused when nobody was accepted.
+    """
+    client.ehlo_or_helo_if_needed()
+    code, resp = client.mail(from_addr)
+    if code != 250:
+        if code == 421:
+            client.close()
+        else:
+            client._rset()
+        raise smtplib.SMTPSenderRefused(code, resp, from_addr)
+    refused = {}
+    for addr in to_addrs:
+        code, resp = client.rcpt(addr)
+        if code not in (250, 251):
+            refused[addr] = (code, resp)
+        if code == 421:
+            client.close()
+            raise smtplib.SMTPRecipientsRefused(refused)
+    if len(refused) == len(to_addrs):
+        client._rset()
+        raise smtplib.SMTPRecipientsRefused(refused)
+
+    client.putcmd("data")
+    code, resp = client.getreply()
+    if code != 354:
+        client._rset()
+        raise smtplib.SMTPDataError(code, resp)
+    last = b""
+    for chunk in message.chunks(dot_stuff=True):
+        client.send(chunk)
+        last = chunk
+    client.send(b".\r\n" if last.endswith(b"\r\n") else b"\r\n.\r\n")
+    code, resp = client.getreply()
+    if code != 250:
+        if code == 421:
+            client.close()
+        else:
+            client._rset()
+        raise smtplib.SMTPDataError(code, resp)
+    return refused
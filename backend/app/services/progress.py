@@ -0,0 +1,212 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional, Tuple, Union
+
+from app.services.job_store import job_store, ESTADO_OMITIDO
+
+# Finished campaigns whose buffers stay available for late readers
+KEEP_FINISHED = 10
+# Seconds between job store reads when following a campaign sent elsewhere
+STORE_REFRESH = 1.0
+# Campaign states in which results may still be recorded
+LIVE_STATUSES = ("queued", "running")
+
+
+class ReportBuffer:
+    """Append-only log of per-recipient results for one campaign run.
+
+    Rows are appended in completion order; a reader keeps an offset into
+    the log, so it can reconnect and continue where it left off.
+    """
+
+    def __init__(self, campaign_id: str, total: int, already_processed: int = 0):
+        self.campaign_id = campaign_id
+        self.total = total
+        self.already_processed = already_processed
+        self.rows = []
+        self.sent = 0
+        self.failed = 0
+        self.in_flight = 0
+        self.deferred = 0
+        self.started_at = time.time()
+        self.finished_at = None
+        self.status = "running"
+        self._lock = threading.Lock()
+
+    def add(self, row_index: int, row: Optional[dict]):
+        with self._lock:
+            if row is None:
+                # Skipped row (no address): counts as processed, not reported
+                self.already_processed += 1
+                return
+            self.rows.append(dict(row, fila=row_index))
+            # Dry runs count validated rows as sent
+            if row["estado"] in ("Enviado", "Validado"):
+                self.sent += 1
+            else:
+                self.failed += 1
+
+    def set_pending(self, in_flight: int, deferred: int):
+        self.in_flight = in_flight
+        self.deferred = deferred
+
+    def finish(self, status: str):
+        with self._lock:
+            self.status = status
+            self.in_flight = 0
+            self.deferred = 0
+            self.finished_at = time.time()
+
+    @property
+    def finished(self) -> bool:
+        return self.finished_at is not None
+
+    def read(self, offset: int) -> List[Tuple[int, dict]]:
+        """Rows after offset, each with the offset to continue from after it"""
+        with self._lock:
+            offset = max(0, min(offset, len(self.rows)))
+            return list(enumerate(self.rows[offset:], offset + 1))
+
+    def snapshot(self) -> dict:
+        """Aggregate counters: sent, failed, in flight, throughput and ETA"""
+        with self._lock:
+            done = self.sent + self.failed
+            elapsed = (self.finished_at or time.time()) - self.started_at
+            throughput = done / elapsed if elapsed > 0 else 0.0
+            remaining = max(0, self.total - self.already_processed - done)
+            eta = remaining / throughput if throughput > 0 and not self.finished else None
+            return {
+                "campaign_id": self.campaign_id,
+                "status": self.status,
+                "total": self.total,
+                "processed": self.already_processed + done,
+                "sent": self.sent,
+                "failed": self.failed,
+                "in_flight": self.in_flight,
+                "deferred": self.deferred,
+                "offset": len(self.rows),
+                "elapsed": round(elapsed, 1),
+                "throughput": round(throughput, 2),
+                "eta": round(eta, 1) if eta is not None else None,
+            }
+
+
+class StoredProgress:
+    """Progress of a campaign sent by another process, read from the job store.
+
+    Used when the campaign is not sent here (send workers, another uvicorn
+    worker). Same interface as ReportBuffer; offsets are positions in the
+    deliveries table instead of indexes in memory, in-flight/deferred
+    counts aren't known, and throughput is measured from the first read.
+    """
+
+    def __init__(self, campaign_id: str, total: int, refresh: float = STORE_REFRESH):
+        self.campaign_id = campaign_id
+        self.total = total
+        self.refresh = refresh
+        self.status = "queued"
+        self.processed = 0
+        self.sent = 0
+        self.failed = 0
+        self.position = 0
+        self.started_at = time.time()
+        self._baseline = None
+        self._read_at = 0.0
+        self._lock = threading.Lock()
+
+    def _update(self):
+        """Re-read status and counters, at most once per refresh interval"""
+        now = time.monotonic()
+        if now - self._read_at < self.refresh:
+            return
+        self._read_at = now
+        campaign = job_store.get_campaign(self.campaign_id)
+        counts, self.position = job_store.delivery_progress(self.campaign_id)
+        self.status = campaign["status"] if campaign else "failed"
+        self.processed = sum(counts.values())
+        # Dry runs count validated rows as sent
+        self.sent = counts.get("Enviado", 0) + counts.get("Validado", 0)
+        self.failed = self.processed - self.sent - counts.get(ESTADO_OMITIDO, 0)
+        if self._baseline is None:
+            self._baseline = self.processed
+
+    @property
+    def finished(self) -> bool:
+        with self._lock:
+            self._update()
+            return self.status not in LIVE_STATUSES
+
+    def read(self, offset: int) -> List[Tuple[int, dict]]:
+        """Rows recorded after offset (one page), each with the offset to continue from after it"""
+        return [(position, dict(row, fila=row_index))
+                for position, row_index, row in job_store.deliveries_since(self.campaign_id, offset)
+                if row["estado"] != ESTADO_OMITIDO]
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            self._update()
+            elapsed = time.time() - self.started_at
+            throughput = (self.processed - self._baseline) / elapsed if elapsed > 0 else 0.0
+            remaining = max(0, self.total - self.processed)
+            live = self.status in LIVE_STATUSES
+            eta = remaining / throughput if throughput > 0 and live else None
+            return {
+                "campaign_id": self.campaign_id,
+                "status": self.status,
+                "total": self.total,
+                "processed": self.processed,
+                "sent": self.sent,
+                "failed": self.failed,
+                "in_flight": None,
+                "deferred": None,
+                "offset": self.position,
+                "elapsed": round(elapsed, 1),
+                "throughput": round(throughput, 2),
+                "eta": round(eta, 1) if eta is not None else None,
+            }
+
+
+class ProgressHub:
+    """Report buffers by campaign id (running ones plus a few finished)"""
+
+    def __init__(self, keep_finished: int = KEEP_FINISHED):
+        self.keep_finished = keep_finished
+        self._buffers = OrderedDict()
+        self._stored = OrderedDict()
+        self._lock = threading.Lock()
+
+    def start(self, campaign_id: str, total: int, already_processed: int = 0) -> ReportBuffer:
+        buffer = ReportBuffer(campaign_id, total, already_processed)
+        with self._lock:
+            self._buffers.pop(campaign_id, None)
+            self._buffers[campaign_id] = buffer
+            finished = [cid for cid, b in self._buffers.items() if b.finished]
+            for cid in finished[:max(0, len(finished) - self.keep_finished)]:
+                del self._buffers[cid]
+        return buffer
+
+    def get(self, campaign_id: str) -> Optional[ReportBuffer]:
+        with self._lock:
+            return self._buffers.get(campaign_id)
+
+    def watch(self, campaign_id: str) -> Optional[Union[ReportBuffer, StoredProgress]]:
+        """The live buffer of a campaign sent by this process, otherwise its
+        progress as recorded in the job store (None if there is no such campaign)"""
+        buffer = self.get(campaign_id)
+        if buffer is not None:
+            return buffer
+        with self._lock:
+            stored = self._stored.get(campaign_id)
+        if stored is None:
+            campaign = job_store.get_campaign(campaign_id)
+            if campaign is None:
+                return None
+            with self._lock:
+                stored = self._stored.setdefault(campaign_id, StoredProgress(campaign_id, campaign["total"]))
+                while len(self._stored) > self.keep_finished:
+                    self._stored.popitem(last=False)
+        return stored
+
+
+progress_hub = ProgressHub()
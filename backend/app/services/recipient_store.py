@@ -0,0 +1,204 @@
+import codecs
+import csv
+import os
+import logging
+from itertools import islice
+from typing import Iterator, List, Optional, Tuple
+
+from app.services.recipient_validation import EMAIL_COLUMNS, DomainResolver, validate_recipients
+
+logger = logging.getLogger(__name__)
+
+# Rows are read and appended in chunks of this size
+CHUNK_SIZE = 1000
+# Bytes of a CSV read to guess its encoding and delimiter
+SNIFF_BYTES = 64 * 1024
+
+
+class RecipientTable:
+    """Recipients stored column by column.
+
+    One list per column instead of one dict per row keeps large sheets
+    compact. Rows are materialized as dicts only when iterated or indexed.
+    """
+
+    def __init__(self, columns: List[str] = None):
+        self.columns = list(columns or [])
+        self._data = [[] for _ in self.columns]
+        self._count = 0
+        # Sheet row number of each recipient (blank lines are dropped)
+        self.row_numbers = []
+
+    def append_rows(self, rows: List[tuple], row_numbers: Optional[List[int]] = None):
+        width = len(self.columns)
+        for row in rows:
+            for j in range(width):
+                self._data[j].append(row[j] if j < len(row) else None)
+        if row_numbers is None:
+            row_numbers = range(self._count + 2, self._count + 2 + len(rows))
+        self.row_numbers.extend(row_numbers)
+        self._count += len(rows)
+
+    def column(self, name: str) -> list:
+        return self._data[self.columns.index(name)]
+
+    def replace_column(self, name: str, values: list):
+        if len(values) != self._count:
+            raise ValueError(f"Column {name} needs {self._count} values, got {len(values)}")
+        self._data[self.columns.index(name)] = values
+
+    def email_column(self) -> Optional[str]:
+        for name in EMAIL_COLUMNS:
+            if name in self.columns:
+                return name
+        return None
+
+    def row(self, i: int) -> dict:
+        return {name: self._data[j][i] for j, name in enumerate(self.columns)}
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, i: int) -> dict:
+        if i < 0:
+            i += self._count
+        if not 0 <= i < self._count:
+            raise IndexError(i)
+        return self.row(i)
+
+    def __iter__(self) -> Iterator[dict]:
+        for i in range(self._count):
+            yield self.row(i)
+
+    def preview(self, n: int = 5) -> List[dict]:
+        return [self.row(i) for i in range(min(n, self._count))]
+
+
+def _normalize_header(header) -> List[str]:
+    columns = []
+    for j, name in enumerate(header):
+        name = str(name).strip() if name is not None else ""
+        # Same naming pandas used for blank headers
+        columns.append(name or f"Unnamed: {j}")
+    return columns
+
+
+def _normalize_cell(value):
+    if isinstance(value, str):
+        value = value.strip()
+        return value or None
+    return value
+
+
+def _chunks(rows, chunk_size: int) -> Iterator[List[tuple]]:
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _excel_rows(path: str) -> Tuple[list, Iterator[tuple]]:
+    from openpyxl import load_workbook
+
+    # read_only streams the sheet XML instead of building every cell object
+    wb = load_workbook(path, read_only=True, data_only=True)
+    ws = wb.worksheets[0]
+    rows = ws.iter_rows(values_only=True)
+    header = next(rows, None) or ()
+
+    def body():
+        try:
+            yield from rows
+        finally:
+            wb.close()
+
+    return list(header), body()
+
+
+def _csv_rows(path: str) -> Tuple[list, Iterator[tuple]]:
+    # Excel on Windows exports CSV as cp1252 and often with ';'
+    encoding = "utf-8-sig"
+    with open(path, "rb") as f:
+        sample = f.read(SNIFF_BYTES)
+    try:
+        # Not final unless the sample is the whole file: the cut may split
+        # a multi-byte character, which is not an encoding error
+        decoder = codecs.getincrementaldecoder(encoding)()
+        sample_text = decoder.decode(sample, final=len(sample) < SNIFF_BYTES)
+    except UnicodeDecodeError:
+        # cp1252 leaves 5 bytes undefined; latin-1 decodes anything (but
+        # would turn cp1252's €, “ ” and – into control characters)
+        try:
+            encoding = "cp1252"
+            sample_text = sample.decode(encoding)
+        except UnicodeDecodeError:
+            encoding = "latin-1"
+            sample_text = sample.decode(encoding)
+    try:
+        dialect = csv.Sniffer().sniff(sample_text, delimiters=",;\t|")
+    except csv.Error:
+        dialect = csv.excel
+
+    f = open(path, newline="", encoding=encoding)
+    reader = csv.reader(f, dialect)
+    header = next(reader, None) or []
+
+    def body():
+        try:
+            for row in reader:
+                yield tuple(row)
+        finally:
+            f.close()
+
+    return header, body()
+
+
+def _pandas_rows(path: str) -> Tuple[list, Iterator[tuple]]:
+    # Legacy .xls and other formats openpyxl can't stream
+    import pandas as pd
+
+    df = pd.read_excel(path)
+    df = df.astype(object).where(df.notna(), None)
+    return list(df.columns), df.itertuples(index=False, name=None)
+
+
+def load_recipients(path: str, chunk_size: int = CHUNK_SIZE,
+                    resolver: Optional[DomainResolver] = None) -> Tuple[RecipientTable, dict]:
+    """Stream a recipients sheet into a RecipientTable.
+
+    Returns the table and the validation summary (invalid and duplicate
+    addresses, domains), see validate_recipients.
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext in (".xlsx", ".xlsm"):
+        header, rows = _excel_rows(path)
+    elif ext in (".csv", ".txt"):
+        header, rows = _csv_rows(path)
+    else:
+        header, rows = _pandas_rows(path)
+
+    table = RecipientTable(_normalize_header(header))
+    email_col = table.email_column()
+
+    row_number = 1  # Header is row 1, like in Excel
+    for chunk in _chunks(rows, chunk_size):
+        clean = []
+        numbers = []
+        for raw in chunk:
+            row_number += 1
+            row = tuple(_normalize_cell(v) for v in raw)
+            if not any(v is not None for v in row):
+                continue  # Blank line
+            clean.append(row)
+            numbers.append(row_number)
+        table.append_rows(clean, numbers)
+
+    if email_col is None:
+        logger.warning(f"No email column ({', '.join(EMAIL_COLUMNS)}) found in {path}")
+
+    # Validation runs over the whole address column once the sheet is read
+    summary = validate_recipients(table, resolver)
+    summary.update({"columns": table.columns, "email_column": email_col})
+    return table, summary
@@ -0,0 +1,216 @@
+import logging
+import threading
+from collections import Counter
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from app.services.email_service import EMAIL_RE
+
+logger = logging.getLogger(__name__)
+
+# Columns the send loop looks at for the address, in order
+EMAIL_COLUMNS = ("Correo", "Email", "correo")
+# Rows listed per problem kind in the upload response (counts are exact)
+MAX_REPORTED = 50
+# Domains listed in the upload summary
+TOP_DOMAINS = 20
+
+# Report values for rows that are never sent
+ESTADO_ERROR = "Error"
+ESTADO_DUPLICADO = "Duplicado"
+MOTIVO_FORMATO = "Correo invalido"
+MOTIVO_VACIO = "Sin correo"
+MOTIVO_DOMINIO = "Dominio sin servidor de correo"
+
+
+def recipient_email(recipient: dict):
+    """Address a row is sent to: the first non-empty of EMAIL_COLUMNS"""
+    for name in EMAIL_COLUMNS:
+        value = recipient.get(name)
+        if value:
+            return value
+    return None
+
+
+def normalize_email(value) -> Optional[str]:
+    """Strip whitespace, mailto: and <...>, and lowercase the domain"""
+    if value is None:
+        return None
+    email = str(value).strip()
+    if email.lower().startswith("mailto:"):
+        email = email[7:]
+    email = email.strip().strip("<>").strip()
+    if not email:
+        return None
+    local, at, domain = email.rpartition("@")
+    if not at:
+        return email
+    return f"{local}@{domain.lower()}"
+
+
+class DomainResolver:
+    """Maps a recipient domain to the mail server that receives its mail.
+
+    The base resolver never touches the network: each domain is its own
+    group. Subclasses return None for domains that can't receive mail.
+    """
+
+    def resolve(self, domain: str) -> Optional[str]:
+        return domain
+
+
+class StaticResolver(DomainResolver):
+    """Fixed domain -> mail server table (offline tests and known domains)"""
+
+    def __init__(self, mapping: Dict[str, Optional[str]], default_to_domain: bool = True):
+        self.mapping = {k.lower(): v for k, v in mapping.items()}
+        self.default_to_domain = default_to_domain
+
+    def resolve(self, domain: str) -> Optional[str]:
+        if domain in self.mapping:
+            return self.mapping[domain]
+        return domain if self.default_to_domain else None
+
+
+class MXResolver(DomainResolver):
+    """Looks up the preferred MX host of each domain (dnspython, optional).
+
+    Domains sharing a provider (e.g. institutional domains hosted by
+    Google) end up in the same group. Without dnspython, or when DNS
+    can't be reached, domains are kept as their own group.
+    """
+
+    def __init__(self, timeout: float = 3.0):
+        self.timeout = timeout
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def resolve(self, domain: str) -> Optional[str]:
+        with self._lock:
+            if domain in self._cache:
+                return self._cache[domain]
+        try:
+            import dns.resolver
+        except ImportError:
+            return domain
+        try:
+            answers = dns.resolver.resolve(domain, "MX", lifetime=self.timeout)
+            records = sorted(answers, key=lambda r: r.preference)
+            host = str(records[0].exchange).rstrip(".").lower() if records else None
+            # "Null MX" (RFC 7505): the domain explicitly accepts no mail
+            if host == "":
+                host = None
+        except (dns.resolver.NXDOMAIN, dns.resolver.NoNameservers):
+            host = None
+        except dns.resolver.NoAnswer:
+            # No MX record: mail goes to the domain itself (RFC 5321)
+            host = domain
+        except Exception as e:
+            logger.warning(f"MX lookup failed for {domain}: {e}")
+            return domain
+        with self._lock:
+            self._cache[domain] = host
+        return host
+
+
+def validate_recipients(table, resolver: Optional[DomainResolver] = None,
+                        max_reported: int = MAX_REPORTED) -> dict:
+    """Normalize, validate and deduplicate the addresses of a table.
+
+    Every address column is normalized in the table itself, then each row
+    is checked with the address the send loop will use (see
+    recipient_email). Returns a summary for the upload response plus "skip":
+    {row index: (estado, detalle)} for rows that must not be sent
+    (invalid or repeated addresses). Rows are not removed, so row i still
+    gets attachment i.
+    """
+    resolver = resolver or DomainResolver()
+    columns = [name for name in EMAIL_COLUMNS if name in table.columns]
+    summary = {
+        "valid_count": 0,
+        "invalid_count": 0,
+        "invalid": [],
+        "duplicate_count": 0,
+        "duplicates": [],
+        "domains": [],
+        "mail_servers": [],
+        "skip": {},
+    }
+    if not columns:
+        return summary
+
+    for name in columns:
+        table.replace_column(name, [normalize_email(v) for v in table.column(name)])
+    # Per row, the first address column that is not empty
+    emails = [next((v for v in values if v), None) for values in zip(*(table.column(name) for name in columns))]
+    valid = [email is not None and EMAIL_RE.match(email) is not None for email in emails]
+
+    skip = summary["skip"]
+    row_numbers = table.row_numbers
+
+    def reject(i: int, motivo: str):
+        skip[i] = (ESTADO_ERROR, motivo)
+        summary["invalid_count"] += 1
+        if len(summary["invalid"]) < max_reported:
+            summary["invalid"].append({"fila": row_numbers[i], "correo": emails[i], "motivo": motivo})
+
+    first_seen = {}
+    domains = Counter()
+    for i, email in enumerate(emails):
+        if not valid[i]:
+            reject(i, MOTIVO_VACIO if email is None else MOTIVO_FORMATO)
+            continue
+        key = email.lower()
+        first = first_seen.setdefault(key, i)
+        if first != i:
+            skip[i] = (ESTADO_DUPLICADO, f"Duplicado de la fila {row_numbers[first]}")
+            summary["duplicate_count"] += 1
+            if len(summary["duplicates"]) < max_reported:
+                summary["duplicates"].append(
+                    {"fila": row_numbers[i], "correo": email, "duplicado_de": row_numbers[first]}
+                )
+            continue
+        domains[email.rsplit("@", 1)[1]] += 1
+
+    # One lookup per distinct domain, not per row
+    servers = Counter()
+    undeliverable = set()
+    for domain, count in domains.items():
+        server = resolver.resolve(domain)
+        if server is None:
+            undeliverable.add(domain)
+        else:
+            servers[server] += count
+    if undeliverable:
+        for i, email in enumerate(emails):
+            if i not in skip and email.rsplit("@", 1)[1] in undeliverable:
+                reject(i, MOTIVO_DOMINIO)
+        for domain in undeliverable:
+            del domains[domain]
+
+    summary["valid_count"] = len(emails) - len(skip)
+    summary["domains"] = [{"dominio": d, "total": n} for d, n in domains.most_common(TOP_DOMAINS)]
+    summary["mail_servers"] = [{"servidor": s, "total": n} for s, n in servers.most_common(TOP_DOMAINS)]
+    return summary
+
+
+def skipped_report_rows(table, skip: Dict[int, tuple]) -> List[tuple]:
+    """(row index, report row) for rows validation decided not to send"""
+    now = datetime.now()
+    rows = []
+    for i, (estado, detalle) in sorted(skip.items()):
+        recipient = table[i]
+        rows.append((i, {
+            "correo": recipient_email(recipient),
+            "nombre": recipient.get("Nombre") or recipient.get("nombre") or "N/A",
+            "estado": estado,
+            "fecha": now.strftime("%Y-%m-%d"),
+            "hora": now.strftime("%H:%M:%S"),
+            "intentos": 0,
+            "duracion": 0,
+            "adjunto1": "",
+            "adjunto2": "",
+            "detalle": detalle,
+            "remitente": "",
+        }))
+    return rows
@@ -0,0 +1,85 @@
+import csv
+import io
+import os
+import tempfile
+from datetime import datetime
+from typing import Iterable, Iterator
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font
+
+from app.services.job_store import REPORT_COLUMNS
+
+SHEET_TITLE = "Reporte de Envíos"
+
+# Column titles, same as the reporte_envios_*.xlsx files
+HEADERS = {
+    "correo": "Correo",
+    "nombre": "Nombre",
+    "estado": "Estado",
+    "fecha": "Fecha",
+    "hora": "Hora",
+    "intentos": "Intentos",
+    "duracion": "Duración (s)",
+    "adjunto1": "Archivo Adjunto 1",
+    "adjunto2": "Archivo Adjunto 2",
+    "detalle": "Detalle",
+    "remitente": "Remitente",
+    "descargas": "Descargas",
+    "ultima_descarga": "Última descarga",
+}
+# Rows buffered before a CSV chunk is handed to the response
+CSV_CHUNK_ROWS = 500
+
+
+def iter_csv(rows: Iterable[dict]) -> Iterator[str]:
+    """CSV text in chunks, so a large report never sits in memory at once"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    # BOM so Excel opens accents correctly
+    buffer.write("\ufeff")
+    writer.writerow([HEADERS[f] for f in REPORT_COLUMNS])
+    pending = 0
+    for row in rows:
+        writer.writerow(["" if row.get(f) is None else row.get(f) for f in REPORT_COLUMNS])
+        pending += 1
+        if pending >= CSV_CHUNK_ROWS:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    yield buffer.getvalue()
+
+
+def xlsx_filename(name: str) -> str:
+    """Download name of an Excel export: reporte_envios_<name>_<timestamp>.xlsx"""
+    return f"reporte_envios_{name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
+
+
+def write_xlsx(rows: Iterable[dict]) -> str:
+    """Write the report to a temporary file and return its path.
+
+    The caller deletes the file once it has been sent. Uses openpyxl's
+    write-only mode: rows go to disk as they are read instead of building
+    the whole workbook in memory.
+    """
+    fd, path = tempfile.mkstemp(prefix="reporte_envios_", suffix=".xlsx")
+    os.close(fd)
+    try:
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet(SHEET_TITLE)
+        ws.append([_bold(ws, HEADERS[f]) for f in REPORT_COLUMNS])
+        for row in rows:
+            ws.append([row.get(f) for f in REPORT_COLUMNS])
+        wb.save(path)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path
+
+
+def _bold(ws, value: str) -> WriteOnlyCell:
+    cell = WriteOnlyCell(ws, value=value)
+    cell.font = Font(bold=True)
+    return cell
@@ -0,0 +1,112 @@
+import random
+import smtplib
+import socket
+from typing import Optional
+
+# Error kinds, from the point of view of "should we try this row again"
+AUTH = "auth"              # Bad credentials: every row will fail the same way
+PERMANENT = "permanent"    # 5xx for this message/recipient: retrying won't help
+TRANSIENT = "transient"    # 4xx: greylisting, throttling, mailbox busy
+NETWORK = "network"        # Dropped connection, timeout, DNS
+
+RETRYABLE = (TRANSIENT, NETWORK)
+
+# 530 auth required, 534 web login required (Gmail), 535 bad credentials
+AUTH_CODES = (530, 534, 535)
+
+# Raised by the network, not by the message: worth another attempt
+NETWORK_ERRORS = (smtplib.SMTPServerDisconnected, ConnectionError, TimeoutError, socket.gaierror)
+# Raised while reading attachments from disk, before any SMTP traffic
+LOCAL_FILE_ERRORS = (FileNotFoundError, PermissionError, IsADirectoryError, NotADirectoryError)
+
+
+def _kind_for_code(code: Optional[int]) -> str:
+    if code is None:
+        return PERMANENT
+    if code in AUTH_CODES:
+        return AUTH
+    if 400 <= code < 500:
+        return TRANSIENT
+    return PERMANENT
+
+
+def classify_error(exc: Optional[BaseException]) -> str:
+    """Map an exception raised while sending to one of the error kinds.
+
+    None means send_email refused the message without raising (invalid
+    address), which is permanent.
+    """
+    if exc is None:
+        return PERMANENT
+    if isinstance(exc, smtplib.SMTPAuthenticationError):
+        return AUTH
+    if isinstance(exc, smtplib.SMTPRecipientsRefused):
+        codes = [code for code, _ in exc.recipients.values()]
+        # Retry only if nobody was refused permanently
+        if codes and all(400 <= code < 500 for code in codes):
+            return TRANSIENT
+        return PERMANENT
+    if isinstance(exc, smtplib.SMTPResponseException):
+        return _kind_for_code(exc.smtp_code)
+    if isinstance(exc, NETWORK_ERRORS):
+        return NETWORK
+    # Anything else (unreadable attachment, unsupported extension...) will
+    # fail again the same way
+    return PERMANENT
+
+
+def describe_error(exc: Optional[BaseException]) -> str:
+    """Short text for the report"""
+    if exc is None:
+        return "Correo invalido"
+    if isinstance(exc, smtplib.SMTPResponseException):
+        message = exc.smtp_error.decode("utf-8", "replace") if isinstance(exc.smtp_error, bytes) else str(exc.smtp_error)
+        return f"{exc.smtp_code} {message}"[:200]
+    if isinstance(exc, smtplib.SMTPRecipientsRefused) and len(exc.recipients) == 1:
+        # RCPT TO reply for this one recipient
+        code, message = next(iter(exc.recipients.values()))
+        message = message.decode("utf-8", "replace") if isinstance(message, bytes) else str(message)
+        return f"{code} {message}"[:200]
+    return f"{type(exc).__name__}: {exc}"[:200]
+
+
+def not_accepted(exc: Optional[BaseException]) -> bool:
+    """True when a failed send provably never reached the provider's DATA
+    phase, so it can't have counted against the sender's daily quota.
+
+    Connection and login failures, MAIL FROM/RCPT TO rejections and
+    messages that couldn't even be built qualify. A reply to DATA, a
+    dropped connection or a timeout may come after the provider took the
+    message, so they don't.
+    """
+    if exc is None:
+        # Invalid address: refused before any SMTP traffic
+        return True
+    if isinstance(exc, (smtplib.SMTPAuthenticationError, smtplib.SMTPRecipientsRefused,
+                        smtplib.SMTPSenderRefused, smtplib.SMTPConnectError, smtplib.SMTPHeloError)):
+        return True
+    if isinstance(exc, (socket.gaierror, ConnectionRefusedError)):
+        return True
+    # Failed while building the message (e.g. missing attachment)
+    return isinstance(exc, LOCAL_FILE_ERRORS) or not isinstance(exc, (smtplib.SMTPException, OSError))
+
+
+class RetryPolicy:
+    """Exponential backoff with jitter for transient and network errors"""
+
+    def __init__(self, max_attempts: int = 4, base_delay: float = 2, max_delay: float = 120):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def should_retry(self, kind: str, attempts: int) -> bool:
+        return kind in RETRYABLE and attempts < self.max_attempts
+
+    def delay(self, attempts: int) -> float:
+        """Seconds to wait after the given number of failed attempts"""
+        backoff = min(self.max_delay, self.base_delay * (2 ** (attempts - 1)))
+        # "Equal jitter": never retry immediately, but spread retries out
+        return backoff / 2 + random.uniform(0, backoff / 2)
+
+
+retry_policy = RetryPolicy()
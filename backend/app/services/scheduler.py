@@ -0,0 +1,319 @@
+import threading
+import time
+import logging
+from collections import deque
+from contextlib import contextmanager
+from datetime import date
+from typing import Optional
+
+from app.services.job_store import job_store, STALE_AFTER
+
+logger = logging.getLogger("uvicorn")
+
+# Campaigns sending at the same time; the rest wait in FIFO order
+MAX_ACTIVE_CAMPAIGNS = 4
+# In-flight SMTP transactions across all active campaigns
+WORKER_CAPACITY = 16
+# How often the job store rows of running and queued campaigns are touched,
+# so another process never takes them for orphaned (JobStore.claim)
+HEARTBEAT_INTERVAL = STALE_AFTER / 4
+
+# Per SMTP host defaults, only applied to campaigns that opt in
+# (provider_limits). sender_rate/daily_quota apply to each sender account,
+# host_rate to everything this server sends to that host.
+HOST_LIMITS = {
+    "smtp.gmail.com": {"sender_rate": 60, "host_rate": 240, "daily_quota": 500},
+    "smtp-mail.outlook.com": {"sender_rate": 30, "host_rate": 120, "daily_quota": 300},
+    "smtp.mail.yahoo.com": {"sender_rate": 30, "host_rate": 120, "daily_quota": 500},
+}
+DEFAULT_LIMITS = {"sender_rate": 60, "host_rate": 240, "daily_quota": None}
+# Without provider_limits only the campaign's own rate_per_minute/daily_quota apply
+NO_LIMITS = {"sender_rate": None, "host_rate": None, "daily_quota": None}
+
+# Replies that mean "slow down" rather than "this message is wrong"
+THROTTLE_CODES = (421, 450, 451, 452)
+
+
+class QuotaExceeded(Exception):
+    """The sender account used up its daily quota"""
+
+
+class TokenBucket:
+    """Token bucket with adaptive rate (messages per minute).
+
+    reserve() never blocks: it takes a token and returns how long the
+    caller has to wait before using it. Throttling replies halve the
+    rate, successful sends bring it back up step by step.
+    """
+
+    def __init__(self, rate_per_minute: float, min_rate_per_minute: float = 1):
+        self.base_rate = rate_per_minute / 60
+        self.min_rate = min_rate_per_minute / 60
+        self.rate = self.base_rate
+        # Allow a burst of about five seconds worth of messages
+        self.capacity = max(1.0, self.base_rate * 5)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, count: int = 1) -> float:
+        with self._lock:
+            self._refill(time.monotonic())
+            self.tokens -= count
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+    def penalize(self):
+        with self._lock:
+            self._refill(time.monotonic())
+            self.rate = max(self.min_rate, self.rate / 2)
+            # Drop the burst so the lower rate applies right away
+            self.tokens = min(self.tokens, 0.0)
+
+    def reward(self):
+        with self._lock:
+            if self.rate < self.base_rate:
+                self.rate = min(self.base_rate, self.rate + self.base_rate * 0.05)
+
+    @property
+    def rate_per_minute(self) -> float:
+        return round(self.rate * 60, 2)
+
+
+class DailyQuota:
+    """Messages a sender account may send per calendar day (None = no limit)"""
+
+    def __init__(self, limit: Optional[int], used: int = 0):
+        self.limit = limit
+        self.used = used
+        self.day = date.today()
+        self._lock = threading.Lock()
+
+    def try_consume(self, count: int = 1) -> bool:
+        with self._lock:
+            today = date.today()
+            if today != self.day:
+                self.day, self.used = today, 0
+            if self.limit and self.used + count > self.limit:
+                return False
+            self.used += count
+            return True
+
+    def refund(self, count: int = 1):
+        with self._lock:
+            self.used = max(0, self.used - count)
+
+
+class FairShareLimiter:
+    """Splits worker capacity evenly between the active campaigns"""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.in_flight = {}
+        self.total = 0
+        self._cond = threading.Condition()
+
+    def _share(self) -> int:
+        return max(1, self.capacity // max(1, len(self.in_flight)))
+
+    def register(self, campaign_id: str):
+        with self._cond:
+            self.in_flight.setdefault(campaign_id, 0)
+            self._cond.notify_all()
+
+    def unregister(self, campaign_id: str):
+        with self._cond:
+            self.in_flight.pop(campaign_id, None)
+            self._cond.notify_all()
+
+    def acquire(self, campaign_id: str):
+        with self._cond:
+            self.in_flight.setdefault(campaign_id, 0)
+            while self.total >= self.capacity or self.in_flight[campaign_id] >= self._share():
+                self._cond.wait()
+            self.in_flight[campaign_id] += 1
+            self.total += 1
+
+    def release(self, campaign_id: str):
+        with self._cond:
+            if campaign_id in self.in_flight:
+                self.in_flight[campaign_id] -= 1
+            self.total -= 1
+            self._cond.notify_all()
+
+
+class CampaignScheduler:
+    """Queues campaigns by id and throttles their SMTP traffic.
+
+    Up to max_active campaigns run at once, each in its own thread. Every
+    send goes through slot(), which enforces the fair share of worker
+    capacity, the sender and host token buckets and the sender's daily
+    quota. While it has campaigns, a heartbeat thread keeps their job
+    store rows fresh: a slow campaign (low rate, long retry backoff)
+    records results rarely, but must not look orphaned.
+    """
+
+    def __init__(self, max_active: int = MAX_ACTIVE_CAMPAIGNS, capacity: int = WORKER_CAPACITY,
+                 heartbeat_interval: float = HEARTBEAT_INTERVAL):
+        self.max_active = max_active
+        self.heartbeat_interval = heartbeat_interval
+        self._heartbeat = None
+        self.fair_share = FairShareLimiter(capacity)
+        self.queue = deque()
+        self.active = {}
+        self.sender_buckets = {}
+        self.host_buckets = {}
+        # Senders whose traffic counts against their host's bucket
+        self.host_limited = set()
+        self.quotas = {}
+        self._lock = threading.Lock()
+
+    # --- Campaign queue ---
+    def submit(self, campaign_id: str, fn, *args):
+        """Queue a campaign; fn(*args) runs once a slot is free"""
+        with self._lock:
+            self.queue.append((campaign_id, fn, args))
+            if self._heartbeat is None:
+                self._heartbeat = threading.Thread(target=self._beat, name="campaign-heartbeat", daemon=True)
+                self._heartbeat.start()
+        logger.info(f"Campaign {campaign_id} queued")
+        self._start_next()
+
+    def _start_next(self):
+        with self._lock:
+            while self.queue and len(self.active) < self.max_active:
+                campaign_id, fn, args = self.queue.popleft()
+                thread = threading.Thread(
+                    target=self._run, args=(campaign_id, fn, args),
+                    name=f"campaign-{campaign_id}", daemon=True
+                )
+                self.active[campaign_id] = thread
+                thread.start()
+
+    def _run(self, campaign_id: str, fn, args):
+        self.fair_share.register(campaign_id)
+        try:
+            fn(*args)
+        except Exception as e:
+            logger.error(f"Campaign {campaign_id} crashed: {e}")
+        finally:
+            self.fair_share.unregister(campaign_id)
+            with self._lock:
+                self.active.pop(campaign_id, None)
+            self._start_next()
+
+    def _beat(self):
+        """Touch our campaigns' rows until there are none left"""
+        while True:
+            time.sleep(self.heartbeat_interval)
+            with self._lock:
+                campaign_ids = list(self.active) + [c for c, _, _ in self.queue]
+                if not campaign_ids:
+                    self._heartbeat = None
+                    return
+            try:
+                job_store.touch(campaign_ids)
+            except Exception as e:
+                # e.g. database locked for too long: try again next round
+                logger.warning(f"Could not refresh running campaigns: {e}")
+
+    def is_scheduled(self, campaign_id: str) -> bool:
+        with self._lock:
+            return campaign_id in self.active or any(c == campaign_id for c, _, _ in self.queue)
+
+    def status(self) -> dict:
+        with self._lock:
+            return {
+                "active": list(self.active),
+                "queued": [c for c, _, _ in self.queue],
+                "senders": {k: b.rate_per_minute for k, b in self.sender_buckets.items()},
+                "hosts": {k: b.rate_per_minute for k, b in self.host_buckets.items()},
+                "quotas": {k: {"used": q.used, "limit": q.limit} for k, q in self.quotas.items()},
+            }
+
+    # --- Rate limits ---
+    def configure_sender(self, sender_email: str, smtp_host: str, rate_per_minute: Optional[int] = None,
+                         daily_quota: Optional[int] = None, sent_today: int = 0, provider_limits: bool = False):
+        """Create (or retune) the bucket and quota of a sender account.
+
+        provider_limits fills in what isn't set from HOST_LIMITS (rate and
+        daily quota of the provider, plus the shared host rate).
+        """
+        limits = HOST_LIMITS.get(smtp_host, DEFAULT_LIMITS) if provider_limits else NO_LIMITS
+        sender_rate = rate_per_minute or limits["sender_rate"]
+        quota = limits["daily_quota"] if daily_quota is None else (daily_quota or None)
+        with self._lock:
+            bucket = self.sender_buckets.get(sender_email)
+            if not sender_rate:
+                self.sender_buckets.pop(sender_email, None)
+            elif bucket is None or bucket.base_rate != sender_rate / 60:
+                self.sender_buckets[sender_email] = TokenBucket(sender_rate)
+            if limits["host_rate"]:
+                self.host_limited.add(sender_email)
+                if smtp_host not in self.host_buckets:
+                    self.host_buckets[smtp_host] = TokenBucket(limits["host_rate"])
+            else:
+                self.host_limited.discard(sender_email)
+            current = self.quotas.get(sender_email)
+            used = max(sent_today, current.used) if current else sent_today
+            self.quotas[sender_email] = DailyQuota(quota, used)
+
+    @contextmanager
+    def slot(self, campaign_id: str, sender_email: str, smtp_host: str, recipients: int = 1):
+        """Wait for capacity and rate limit tokens, then send inside the block.
+
+        Providers count recipients, not transactions: a batch message to
+        N recipients takes N tokens and N units of quota. Raises
+        QuotaExceeded when the sender has not enough daily quota left.
+        """
+        quota = self.quotas.get(sender_email)
+        if quota is not None and not quota.try_consume(recipients):
+            raise QuotaExceeded(f"Daily quota reached for {sender_email}")
+        waits = [0.0]
+        for bucket in self._buckets(sender_email, smtp_host):
+            if bucket is not None:
+                waits.append(bucket.reserve(recipients))
+        wait = max(waits)
+        if wait > 0:
+            time.sleep(wait)
+        self.fair_share.acquire(campaign_id)
+        try:
+            yield
+        finally:
+            self.fair_share.release(campaign_id)
+
+    def _buckets(self, sender_email: str, smtp_host: str) -> tuple:
+        host_bucket = self.host_buckets.get(smtp_host) if sender_email in self.host_limited else None
+        return self.sender_buckets.get(sender_email), host_bucket
+
+    def record_result(self, sender_email: str, smtp_host: str, success: bool, smtp_code: Optional[int] = None,
+                      recipients: int = 1, refund: bool = False):
+        """Feed the outcome of a send back into the rate limiters.
+
+        recipients is how many addresses the outcome applies to (batch
+        messages). refund gives their quota back: only for failures that
+        prove the provider never took the message (retry_policy.not_accepted),
+        as it may count anything that reached DATA.
+        """
+        buckets = self._buckets(sender_email, smtp_host)
+        if success:
+            for bucket in buckets:
+                if bucket is not None:
+                    bucket.reward()
+            return
+        quota = self.quotas.get(sender_email)
+        if quota is not None and refund:
+            quota.refund(recipients)
+        if smtp_code in THROTTLE_CODES:
+            logger.warning(f"{smtp_host} throttled {sender_email} ({smtp_code}), lowering send rate")
+            for bucket in buckets:
+                if bucket is not None:
+                    bucket.penalize()
+
+
+campaign_scheduler = CampaignScheduler()
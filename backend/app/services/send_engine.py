@@ -0,0 +1,668 @@
+import heapq
+import itertools
+import os
+import smtplib
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+from app.services.download_links import link_signer, LINK_EXPIRY_HOURS
+from app.services.email_service import email_service, smtp_reply_code, is_valid_email
+from app.services.message_spool import CampaignSpool, SPOOL_LOOKAHEAD
+from app.services.metrics import send_stage_seconds, messages_total, smtp_errors_total
+from app.services.mime_cache import part_caches
+from app.services.progress import ReportBuffer
+from app.services.recipient_validation import recipient_email
+from app.services.retry_policy import retry_policy, classify_error, describe_error, not_accepted, AUTH
+from app.services.scheduler import campaign_scheduler, QuotaExceeded, THROTTLE_CODES
+from app.services.sender_pool import SenderAccount, SenderPool, QUOTA
+from app.services.template_engine import CampaignTemplates, LINKS_FIELD
+
+logger = logging.getLogger("uvicorn")
+
+# How many submitted-but-unfinished recipients each worker may have queued.
+# Keeps memory bounded on large campaigns while the workers stay busy.
+LOOKAHEAD_PER_WORKER = 4
+# Results handed to the progress callback (one DB transaction) at a time
+PROGRESS_BATCH = 50
+# Per-recipient lines are DEBUG; at INFO a summary is logged every N rows
+LOG_EVERY = 100
+# Most providers reject messages with more RCPT TO than this (Gmail: 100)
+MAX_BATCH_RECIPIENTS = 100
+
+# Report status of dry-run rows: rendered and serialized, never sent
+ESTADO_VALIDADO = "Validado"
+
+# Returned by send_one for rows that were not attempted because the
+# campaign stopped; they get no delivery result and are sent on resume.
+NOT_ATTEMPTED = object()
+
+
+class CampaignPaused(Exception):
+    """The campaign stopped before every row was attempted (e.g. quota)"""
+
+
+class CampaignAborted(CampaignPaused):
+    """The campaign cannot continue at all (e.g. rejected credentials)"""
+
+
+def sender_accounts(config, smtp_host: str) -> List[SenderAccount]:
+    """The campaign's sender first, then the extra accounts of config.senders"""
+    accounts = [SenderAccount(config.sender_email, config.password, smtp_host, config.concurrency,
+                              config.rate_per_minute, config.daily_quota)]
+    seen = {config.sender_email.lower()}
+    for sender in getattr(config, "senders", None) or []:
+        if sender.sender_email.lower() in seen:
+            continue
+        seen.add(sender.sender_email.lower())
+        accounts.append(SenderAccount(
+            sender.sender_email, sender.password, email_service.get_smtp_config(sender.sender_email)[0],
+            sender.concurrency or config.concurrency, sender.rate_per_minute, sender.daily_quota
+        ))
+    return accounts
+
+
+class CampaignRun:
+    """Everything the workers need to send one campaign"""
+
+    def __init__(self, campaign_id: str, config, templates: CampaignTemplates,
+                 assets: dict, folder1: List[str], folder2: List[str]):
+        self.campaign_id = campaign_id
+        self.config = config
+        self.templates = templates
+        self.assets = assets
+        self.folder1 = folder1
+        self.folder2 = folder2
+        self.smtp_host = email_service.get_smtp_config(config.sender_email)[0]
+        self.senders = SenderPool(sender_accounts(config, self.smtp_host))
+        self.dry_run = getattr(config, "dry_run", False)
+        # Pre-rendered messages (config.prerender, always for dry runs)
+        # Encoded images/attachments shared by this campaign's messages
+        self.part_cache = None
+        self.spool = None
+        if self.dry_run or getattr(config, "prerender", False):
+            self.spool = CampaignSpool(campaign_id, strict=self.dry_run)
+        # Link delivery: attachments become signed download links in the
+        # body, valid for link_expiry_hours from the start of this run
+        self.links = getattr(config, "attachment_links", False)
+        self.link_base = getattr(config, "public_url", None) or ""
+        self.link_expires = int(time.time() + 3600 * getattr(config, "link_expiry_hours", LINK_EXPIRY_HOURS))
+        self.stop = threading.Event()
+        self.stop_reason = ""
+        self.abort = False
+
+    def halt(self, reason: str, abort: bool = False):
+        if not self.stop.is_set():
+            self.stop_reason = reason
+            self.abort = abort
+            self.stop.set()
+
+
+class RowState:
+    """A recipient row while it is being sent (and possibly retried)"""
+
+    def __init__(self, i: int, recipient: dict):
+        self.i = i
+        self.recipient = recipient
+        self.intentos = 0
+        self.duracion = 0
+        self.retry_at = None
+        self.failed_at = None
+        self.detalle = ""
+        # Filled once by prepare(), reused by every retry
+        self.email_addr = None
+        self.nombre = None
+        self.subject = None
+        self.html = None
+        self.attachments = []
+        self.adj1_name = ""
+        self.adj2_name = ""
+        # Future of the row's .eml in the campaign spool (size when ready)
+        # and the sender account it was built for
+        self.spooled = None
+        self.account = None
+        # Sender account of the last attempt
+        self.remitente = ""
+        # Why the row can't be sent at all (set when preparing it failed)
+        self.error = None
+
+    def report_row(self, estado: str) -> dict:
+        now = datetime.now()
+        return {
+            "correo": self.email_addr,
+            "nombre": self.nombre,
+            "estado": estado,
+            "fecha": now.strftime("%Y-%m-%d"),
+            "hora": now.strftime("%H:%M:%S"),
+            "intentos": self.intentos,
+            "duracion": self.duracion,
+            "adjunto1": self.adj1_name,
+            "adjunto2": self.adj2_name,
+            "detalle": self.detalle,
+            "remitente": self.remitente
+        }
+
+
+class SendEngine:
+    """Sends a campaign with N parallel workers.
+
+    Every worker sends over its own pooled SMTP session and makes a single
+    attempt per task. Transient failures go to a deferred queue with
+    exponential backoff, so a waiting retry never blocks other recipients.
+    Each send waits for its slot in the campaign scheduler (fair share,
+    rate limits and daily quota). Report rows are returned in sheet order.
+
+    When the templates have no placeholders and config.batch_size > 1,
+    rows without attachments are grouped and every group is sent as one
+    message with many RCPT TO (see send_batch).
+
+    With config.prerender, messages are built and serialized ahead of the
+    workers in the spool processes, and the workers only stream the
+    finished bytes. config.dry_run does only that and sends nothing.
+
+    With config.senders the rows are spread over several sender accounts
+    (see SenderPool); the report records which one sent each row.
+
+    With config.attachment_links nothing is attached: every row's files are
+    listed in its body as signed, expiring download links (download_links).
+    """
+
+    def __init__(self, service=email_service, scheduler=campaign_scheduler, policy=retry_policy):
+        self.service = service
+        self.scheduler = scheduler
+        self.policy = policy
+        self.part_caches = part_caches
+
+    def run(self, config, rows: Iterable[Tuple[int, dict]], assets: dict, folder1: List[str], folder2: List[str],
+            templates: Optional[CampaignTemplates] = None,
+            on_progress: Optional[Callable[[List[Tuple[int, Optional[dict]]]], None]] = None,
+            campaign_id: str = "default", sent_today: Union[int, Dict[str, int]] = 0,
+            progress: Optional[ReportBuffer] = None, cancel: Optional[threading.Event] = None) -> List[dict]:
+        """Send every (row_index, recipient) pair and return the report rows.
+
+        on_progress receives batches of (row_index, report row or None for
+        skipped rows), so callers can persist progress. progress, if given,
+        gets every result as soon as it is known (live report). sent_today
+        seeds the daily quota (a count for the sender, or a count per sender
+        account with config.senders). Setting cancel stops the run like a
+        pause. Raises CampaignPaused (or CampaignAborted) if the run had to
+        stop early.
+        """
+        if templates is None:
+            templates = CampaignTemplates(config.subject, config.body_html, config.footer_html,
+                                          links=getattr(config, "attachment_links", False))
+        run = CampaignRun(campaign_id, config, templates, assets, folder1, folder2)
+        if not isinstance(sent_today, dict):
+            sent_today = {config.sender_email: sent_today}
+        # Every sender account has its own rate limit and daily quota
+        for account in run.senders.accounts:
+            self.scheduler.configure_sender(
+                account.sender_email, account.smtp_host,
+                rate_per_minute=account.rate_per_minute,
+                daily_quota=account.daily_quota,
+                sent_today=sent_today.get(account.sender_email, 0),
+                provider_limits=getattr(config, "provider_limits", False)
+            )
+        workers = run.senders.concurrency
+        batch_size = 1 if run.dry_run else self.batch_size(config, templates)
+        lookahead = workers * LOOKAHEAD_PER_WORKER
+        if run.spool is not None:
+            # Keep the render processes busy ahead of the SMTP workers
+            lookahead = max(lookahead, SPOOL_LOOKAHEAD)
+        if len(run.senders.accounts) > 1:
+            logger.info(f"Sharding across {len(run.senders.accounts)} sender accounts: "
+                        f"{', '.join(a.sender_email for a in run.senders.accounts)}")
+        if run.dry_run:
+            logger.info("Dry run: rendering every message, nothing is sent")
+        elif batch_size > 1:
+            logger.info(f"Sending with {workers} workers, up to {batch_size} recipients per message")
+        else:
+            logger.info(f"Sending with {workers} workers")
+
+        results = []
+        batch = []
+        in_flight = set()
+        submitted = {}  # future -> the rows it sends
+        deferred = []  # heap of (retry_at, seq, RowState)
+        grouped = []  # rows waiting for a full batch
+        seq = itertools.count()
+        rows = iter(rows)
+        exhausted = False
+
+        counts = {"Enviado": 0, "Error": 0, ESTADO_VALIDADO: 0, "skipped": 0}
+
+        def finish(state: RowState, row: Optional[dict]):
+            counts[row["estado"] if row is not None else "skipped"] += 1
+            processed = sum(counts.values())
+            if processed % LOG_EVERY == 0:
+                logger.info(f"Campaign {campaign_id}: {processed} processed "
+                            f"({counts['Enviado']} sent, {counts['Error']} failed, {len(deferred)} waiting to retry)")
+            if row is not None:
+                results.append((state.i, row))
+            if progress is not None:
+                progress.add(state.i, row)
+            if on_progress is not None:
+                batch.append((state.i, row))
+                if len(batch) >= PROGRESS_BATCH:
+                    on_progress(batch[:])
+                    batch.clear()
+
+        run.part_cache = self.part_caches.get(campaign_id)
+        try:
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="send-worker") as executor:
+                def submit(fn, rows_state):
+                    future = executor.submit(fn, rows_state, run)
+                    submitted[future] = rows_state if isinstance(rows_state, list) else [rows_state]
+                    in_flight.add(future)
+
+                while True:
+                    if cancel is not None and cancel.is_set():
+                        run.halt("Campaign cancelled")
+                    # Keep the workers fed: due retries first, then new rows
+                    while len(in_flight) < lookahead and not run.stop.is_set():
+                        if deferred and deferred[0][0] <= time.monotonic():
+                            state = heapq.heappop(deferred)[2]
+                        elif not exhausted:
+                            nxt = next(rows, None)
+                            if nxt is None:
+                                exhausted = True
+                                if grouped:
+                                    submit(self.send_batch, grouped)
+                                    grouped = []
+                                continue
+                            state = RowState(*nxt)
+                            if batch_size > 1 and not self.has_attachments(state.i, run):
+                                grouped.append(state)
+                                if len(grouped) >= batch_size:
+                                    submit(self.send_batch, grouped)
+                                    grouped = []
+                                continue
+                            if run.spool is not None:
+                                self.spool_row(state, run)
+                        else:
+                            break
+                        submit(self.send_one, state)
+
+                    if not in_flight:
+                        if run.stop.is_set() or (exhausted and not deferred):
+                            break
+                        # Only deferred retries left: sleep until the next one is due
+                        (cancel or run.stop).wait(max(0.0, deferred[0][0] - time.monotonic()))
+                        continue
+
+                    timeout = max(0.0, deferred[0][0] - time.monotonic()) if deferred else None
+                    done, in_flight = wait(in_flight, timeout=timeout, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        states = submitted.pop(future)
+                        try:
+                            result = future.result()
+                        except Exception as e:
+                            # An unexpected error in some rows must not stop the campaign
+                            logger.exception(f"Campaign {campaign_id}: unexpected error sending rows "
+                                             f"{', '.join(str(state.i) for state in states)}")
+                            result = [(state, self._failed(state, run, e)) for state in states]
+                        # send_batch returns one (state, outcome) per row
+                        for state, outcome in (result if isinstance(result, list) else [result]):
+                            if run.spool is not None and outcome != "retry":
+                                run.spool.discard(state.i)
+                            if outcome is NOT_ATTEMPTED:
+                                continue
+                            if outcome == "retry":
+                                heapq.heappush(deferred, (state.retry_at, next(seq), state))
+                            elif outcome == "skipped":
+                                finish(state, None)
+                            else:
+                                finish(state, state.report_row(outcome))
+                    if progress is not None:
+                        progress.set_pending(len(in_flight), len(deferred))
+        finally:
+            if run.spool is not None:
+                run.spool.close()
+            if batch:
+                on_progress(batch)
+            if len(run.senders.accounts) > 1:
+                for account in run.senders.accounts:
+                    logger.info(f"Sender {account.sender_email}: {account.sent} sent, {account.failed} failed"
+                                + (f" (removed: {account.disabled})" if account.disabled else ""))
+            # Encoded parts are only kept while their campaign runs
+            self.part_caches.drop(campaign_id)
+
+        if run.stop.is_set():
+            # Deferred rows have no delivery result and are sent on resume
+            if run.abort:
+                raise CampaignAborted(run.stop_reason)
+            raise CampaignPaused(run.stop_reason)
+        results.sort(key=lambda item: item[0])
+        return [row for _, row in results]
+
+    @staticmethod
+    def batch_size(config, templates: CampaignTemplates) -> int:
+        """Recipients per message: 1 unless every recipient gets the same content"""
+        size = min(getattr(config, "batch_size", 1) or 1, MAX_BATCH_RECIPIENTS)
+        return size if templates.is_static else 1
+
+    @staticmethod
+    def has_attachments(i: int, run: CampaignRun) -> bool:
+        return bool((i < len(run.folder1) and run.folder1[i]) or (i < len(run.folder2) and run.folder2[i]))
+
+    def prepare(self, state: RowState, run: CampaignRun) -> bool:
+        """Render subject/body and map attachments once per row"""
+        recipient = state.recipient
+        state.email_addr = recipient_email(recipient)
+        state.nombre = recipient.get("Nombre") or recipient.get("nombre") or "N/A"
+
+        if not state.email_addr:
+            logger.warning(f"Skipping recipient {state.i}: No email address found in {recipient}")
+            return False
+
+        # Sequential Mapping: Row i gets File i ("" = no file for this row,
+        # e.g. a certificate that could not be generated)
+        i = state.i
+        files = []
+        if i < len(run.folder1) and run.folder1[i]:
+            files.append((1, run.folder1[i]))
+            state.adj1_name = os.path.basename(run.folder1[i])
+
+        if i < len(run.folder2) and run.folder2[i]:
+            files.append((2, run.folder2[i]))
+            state.adj2_name = os.path.basename(run.folder2[i])
+
+        # Dynamic replacement (e.g. {{Nombre}}) in one pass over the compiled template
+        start = time.perf_counter()
+        if run.links:
+            # Nothing attached: the body gets this row's download links
+            links = link_signer.links_html(run.link_base, run.campaign_id, i, files, run.link_expires)
+            state.subject, state.html = run.templates.render({**recipient, LINKS_FIELD: links})
+        else:
+            state.attachments = [path for _, path in files]
+            state.subject, state.html = run.templates.render(recipient)
+        send_stage_seconds.observe(time.perf_counter() - start, "render", run.campaign_id, run.smtp_host)
+        return True
+
+    def _prepare(self, state: RowState, run: CampaignRun) -> bool:
+        """prepare() that keeps a failure with the row (send_one reports it)"""
+        try:
+            return self.prepare(state, run)
+        except Exception as e:
+            state.error = e
+            return True
+
+    def spool_row(self, state: RowState, run: CampaignRun):
+        """Start building a row's message in the spool processes"""
+        if self._prepare(state, run) and state.error is None and is_valid_email(state.email_addr):
+            # The From header is part of the spooled bytes: the row is dealt
+            # to an account now, and is re-rendered if another one sends it
+            state.account = run.senders.assign() or run.senders.primary
+            state.remitente = state.account.sender_email
+            try:
+                state.spooled = run.spool.submit(state.i, state.account.sender_email, state.email_addr,
+                                                 state.subject, state.html, run.assets, state.attachments)
+            except Exception as e:
+                state.error = e
+
+    def send_one(self, state: RowState, run: CampaignRun):
+        """Make one attempt for a row.
+
+        Returns (state, outcome) where outcome is "Enviado", "Error",
+        "retry", "skipped" or NOT_ATTEMPTED.
+        """
+        if run.stop.is_set():
+            return state, NOT_ATTEMPTED
+        # Rows handed back by send_batch were already prepared
+        if state.subject is None and state.error is None and not self._prepare(state, run):
+            return state, "skipped"
+        if state.error is not None:
+            return state, self._failed(state, run, state.error)
+        if run.dry_run:
+            return state, self._validate(state, run)
+
+        account = run.senders.acquire(prefer=state.account)
+        if account is None:
+            # Every sender account is out (the run is stopping)
+            return state, NOT_ATTEMPTED
+        try:
+            if state.failed_at is not None:
+                send_stage_seconds.observe(time.monotonic() - state.failed_at, "retry_wait", run.campaign_id,
+                                           account.smtp_host)
+            waiting = time.perf_counter()
+            try:
+                with self.scheduler.slot(run.campaign_id, account.sender_email, account.smtp_host):
+                    send_stage_seconds.observe(time.perf_counter() - waiting, "slot_wait", run.campaign_id,
+                                               account.smtp_host)
+                    inicio = time.time()
+                    state.intentos += 1
+                    state.remitente = account.sender_email
+                    logger.debug("Sending to %s from %s, attempt %d", state.email_addr, account.sender_email,
+                                 state.intentos)
+                    success, error = self._attempt(run, state, account)
+            except QuotaExceeded as e:
+                logger.warning(str(e))
+                if not self._drop_sender(run, account, str(e), QUOTA):
+                    return state, NOT_ATTEMPTED
+                # Not attempted: another account sends it right away
+                state.retry_at = time.monotonic()
+                return state, "retry"
+        finally:
+            run.senders.release(account)
+
+        state.duracion = round(time.time() - inicio, 2)
+        return state, self._outcome(state, run, account, success, error)
+
+    def send_batch(self, states: List[RowState], run: CampaignRun) -> List[tuple]:
+        """Send one message to several rows in a single SMTP transaction.
+
+        Each row gets its own outcome from the RCPT TO reply for its
+        address. Rows that need another attempt go back to the deferred
+        queue and are retried one by one with send_one. Returns a list of
+        (state, outcome).
+        """
+        if run.stop.is_set():
+            return [(state, NOT_ATTEMPTED) for state in states]
+        results = []
+        ready = []
+        for state in states:
+            if not self._prepare(state, run):
+                results.append((state, "skipped"))
+            elif state.error is None and is_valid_email(state.email_addr):
+                ready.append(state)
+            else:
+                # send_one reports the failure or the invalid address
+                results.append(self.send_one(state, run))
+        if len(ready) <= 1:
+            return results + [self.send_one(state, run) for state in ready]
+
+        account = run.senders.acquire()
+        if account is None:
+            return results + [(state, NOT_ATTEMPTED) for state in ready]
+        waiting = time.perf_counter()
+        try:
+            with self.scheduler.slot(run.campaign_id, account.sender_email, account.smtp_host,
+                                     recipients=len(ready)):
+                send_stage_seconds.observe(time.perf_counter() - waiting, "slot_wait", run.campaign_id,
+                                           account.smtp_host)
+                inicio = time.time()
+                for state in ready:
+                    state.intentos += 1
+                    state.remitente = account.sender_email
+                logger.debug("Sending one message to %d recipients from %s", len(ready), account.sender_email)
+                refused, error = self._attempt_batch(run, ready, account)
+        except QuotaExceeded:
+            # Not enough quota left for the whole batch: send the rows one
+            # by one until it runs out
+            now = time.monotonic()
+            for state in ready:
+                state.retry_at = now
+            return results + [(state, "retry") for state in ready]
+        finally:
+            run.senders.release(account)
+
+        duracion = round(time.time() - inicio, 2)
+        if isinstance(error, smtplib.SMTPRecipientsRefused):
+            # Nobody was accepted; each row still gets its own reply
+            refused, error = error.recipients, None
+
+        # One transaction: the rate limiters see it once, the quota gets
+        # back what was provably refused (RCPT TO, or before DATA)
+        failed = len(ready) if error is not None else sum(1 for state in ready if state.email_addr in refused)
+        if failed < len(ready):
+            self.scheduler.record_result(account.sender_email, account.smtp_host, True)
+            run.senders.record(account, True, recipients=len(ready) - failed)
+        if failed:
+            codes = [smtp_reply_code(error)] if error is not None else [code for code, _ in refused.values()]
+            # A single throttling reply is enough to slow the sender down
+            throttled = [code for code in codes if code in THROTTLE_CODES]
+            self.scheduler.record_result(account.sender_email, account.smtp_host, False,
+                                         throttled[0] if throttled else codes[0], recipients=failed,
+                                         refund=error is None or not_accepted(error))
+            run.senders.record(account, False, throttled=bool(throttled), recipients=failed)
+
+        for state in ready:
+            state.duracion = duracion
+            if state.email_addr in refused:
+                failure = smtplib.SMTPRecipientsRefused({state.email_addr: refused[state.email_addr]})
+                results.append((state, self._outcome(state, run, account, False, failure, record=False)))
+            else:
+                results.append((state, self._outcome(state, run, account, error is None, error, record=False)))
+        return results
+
+    def _outcome(self, state: RowState, run: CampaignRun, account: SenderAccount, success: bool,
+                 error: Optional[Exception], record: bool = True):
+        """Record one attempt; returns "Enviado", "Error", "retry" or NOT_ATTEMPTED"""
+        code = smtp_reply_code(error)
+        if record:
+            self.scheduler.record_result(account.sender_email, account.smtp_host, success, code,
+                                         refund=not success and not_accepted(error))
+            run.senders.record(account, success, throttled=code in THROTTLE_CODES)
+
+        if success:
+            state.detalle = ""
+            messages_total.inc(run.campaign_id, account.smtp_host, "Enviado")
+            logger.debug("Successfully sent to %s", state.email_addr)
+            return "Enviado"
+
+        kind = classify_error(error)
+        smtp_errors_total.inc(account.smtp_host, kind)
+        state.detalle = describe_error(error)
+
+        if kind == AUTH:
+            # Every other row would fail the same way with this account
+            reason = f"Authentication failed for {account.sender_email}: {state.detalle}"
+            if not self._drop_sender(run, account, reason, AUTH):
+                return NOT_ATTEMPTED
+            # Not the row's fault: another account sends it right away
+            state.intentos -= 1
+            state.retry_at = time.monotonic()
+            return "retry"
+        if self.policy.should_retry(kind, state.intentos):
+            # Attempts that will be retried are only logged when debugging
+            logger.debug("Failed to send to %s, attempt %d (%s: %s), retrying",
+                         state.email_addr, state.intentos, kind, state.detalle)
+            state.failed_at = time.monotonic()
+            state.retry_at = state.failed_at + self.policy.delay(state.intentos)
+            messages_total.inc(run.campaign_id, account.smtp_host, "retry")
+            return "retry"
+        logger.warning(f"Failed to send to {state.email_addr}, attempt {state.intentos} ({kind}: {state.detalle})")
+        messages_total.inc(run.campaign_id, account.smtp_host, "Error")
+        return "Error"
+
+    def _failed(self, state: RowState, run: CampaignRun, error: Exception) -> str:
+        """A row that can't be sent (template error, unreadable attachment...): reported, not retried"""
+        recipient = state.recipient
+        if state.email_addr is None:
+            state.email_addr = recipient_email(recipient)
+            state.nombre = recipient.get("Nombre") or recipient.get("nombre") or "N/A"
+        state.detalle = describe_error(error)
+        logger.warning(f"Cannot send row {state.i} ({state.email_addr}): {state.detalle}")
+        messages_total.inc(run.campaign_id, run.smtp_host, "Error")
+        return "Error"
+
+    @staticmethod
+    def _drop_sender(run: CampaignRun, account: SenderAccount, reason: str, kind: str) -> bool:
+        """Take a sender account out of the run; stop the run when none is left.
+
+        Returns True while other accounts can take over its rows.
+        """
+        if run.senders.disable(account, reason, kind):
+            return True
+        # Only rejected credentials everywhere is final; a quota resets tomorrow
+        run.halt(run.senders.stop_reason(), abort=run.senders.all_disabled_by(AUTH))
+        return False
+
+    def _validate(self, state: RowState, run: CampaignRun) -> str:
+        """Dry run: wait for the row's spooled message instead of sending it"""
+        inicio = time.time()
+        error = None
+        size = 0
+        try:
+            if state.spooled is not None:
+                size = state.spooled.result()
+        except Exception as e:
+            error = e
+        state.duracion = round(time.time() - inicio, 2)
+        if state.spooled is not None and error is None:
+            state.detalle = f"{size / 1024:.1f} KB"
+            messages_total.inc(run.campaign_id, run.smtp_host, ESTADO_VALIDADO)
+            return ESTADO_VALIDADO
+        # Not spooled: the address is invalid
+        state.detalle = describe_error(error)
+        messages_total.inc(run.campaign_id, run.smtp_host, "Error")
+        return "Error"
+
+    def _attempt(self, run: CampaignRun, state: RowState, account: SenderAccount) -> Tuple[bool, Optional[Exception]]:
+        """One SMTP transaction, returns (success, exception on failure)"""
+        timings = {}
+        try:
+            if state.spooled is not None and state.account is account:
+                waiting = time.perf_counter()
+                state.spooled.result()
+                timings["spool_wait"] = time.perf_counter() - waiting
+                self.service.send_spooled(account.sender_email, account.password, state.email_addr,
+                                          run.spool.path(state.i), timings=timings)
+                return True, None
+            success = self.service.send_email(
+                sender_email=account.sender_email,
+                password=account.password,
+                recipient_email=state.email_addr,
+                subject=state.subject,
+                html_body=state.html,
+                images=run.assets,
+                attachments=state.attachments,
+                part_cache=run.part_cache,
+                raise_errors=True,
+                timings=timings
+            )
+            return success, None
+        except Exception as e:
+            return False, e
+        finally:
+            for stage, seconds in timings.items():
+                send_stage_seconds.observe(seconds, stage, run.campaign_id, account.smtp_host)
+
+    def _attempt_batch(self, run: CampaignRun, states: List[RowState],
+                       account: SenderAccount) -> Tuple[dict, Optional[Exception]]:
+        """One SMTP transaction for several rows, returns (refused, exception on failure)"""
+        timings = {}
+        first = states[0]
+        try:
+            refused = self.service.send_batch(
+                sender_email=account.sender_email,
+                password=account.password,
+                recipient_emails=[state.email_addr for state in states],
+                subject=first.subject,
+                html_body=first.html,
+                images=run.assets,
+                part_cache=run.part_cache,
+                timings=timings
+            )
+            return refused, None
+        except Exception as e:
+            return {}, e
+        finally:
+            for stage, seconds in timings.items():
+                send_stage_seconds.observe(seconds, stage, run.campaign_id, account.smtp_host)
+
+
+send_engine = SendEngine()
@@ -0,0 +1,163 @@
+import threading
+import time
+import logging
+from typing import List, Optional
+
+logger = logging.getLogger("uvicorn")
+
+# An account that gets a throttling reply is avoided for this long while
+# other accounts can take its rows (doubles while it keeps throttling)
+THROTTLE_COOLDOWN = 60.0
+MAX_THROTTLE_COOLDOWN = 900.0
+# Kind of an account taken out because its daily quota ran out (the
+# others are retry_policy kinds, e.g. AUTH)
+QUOTA = "quota"
+
+
+class SenderAccount:
+    """One sender identity of a campaign: its own SMTP host, sessions and quota"""
+
+    def __init__(self, sender_email: str, password: str, smtp_host: str, concurrency: int,
+                 rate_per_minute: Optional[int] = None, daily_quota: Optional[int] = None):
+        self.sender_email = sender_email
+        self.password = password
+        self.smtp_host = smtp_host
+        self.concurrency = max(1, concurrency)
+        self.rate_per_minute = rate_per_minute
+        self.daily_quota = daily_quota
+        self.in_flight = 0
+        self.sent = 0
+        self.failed = 0
+        # Why the account is out of the rotation for this run ("" = active)
+        # and what took it out (QUOTA or a retry_policy kind)
+        self.disabled = ""
+        self.disabled_kind = None
+        # Spooled rows built with this account as sender
+        self.assigned = 0
+        self.cooldown_until = 0.0
+        self.throttle_streak = 0
+
+    @property
+    def load(self) -> float:
+        return self.in_flight / self.concurrency
+
+    def info(self) -> dict:
+        return {
+            "sender_email": self.sender_email,
+            "smtp_host": self.smtp_host,
+            "sent": self.sent,
+            "failed": self.failed,
+            "in_flight": self.in_flight,
+            "disabled": self.disabled,
+            "cooling_down": max(0.0, round(self.cooldown_until - time.monotonic(), 1)),
+        }
+
+
+class SenderPool:
+    """Spreads a campaign's rows over its sender accounts.
+
+    Every send takes the least loaded active account (in-flight sends
+    relative to its concurrency), so each account works in parallel at its
+    own pace and rate limit. Accounts whose credentials are rejected or
+    whose daily quota runs out leave the rotation; accounts that get
+    throttled are only used again after a cooldown, unless every
+    account is cooling down.
+    """
+
+    def __init__(self, accounts: List[SenderAccount]):
+        self.accounts = accounts
+        self._cond = threading.Condition()
+
+    @property
+    def primary(self) -> SenderAccount:
+        return self.accounts[0]
+
+    @property
+    def concurrency(self) -> int:
+        return sum(account.concurrency for account in self.accounts)
+
+    def active(self) -> List[SenderAccount]:
+        return [account for account in self.accounts if not account.disabled]
+
+    def _choose(self, prefer: Optional[SenderAccount]) -> Optional[SenderAccount]:
+        now = time.monotonic()
+        active = self.active()
+        # Cooling accounts only when every account is cooling down
+        ready = [a for a in active if a.cooldown_until <= now] or active
+        free = [a for a in ready if a.in_flight < a.concurrency]
+        if prefer is not None and prefer in free:
+            return prefer
+        if not free:
+            return None
+        # The least loaded (or the one that is out of its cooldown first)
+        return min(free, key=lambda a: (max(0.0, a.cooldown_until - now), a.load))
+
+    def assign(self) -> Optional[SenderAccount]:
+        """Sender for a message built ahead of time (the spool).
+
+        Rows are dealt out in proportion to each account's concurrency;
+        acquire() prefers this account when the row is sent.
+        """
+        with self._cond:
+            active = self.active()
+            if not active:
+                return None
+            account = min(active, key=lambda a: a.assigned / a.concurrency)
+            account.assigned += 1
+            return account
+
+    def acquire(self, prefer: Optional[SenderAccount] = None) -> Optional[SenderAccount]:
+        """Take an account for one send (prefer it when it is usable).
+
+        Waits while every active account is busy; None when no account is
+        left at all.
+        """
+        with self._cond:
+            while True:
+                if not self.active():
+                    return None
+                account = self._choose(prefer)
+                if account is not None:
+                    account.in_flight += 1
+                    return account
+                self._cond.wait()
+
+    def release(self, account: SenderAccount):
+        with self._cond:
+            account.in_flight -= 1
+            self._cond.notify_all()
+
+    def record(self, account: SenderAccount, success: bool, throttled: bool = False, recipients: int = 1):
+        with self._cond:
+            if success:
+                account.sent += recipients
+                account.throttle_streak = 0
+                return
+            account.failed += recipients
+            if throttled and len(self.accounts) > 1:
+                cooldown = min(MAX_THROTTLE_COOLDOWN, THROTTLE_COOLDOWN * 2 ** account.throttle_streak)
+                account.throttle_streak += 1
+                account.cooldown_until = time.monotonic() + cooldown
+                logger.warning(f"{account.sender_email} is being throttled, moving its rows to other accounts "
+                               f"for {cooldown:.0f}s")
+
+    def disable(self, account: SenderAccount, reason: str, kind: Optional[str] = None) -> bool:
+        """Take an account out of the rotation; False if none is left"""
+        with self._cond:
+            if not account.disabled:
+                account.disabled = reason
+                account.disabled_kind = kind
+                logger.warning(f"Sender {account.sender_email} removed from the campaign: {reason}")
+            self._cond.notify_all()
+            return bool(self.active())
+
+    def stop_reason(self) -> str:
+        """Why the run can't go on once every account is disabled"""
+        return "; ".join(account.disabled for account in self.accounts if account.disabled)
+
+    def all_disabled_by(self, kind: str) -> bool:
+        return all(account.disabled_kind == kind for account in self.accounts)
+
+    def info(self) -> List[dict]:
+        with self._cond:
+            return [account.info() for account in self.accounts]
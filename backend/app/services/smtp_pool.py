@@ -0,0 +1,212 @@
+import smtplib
+import threading
+import time
+import logging
+from contextlib import contextmanager
+from typing import Optional
+
+from app.services.mime_stream import StreamedMessage, SpooledMessage, send_streamed
+
+logger = logging.getLogger(__name__)
+
+# Most providers drop or throttle sessions that push too many messages;
+# Gmail starts answering 421 after roughly 100 messages per connection.
+MAX_MESSAGES_PER_CONNECTION = 100
+# Idle sessions older than this are closed instead of reused (servers
+# usually drop idle clients after 60-300 seconds).
+IDLE_TIMEOUT = 60
+# Sessions idle for longer than this get a NOOP before being reused.
+HEALTH_CHECK_AFTER = 10
+# Idle sessions kept per (server, port, sender) key.
+MAX_IDLE_PER_KEY = 16
+
+
+def _add_timing(timings: dict, stage: str, seconds: float):
+    timings[stage] = timings.get(stage, 0.0) + seconds
+
+
+class PooledConnection:
+    """An authenticated SMTP session plus the bookkeeping the pool needs"""
+
+    def __init__(self, key, client):
+        self.key = key
+        self.client = client
+        self.messages_sent = 0
+        self.reused = False
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+
+    @property
+    def idle_seconds(self) -> float:
+        return time.monotonic() - self.last_used
+
+    def is_alive(self) -> bool:
+        """NOOP health check, False if the server no longer answers"""
+        try:
+            code, _ = self.client.noop()
+            return code == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    def reset(self) -> bool:
+        """RSET after a failed transaction so the session can be reused"""
+        try:
+            code, _ = self.client.rset()
+            return code == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    def close(self):
+        try:
+            self.client.quit()
+        except (smtplib.SMTPException, OSError):
+            try:
+                self.client.close()
+            except Exception:
+                pass
+
+
+class SMTPConnectionPool:
+    """Keeps authenticated SMTP sessions alive between messages.
+
+    Sessions are keyed by (server, port, sender). A session is checked out
+    by one thread at a time, so concurrent senders each hold their own
+    connection.
+    """
+
+    def __init__(
+        self,
+        max_messages_per_connection: int = MAX_MESSAGES_PER_CONNECTION,
+        idle_timeout: float = IDLE_TIMEOUT,
+        health_check_after: float = HEALTH_CHECK_AFTER,
+        max_idle_per_key: int = MAX_IDLE_PER_KEY,
+        timeout: float = 30,
+    ):
+        self.max_messages_per_connection = max_messages_per_connection
+        self.idle_timeout = idle_timeout
+        self.health_check_after = health_check_after
+        self.max_idle_per_key = max_idle_per_key
+        self.timeout = timeout
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def _connect(self, key, password: str, timings: Optional[dict] = None) -> PooledConnection:
+        smtp_server, smtp_port, sender_email = key
+        start = time.perf_counter()
+        # Same handshake as the original per-message logic
+        if smtp_port == 465:
+            client = smtplib.SMTP_SSL(smtp_server, smtp_port, timeout=self.timeout)
+        else:
+            client = smtplib.SMTP(smtp_server, smtp_port, timeout=self.timeout)
+        try:
+            if smtp_port != 465:
+                client.starttls()
+            connected = time.perf_counter()
+            client.login(sender_email, password)
+            if timings is not None:
+                _add_timing(timings, "smtp_connect", connected - start)
+                _add_timing(timings, "smtp_login", time.perf_counter() - connected)
+        except Exception:
+            client.close()
+            raise
+        logger.info(f"Opened SMTP session {smtp_server}:{smtp_port} for {sender_email}")
+        return PooledConnection(key, client)
+
+    def acquire(self, smtp_server: str, smtp_port: int, sender_email: str, password: str,
+                timings: Optional[dict] = None) -> PooledConnection:
+        """Take an idle healthy session for the key, or open a new one"""
+        key = (smtp_server, smtp_port, sender_email)
+        while True:
+            with self._lock:
+                idle = self._idle.get(key)
+                conn = idle.pop() if idle else None
+            if conn is None:
+                return self._connect(key, password, timings)
+            if conn.idle_seconds > self.idle_timeout:
+                conn.close()
+                continue
+            if conn.idle_seconds > self.health_check_after and not conn.is_alive():
+                conn.close()
+                continue
+            conn.reused = True
+            return conn
+
+    def release(self, conn: PooledConnection, reusable: bool = True):
+        """Return a session to the pool, or close it when it is spent"""
+        conn.last_used = time.monotonic()
+        if not reusable or conn.messages_sent >= self.max_messages_per_connection:
+            conn.close()
+            return
+        with self._lock:
+            idle = self._idle.setdefault(conn.key, [])
+            if len(idle) < self.max_idle_per_key:
+                idle.append(conn)
+                return
+        conn.close()
+
+    @contextmanager
+    def connection(self, smtp_server: str, smtp_port: int, sender_email: str, password: str):
+        """Check out a session for the duration of the block"""
+        conn = self.acquire(smtp_server, smtp_port, sender_email, password)
+        with self._checked_out(conn):
+            yield conn
+
+    def send_message(self, smtp_server: str, smtp_port: int, sender_email: str, password: str, msg, to_addrs=None,
+                     timings: Optional[dict] = None) -> dict:
+        """Send one message over a pooled session.
+
+        A reused session that turns out to be disconnected is replaced
+        with a fresh one transparently. Returns the refused recipients
+        dict from smtplib. msg may be a StreamedMessage (large attachments
+        encoded while DATA is written) or a SpooledMessage (pre-rendered
+        file); to_addrs is then required.
+        timings, if given, gets the seconds spent in smtp_connect,
+        smtp_login and smtp_data.
+        """
+        while True:
+            conn = self.acquire(smtp_server, smtp_port, sender_email, password, timings)
+            start = time.perf_counter()
+            try:
+                with self._checked_out(conn):
+                    try:
+                        if isinstance(msg, (StreamedMessage, SpooledMessage)):
+                            refused = send_streamed(conn.client, sender_email, to_addrs, msg)
+                        else:
+                            refused = conn.client.send_message(msg, to_addrs=to_addrs)
+                    finally:
+                        if timings is not None:
+                            _add_timing(timings, "smtp_data", time.perf_counter() - start)
+                    conn.messages_sent += 1
+                    return refused
+            except smtplib.SMTPServerDisconnected:
+                if not conn.reused:
+                    raise
+                logger.info(f"SMTP session for {sender_email} was dropped, reconnecting")
+
+    @contextmanager
+    def _checked_out(self, conn: PooledConnection):
+        reusable = True
+        try:
+            yield conn
+        except smtplib.SMTPServerDisconnected:
+            reusable = False
+            raise
+        except (smtplib.SMTPResponseException, smtplib.SMTPRecipientsRefused):
+            reusable = conn.reset()
+            raise
+        except Exception:
+            reusable = False
+            raise
+        finally:
+            self.release(conn, reusable)
+
+    def close_all(self):
+        """Close every idle session (e.g. when a campaign finishes)"""
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for conns in idle.values():
+            for conn in conns:
+                conn.close()
+
+
+smtp_pool = SMTPConnectionPool()
@@ -0,0 +1,161 @@
+import gzip
+import hashlib
+import mimetypes
+import logging
+from pathlib import Path
+from typing import Dict, Optional
+
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, PlainTextResponse, Response
+from starlette.websockets import WebSocketClose
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only (or the .br files the build produced)
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Vite puts content-hashed bundles here: they never change under the same name
+IMMUTABLE_PREFIX = "assets/"
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+# index.html and unhashed files are revalidated (cheap 304 with the ETag)
+REVALIDATE_CACHE = "no-cache"
+# Files kept in memory; bigger ones are streamed from disk
+MAX_IN_MEMORY = 1024 * 1024
+# Smaller files aren't worth compressing
+MIN_COMPRESS_SIZE = 1024
+COMPRESSIBLE_TYPES = ("text/", "application/javascript", "application/json", "application/xml",
+                      "image/svg+xml", "application/wasm", "font/ttf", "font/otf")
+# Preferred first
+ENCODINGS = ("br", "gzip")
+SUFFIXES = {"br": ".br", "gzip": ".gz"}
+
+
+def _compress(encoding: str, data: bytes) -> Optional[bytes]:
+    if encoding == "gzip":
+        return gzip.compress(data, compresslevel=9, mtime=0)
+    if encoding == "br" and brotli is not None:
+        return brotli.compress(data, quality=11)
+    return None
+
+
+def accepted_encodings(accept_encoding: str) -> set:
+    """Codings the client accepts (q=0 means "not acceptable")"""
+    accepted = set()
+    for item in accept_encoding.lower().split(","):
+        coding, _, params = item.partition(";")
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if coding.strip() and q > 0:
+            accepted.add(coding.strip())
+    if "*" in accepted:
+        accepted.update(ENCODINGS)
+    return accepted
+
+
+class StaticFile:
+    """One file of the build: headers and bodies computed at startup"""
+
+    def __init__(self, path: Path, relative: str):
+        self.path = path
+        self.size = path.stat().st_size
+        self.media_type = mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+        self.cache_control = IMMUTABLE_CACHE if relative.startswith(IMMUTABLE_PREFIX) else REVALIDATE_CACHE
+        self.body = None
+        self.variants: Dict[str, bytes] = {}
+
+        hasher = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(MAX_IN_MEMORY), b""):
+                hasher.update(chunk)
+                if self.size <= MAX_IN_MEMORY:
+                    self.body = chunk
+        self.etag = f'"{hasher.hexdigest()[:20]}"'
+        if self.size == 0:
+            self.body = b""
+
+        if self.body is not None and self.size >= MIN_COMPRESS_SIZE and self.media_type.startswith(COMPRESSIBLE_TYPES):
+            for encoding in ENCODINGS:
+                # Precompressed by the build (e.g. vite-plugin-compression), or done once here
+                prebuilt = path.with_name(path.name + SUFFIXES[encoding])
+                data = prebuilt.read_bytes() if prebuilt.is_file() else _compress(encoding, self.body)
+                if data is not None and len(data) < self.size:
+                    self.variants[encoding] = data
+
+    def etag_for(self, encoding: Optional[str]) -> str:
+        # Each representation needs its own strong ETag
+        return self.etag if encoding is None else f'{self.etag[:-1]}-{encoding}"'
+
+    def response(self, request_headers: Headers) -> Response:
+        encoding = None
+        if self.variants:
+            accepted = accepted_encodings(request_headers.get("accept-encoding", ""))
+            encoding = next((e for e in ENCODINGS if e in self.variants and e in accepted), None)
+        headers = {"ETag": self.etag_for(encoding), "Cache-Control": self.cache_control}
+        if self.variants:
+            headers["Vary"] = "Accept-Encoding"
+
+        if_none_match = request_headers.get("if-none-match")
+        if if_none_match:
+            tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+            if "*" in tags or headers["ETag"] in tags:
+                return Response(status_code=304, headers=headers)
+
+        if encoding is not None:
+            headers["Content-Encoding"] = encoding
+            return Response(self.variants[encoding], media_type=self.media_type, headers=headers)
+        if self.body is not None:
+            return Response(self.body, media_type=self.media_type, headers=headers)
+        return FileResponse(self.path, media_type=self.media_type, headers=headers)
+
+
+class StaticFrontend:
+    """ASGI app serving the React build from an in-memory manifest.
+
+    frontend/dist is indexed once (hash, headers, compressed variants), so
+    a request is a dict lookup: no filesystem checks, no routing. Unknown
+    paths outside /assets get index.html (client-side routes).
+    """
+
+    def __init__(self, root: Path):
+        self.root = root
+        self.files: Dict[str, StaticFile] = {}
+        for path in sorted(root.rglob("*")):
+            if not path.is_file() or path.suffix in (".gz", ".br"):
+                continue
+            relative = path.relative_to(root).as_posix()
+            self.files[relative] = StaticFile(path, relative)
+        self.index = self.files.get("index.html")
+        compressed = sum(1 for f in self.files.values() if f.variants)
+        logger.info(f"Frontend manifest: {len(self.files)} files ({compressed} compressed, "
+                    f"brotli {'on' if brotli is not None else 'off'})")
+
+    def lookup(self, path: str) -> Optional[StaticFile]:
+        relative = path.lstrip("/")
+        entry = self.files.get(relative)
+        if entry is None and not relative.startswith(IMMUTABLE_PREFIX):
+            entry = self.index
+        return entry
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            # Mounted at "/": websocket (and any other) scopes end up here too
+            if scope["type"] == "websocket":
+                await WebSocketClose()(scope, receive, send)
+            return
+        if scope["method"] not in ("GET", "HEAD"):
+            response = PlainTextResponse("Method Not Allowed", status_code=405, headers={"Allow": "GET, HEAD"})
+        else:
+            entry = self.lookup(scope["path"])
+            if entry is None:
+                response = PlainTextResponse("Not Found", status_code=404)
+            else:
+                response = entry.response(Headers(scope=scope))
+        await response(scope, receive, send)
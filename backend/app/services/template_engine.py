@@ -0,0 +1,90 @@
+import re
+from typing import Iterable, List
+
+from app.templates.email_template import split_campaign_layout
+
+# {{Nombre}}, {{ Nombre }}, {{Fecha de emision}}
+PLACEHOLDER_RE = re.compile(r"\{\{\s*([^{}]+?)\s*\}\}")
+
+
+def _to_text(value) -> str:
+    """Cell value as it should appear in the mail (empty cells render empty)"""
+    if value is None:
+        return ""
+    if isinstance(value, float) and value != value:  # NaN from empty cells
+        return ""
+    return str(value)
+
+
+class CompiledTemplate:
+    """A template parsed once into literal segments and field names.
+
+    literals always has one more item than fields, so rendering is a single
+    join of literal, value, literal, value, ..., literal.
+    """
+
+    def __init__(self, source: str):
+        self.source = source or ""
+        self.literals = []
+        self.fields = []
+        pos = 0
+        for match in PLACEHOLDER_RE.finditer(self.source):
+            self.literals.append(self.source[pos:match.start()])
+            self.fields.append(match.group(1))
+            pos = match.end()
+        self.literals.append(self.source[pos:])
+
+    @property
+    def placeholders(self) -> set:
+        return set(self.fields)
+
+    @property
+    def is_static(self) -> bool:
+        return not self.fields
+
+    def render(self, values: dict) -> str:
+        if not self.fields:
+            return self.literals[0]
+        parts = [self.literals[0]]
+        for field, literal in zip(self.fields, self.literals[1:]):
+            parts.append(_to_text(values.get(field)))
+            parts.append(literal)
+        return "".join(parts)
+
+
+# Filled per row with the download links of its attachments (link delivery)
+LINKS_FIELD = "enlaces"
+
+
+class CampaignTemplates:
+    """Subject and full HTML (layout + body + footer) compiled for a campaign.
+
+    With links, {{enlaces}} is where the download links go: where the body
+    has it, or else at the end of the body.
+    """
+
+    def __init__(self, subject: str, body_html: str, footer_html: str = "", links: bool = False):
+        head, middle, tail = split_campaign_layout()
+        body_html = body_html or ""
+        self.links = links
+        if links and LINKS_FIELD not in CompiledTemplate(body_html).placeholders:
+            body_html += "{{" + LINKS_FIELD + "}}"
+        self.subject = CompiledTemplate(subject)
+        self.html = CompiledTemplate(head + body_html + middle + (footer_html or "") + tail)
+
+    @property
+    def placeholders(self) -> set:
+        return self.subject.placeholders | self.html.placeholders
+
+    @property
+    def is_static(self) -> bool:
+        return self.subject.is_static and self.html.is_static
+
+    def unknown_placeholders(self, columns: Iterable[str]) -> List[str]:
+        """Placeholders that don't match any column of the recipient sheet"""
+        known = set(columns) | ({LINKS_FIELD} if self.links else set())
+        return sorted(self.placeholders - known)
+
+    def render(self, recipient: dict):
+        """Return (subject, html) for one recipient row"""
+        return self.subject.render(recipient), self.html.render(recipient)
@@ -0,0 +1,61 @@
+import asyncio
+import functools
+import os
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
+import aiofiles
+from fastapi import UploadFile
+
+logger = logging.getLogger(__name__)
+
+# Threads for upload disk writes and file parsing. Bounded so a burst of
+# uploads can't take over the default threadpool used by sync endpoints.
+UPLOAD_WORKERS = 4
+# Uploads processed at the same time; the others wait for a slot
+MAX_CONCURRENT_UPLOADS = 4
+# How long an upload waits for a slot before it's answered with 503
+UPLOAD_SLOT_TIMEOUT = 30
+# Bytes read from the request per write
+UPLOAD_CHUNK = 1024 * 1024
+
+upload_executor = ThreadPoolExecutor(max_workers=UPLOAD_WORKERS, thread_name_prefix="upload-io")
+_upload_slots = asyncio.Semaphore(MAX_CONCURRENT_UPLOADS)
+
+
+class UploadsBusy(Exception):
+    """Every upload slot stayed taken for UPLOAD_SLOT_TIMEOUT seconds"""
+
+
+async def run_io(fn, *args, **kwargs):
+    """Run blocking disk or parsing work off the event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(upload_executor, functools.partial(fn, *args, **kwargs))
+
+
+@asynccontextmanager
+async def upload_slot():
+    """Backpressure for upload endpoints: raises UploadsBusy when saturated"""
+    try:
+        await asyncio.wait_for(_upload_slots.acquire(), timeout=UPLOAD_SLOT_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise UploadsBusy(f"More than {MAX_CONCURRENT_UPLOADS} uploads in progress, try again later")
+    try:
+        yield
+    finally:
+        _upload_slots.release()
+
+
+async def save_upload(file: UploadFile, path: str) -> int:
+    """Copy an uploaded file to path chunk by chunk, return its size"""
+    size = 0
+    await run_io(os.makedirs, os.path.dirname(path) or ".", exist_ok=True)
+    async with aiofiles.open(path, "wb", executor=upload_executor) as out:
+        while True:
+            chunk = await file.read(UPLOAD_CHUNK)
+            if not chunk:
+                break
+            await out.write(chunk)
+            size += len(chunk)
+    return size
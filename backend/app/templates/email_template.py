@@ -75,3 +75,49 @@ def generate_email_html(body_content: str, footer_content: str = "") -> str:
 </body>
 </html>
 """
+
+
+# Layout used by the campaign sender. The body and footer are spliced into
+# the slots once per campaign, see split_campaign_layout().
+BODY_SLOT = "%%BODY%%"
+FOOTER_SLOT = "%%FOOTER%%"
+
+CAMPAIGN_LAYOUT = """<!DOCTYPE html>
+<html lang="es">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+</head>
+<body style="font-family: Arial, sans-serif; margin: 0; padding: 0; background-color: #f6f7fb;">
+    <div style="max-width: 600px; margin: 30px auto; background-color: #ffffff; border-radius: 12px; overflow: hidden; box-shadow: 0 4px 10px rgba(0,0,0,0.08);">
+        <div style="background-color: rgb(45,54,111); text-align: center; padding: 20px;">
+            <img src="cid:upt_logo" alt="Logo" style="max-height: 70px;">
+        </div>
+        <div style="padding: 30px; line-height: 1.6; font-size: 15px; color: #333;">
+            %%BODY%%
+        </div>
+        <div style="text-align: center; padding: 0 30px 10px 30px;">
+            <img src="cid:flyer_img" alt="Flyer" style="width: 100%; max-width: 540px; border-radius: 10px;">
+        </div>
+        <div style="padding: 20px 30px; line-height: 1.4; font-size: 13px; color: #666; border-top: 1px solid #eee;">
+            %%FOOTER%%
+        </div>
+    </div>
+</body>
+</html>"""
+
+def split_campaign_layout():
+    """Return the layout as (before body, between body and footer, after footer)"""
+    head, rest = CAMPAIGN_LAYOUT.split(BODY_SLOT)
+    middle, tail = rest.split(FOOTER_SLOT)
+    return head, middle, tail
+
+
+# Link delivery (EmailConfig.attachment_links): the files are listed in the
+# body as download links instead of being attached
+ATTACHMENT_LINKS_BLOCK = """<div style="margin-top: 20px; padding: 15px 20px; background-color: #f4f6fb; border-radius: 8px;">
+    <p style="margin: 0 0 8px 0; font-weight: bold; color: rgb(45,54,111);">Archivos adjuntos</p>
+    {items}
+    <p style="margin: 10px 0 0 0; font-size: 12px; color: #666;">Enlaces disponibles hasta el {expires}.</p>
+</div>"""
+ATTACHMENT_LINK_ITEM = """<p style="margin: 4px 0;"><a href="{url}" style="color: rgb(45,54,111);">{name}</a> ({size})</p>"""
@@ -0,0 +1,134 @@
+"""Out-of-process send worker.
+
+    RESU_SEND_WORKER=1 uvicorn app.main:app      # web process only queues campaigns
+    python -m app.worker --campaigns 2            # one or more of these send them
+
+Run from the backend directory (temp/ and data/, or RESU_DATA_DIR, are
+shared with the web process). Campaigns queued by /send and /resume are
+leased from the job store, one worker per campaign, and the lease is
+renewed while the worker sends. When a worker dies its lease runs out
+and another worker resumes the campaign from the first row without a
+delivery result. Every worker has its own SMTP connection pool and
+scheduler. SIGTERM/Ctrl+C stop leasing, pause the running campaigns and
+give them back to the queue.
+"""
+import argparse
+import logging
+import os
+import signal
+import socket
+import threading
+import time
+import uuid
+
+from app.api.endpoints import EmailConfig, background_send_emails
+from app.services.job_store import job_store, LEASE_SECONDS
+from app.services.scheduler import campaign_scheduler
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("uvicorn")
+
+# Seconds between queue polls while the worker is idle
+POLL_INTERVAL = 2.0
+
+
+class SendWorker:
+    """Leases campaign jobs and sends them through the campaign scheduler"""
+
+    def __init__(self, max_campaigns: int = 2, poll: float = POLL_INTERVAL, lease_seconds: float = LEASE_SECONDS):
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.max_campaigns = max_campaigns
+        self.poll = poll
+        self.lease_seconds = lease_seconds
+        # campaign_id -> cancel event of the campaigns this worker is sending
+        self.running = {}
+        self.shutdown = threading.Event()
+        self._lock = threading.Lock()
+
+    def serve(self):
+        logger.info(f"Send worker {self.worker_id} started ({self.max_campaigns} campaigns at a time)")
+        campaign_scheduler.max_active = self.max_campaigns
+        heartbeat = threading.Thread(target=self._heartbeat, name="lease-heartbeat", daemon=True)
+        heartbeat.start()
+        while not self.shutdown.is_set():
+            job = None
+            with self._lock:
+                free = len(self.running) < self.max_campaigns
+            if free:
+                job = job_store.lease_job(self.worker_id, self.lease_seconds)
+            if job is None:
+                self.shutdown.wait(self.poll)
+                continue
+            campaign_id, password, sender_passwords = job
+            cancel = threading.Event()
+            with self._lock:
+                self.running[campaign_id] = cancel
+            logger.info(f"Leased campaign {campaign_id}")
+            campaign_scheduler.submit(campaign_id, self._send, campaign_id, password, sender_passwords, cancel)
+
+        # Pause what is still running; the jobs go back to the queue
+        with self._lock:
+            for cancel in self.running.values():
+                cancel.set()
+        while True:
+            with self._lock:
+                if not self.running:
+                    break
+            time.sleep(0.2)
+        logger.info(f"Send worker {self.worker_id} stopped")
+
+    def stop(self, *_):
+        self.shutdown.set()
+
+    def _send(self, campaign_id: str, password: str, sender_passwords: dict, cancel: threading.Event):
+        try:
+            campaign = job_store.get_campaign(campaign_id)
+            if campaign is not None:
+                config = EmailConfig.from_stored(campaign["config"], password, sender_passwords)
+                background_send_emails(campaign_id, config, cancel=cancel)
+        finally:
+            with self._lock:
+                self.running.pop(campaign_id, None)
+            if not cancel.is_set():
+                job_store.release_job(campaign_id, self.worker_id)
+            elif self.shutdown.is_set():
+                campaign = job_store.get_campaign(campaign_id)
+                done = campaign is None or campaign["status"] == "completed"
+                job_store.release_job(campaign_id, self.worker_id, requeue=not done)
+            # else: the lease was lost and another worker owns the job now
+
+    def _heartbeat(self):
+        """Renew the leases of running campaigns; stop those we lost"""
+        while True:
+            time.sleep(self.lease_seconds / 3)
+            with self._lock:
+                running = list(self.running.items())
+                if self.shutdown.is_set() and not running:
+                    return
+            for campaign_id, cancel in running:
+                try:
+                    renewed = job_store.renew_lease(campaign_id, self.worker_id, self.lease_seconds)
+                except Exception as e:
+                    # e.g. database locked for too long: try again next round
+                    logger.warning(f"Could not renew the lease on {campaign_id}: {e}")
+                    continue
+                if not renewed and not cancel.is_set():
+                    logger.warning(f"Lost the lease on campaign {campaign_id}, stopping it")
+                    cancel.set()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Send campaigns queued by the web process")
+    parser.add_argument("--campaigns", type=int, default=2, help="campaigns sent at the same time")
+    parser.add_argument("--poll", type=float, default=POLL_INTERVAL, help="seconds between queue polls when idle")
+    parser.add_argument("--lease", type=float, default=LEASE_SECONDS, help="lease length in seconds")
+    args = parser.parse_args()
+
+    worker = SendWorker(max(1, args.campaigns), args.poll, args.lease)
+    signal.signal(signal.SIGTERM, worker.stop)
+    signal.signal(signal.SIGINT, worker.stop)
+    worker.serve()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+"""End-to-end send throughput against the local SMTP sink.
+
+    python benchmarks/send_throughput.py --recipients 1000,10000 --attachment-kb 0,100,1024
+    python benchmarks/send_throughput.py --recipients 100000 --latency-ms 20 --throttle-rate 0.01
+    python benchmarks/send_throughput.py --recipients 10000 --attachment-kb 100 --prerender
+
+Starts benchmarks/smtp_sink.py, then runs every (recipients, attachment
+size) scenario in a fresh process so peak RSS is per scenario. In the
+default "campaign" mode a scenario is a real campaign: it is stored in
+the job store and sent by background_send_emails (send engine, scheduler,
+pooled SMTP, MIME cache). "service" mode calls EmailService.send_email
+in a loop, which isolates the per-message hot path.
+
+Reported per scenario: messages/s, p50/p99 latency of send_email, peak
+RSS and CPU time per message of the sending process.
+"""
+import argparse
+import json
+import os
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SINK = os.path.join(BACKEND_DIR, "benchmarks", "smtp_sink.py")
+SENDER = "remitente@benchmark-sink.com"
+# Attachment files are reused round-robin; per-recipient files for 100k
+# rows would mostly measure the disk
+DISTINCT_ATTACHMENTS = 100
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def wait_for_port(host, port, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection((host, port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"SMTP sink did not start on {host}:{port}")
+
+
+class TimedService:
+    """EmailService wrapper that records how long each send_email call takes"""
+
+    def __init__(self, service):
+        self.service = service
+        self.latencies = []
+
+    def __getattr__(self, name):
+        return getattr(self.service, name)
+
+    def send_email(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return self.service.send_email(*args, **kwargs)
+        finally:
+            self.latencies.append(time.perf_counter() - start)
+
+    def send_spooled(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return self.service.send_spooled(*args, **kwargs)
+        finally:
+            self.latencies.append(time.perf_counter() - start)
+
+
+def make_attachments(directory, size_kb, count):
+    if not size_kb:
+        return []
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for i in range(count):
+        path = os.path.join(directory, f"{i + 1}_constancia.pdf")
+        with open(path, "wb") as f:
+            f.write(os.urandom(size_kb * 1024))
+        paths.append(path)
+    return paths
+
+
+def run_scenario(args):
+    """Child process: one scenario, prints a JSON result line"""
+    workdir = tempfile.mkdtemp(prefix="send-bench-")
+    os.chdir(workdir)
+    sys.path.insert(0, BACKEND_DIR)
+
+    from app.services import scheduler
+    from app.services.email_service import email_service
+
+    # Point every sender at the sink and lift the provider rate limits
+    email_service.get_smtp_config = lambda sender_email: (args.host, args.port)
+    scheduler.HOST_LIMITS[args.host] = {"sender_rate": 10 ** 9, "host_rate": 10 ** 9, "daily_quota": None}
+
+    files = make_attachments(os.path.join(workdir, "adjuntos"), args.attachment_kb,
+                             min(DISTINCT_ATTACHMENTS, args.recipients))
+    recipients = [{"Correo": f"usuario{i}@destino.com", "Nombre": f"Usuario {i}"} for i in range(args.recipients)]
+    folder1 = [files[i % len(files)] for i in range(args.recipients)] if files else []
+    subject = "Constancia de participación - {{Nombre}}"
+    body = "<p>Hola {{Nombre}},</p><p>Adjuntamos su constancia.</p>"
+
+    before = resource.getrusage(resource.RUSAGE_SELF)
+    start = time.perf_counter()
+    if args.mode == "service":
+        timed = TimedService(email_service)
+        sent = 0
+        for i, recipient in enumerate(recipients):
+            ok = timed.send_email(SENDER, "benchmark", recipient["Correo"], subject.replace("{{Nombre}}", recipient["Nombre"]),
+                                  body.replace("{{Nombre}}", recipient["Nombre"]),
+                                  attachments=[folder1[i]] if folder1 else None)
+            sent += bool(ok)
+        failed = args.recipients - sent
+    else:
+        from app.api.endpoints import EmailConfig, background_send_emails
+        from app.services.job_store import job_store
+        from app.services.send_engine import send_engine
+
+        timed = TimedService(send_engine.service)
+        send_engine.service = timed
+        config = EmailConfig(sender_email=SENDER, password="benchmark", subject=subject, body_html=body,
+                             footer_html="", concurrency=args.concurrency, daily_quota=0,
+                             prerender=args.prerender)
+        campaign_id = job_store.create_campaign(config.model_dump(exclude={"password"}), recipients, {}, folder1, [])
+        background_send_emails(campaign_id, config)
+        report = job_store.report(campaign_id)
+        sent = sum(1 for row in report if row["estado"] == "Enviado")
+        failed = len(report) - sent
+    elapsed = time.perf_counter() - start
+    after = resource.getrusage(resource.RUSAGE_SELF)
+
+    cpu = (after.ru_utime - before.ru_utime) + (after.ru_stime - before.ru_stime)
+    # ru_maxrss is in KiB on Linux, bytes on macOS
+    rss_mb = after.ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+    print(json.dumps({
+        "recipients": args.recipients,
+        "attachment_kb": args.attachment_kb,
+        "sent": sent,
+        "failed": failed,
+        "seconds": round(elapsed, 2),
+        "msg_per_s": round(args.recipients / elapsed, 1) if elapsed else 0,
+        "p50_ms": round(percentile(timed.latencies, 50) * 1000, 2),
+        "p99_ms": round(percentile(timed.latencies, 99) * 1000, 2),
+        "peak_rss_mb": round(rss_mb, 1),
+        "cpu_ms_per_msg": round(cpu * 1000 / max(1, args.recipients), 3),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--recipients", default="1000,10000", help="comma separated, e.g. 1000,10000,100000")
+    parser.add_argument("--attachment-kb", default="0,100", help="comma separated attachment sizes")
+    parser.add_argument("--mode", choices=("campaign", "service"), default="campaign")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--prerender", action="store_true", help="campaign mode: build messages in the spool processes")
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--failure-rate", type=float, default=0)
+    parser.add_argument("--throttle-rate", type=float, default=0)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=2599)
+    parser.add_argument("--json", action="store_true", help="print raw JSON lines")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        args.recipients = int(args.recipients)
+        args.attachment_kb = int(args.attachment_kb)
+        run_scenario(args)
+        return
+
+    sink = subprocess.Popen(
+        [sys.executable, SINK, "--host", args.host, "--port", str(args.port), "--latency-ms", str(args.latency_ms),
+         "--failure-rate", str(args.failure_rate), "--throttle-rate", str(args.throttle_rate)],
+        stdout=subprocess.DEVNULL,
+    )
+    try:
+        wait_for_port(args.host, args.port)
+        if not args.json:
+            print(f"{'mode':>8} {'recipients':>10} {'adj KB':>7} {'sent':>7} {'failed':>6} {'msg/s':>8} "
+                  f"{'p50 ms':>8} {'p99 ms':>8} {'RSS MB':>7} {'CPU ms/msg':>10}")
+        for recipients in args.recipients.split(","):
+            for attachment_kb in args.attachment_kb.split(","):
+                child = subprocess.run(
+                    [sys.executable, os.path.abspath(__file__), "--child", "--mode", args.mode,
+                     "--recipients", recipients, "--attachment-kb", attachment_kb,
+                     "--concurrency", str(args.concurrency), "--host", args.host, "--port", str(args.port)]
+                    + (["--prerender"] if args.prerender else []),
+                    capture_output=True, text=True,
+                )
+                if child.returncode != 0:
+                    print(child.stderr, file=sys.stderr)
+                    continue
+                result = json.loads(child.stdout.strip().splitlines()[-1])
+                if args.json:
+                    print(json.dumps(dict(result, mode=args.mode)))
+                else:
+                    print(f"{args.mode:>8} {result['recipients']:>10} {result['attachment_kb']:>7} {result['sent']:>7} "
+                          f"{result['failed']:>6} {result['msg_per_s']:>8} {result['p50_ms']:>8} {result['p99_ms']:>8} "
+                          f"{result['peak_rss_mb']:>7} {result['cpu_ms_per_msg']:>10}")
+    finally:
+        sink.terminate()
+        sink.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+"""Local SMTP sink for benchmarks: accepts and discards every message.
+
+    python benchmarks/smtp_sink.py --port 2525 --latency-ms 20 --failure-rate 0.01 --throttle-rate 0.01
+
+Speaks enough ESMTP for EmailService: EHLO, STARTTLS (self-signed
+certificate, smtplib doesn't verify it), AUTH PLAIN/LOGIN, MAIL, RCPT,
+DATA, RSET, NOOP and QUIT. Behaviour knobs:
+
+  --latency-ms     delay before answering DATA (server-side processing)
+  --failure-rate   share of RCPT commands answered 550 (permanent)
+  --throttle-rate  share of RCPT commands answered 452 (transient)
+
+Some replies can also be asked for, so tests get them every time:
+recipients whose address starts with "reject" get 550, those starting
+with "throttle" get 452 the first time and 250 after that, and AUTH
+with the password "wrong-password" gets 535.
+
+Requires Python 3.11+ (StreamWriter.start_tls) and the cryptography
+package for the certificate.
+"""
+import argparse
+import asyncio
+import base64
+import datetime
+import os
+import random
+import ssl
+import tempfile
+
+# A 100 MB DATA section is far beyond anything the backend sends
+MAX_MESSAGE = 100 * 1024 * 1024
+# Scripted replies (see the module docstring)
+REJECT_PREFIX = b"reject"
+THROTTLE_PREFIX = b"throttle"
+REJECTED_PASSWORD = b"wrong-password"
+
+
+def self_signed_context() -> ssl.SSLContext:
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+    from cryptography.x509.oid import NameOID
+
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "localhost")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name).issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(days=1))
+        .not_valid_after(now + datetime.timedelta(days=30))
+        .sign(key, hashes.SHA256())
+    )
+    directory = tempfile.mkdtemp(prefix="smtp-sink-")
+    cert_path = os.path.join(directory, "cert.pem")
+    key_path = os.path.join(directory, "key.pem")
+    with open(cert_path, "wb") as f:
+        f.write(cert.public_bytes(serialization.Encoding.PEM))
+    with open(key_path, "wb") as f:
+        f.write(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.TraditionalOpenSSL,
+                                  serialization.NoEncryption()))
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(cert_path, key_path)
+    return context
+
+
+class Sink:
+    def __init__(self, latency_ms: float = 0, failure_rate: float = 0, throttle_rate: float = 0):
+        self.latency = latency_ms / 1000
+        self.failure_rate = failure_rate
+        self.throttle_rate = throttle_rate
+        self.tls = self_signed_context()
+        self.messages = 0
+        self.rejected = 0
+        self.throttled = 0
+        # Scripted "throttle" addresses already answered 452 once
+        self.throttled_once = set()
+        self.connections = 0
+        self._writers = set()
+
+    def drop_connections(self):
+        """Hang up on every connected client (call it on the sink's loop)"""
+        for writer in list(self._writers):
+            writer.close()
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        async def reply(line: bytes):
+            writer.write(line)
+            await writer.drain()
+
+        self.connections += 1
+        self._writers.add(writer)
+        accepted = 0
+        try:
+            await reply(b"220 localhost benchmark sink\r\n")
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                command = line[:4].upper()
+                if command in (b"EHLO", b"HELO"):
+                    await reply(b"250-localhost\r\n250-8BITMIME\r\n250-STARTTLS\r\n250-AUTH PLAIN LOGIN\r\n"
+                                b"250 SIZE %d\r\n" % MAX_MESSAGE)
+                elif command == b"STAR":
+                    await reply(b"220 ready for TLS\r\n")
+                    await writer.start_tls(self.tls)
+                elif command == b"AUTH":
+                    words = line.split()
+                    if words[1].upper() == b"LOGIN":
+                        # The username may come with the command
+                        if len(words) == 2:
+                            await reply(b"334 VXNlcm5hbWU6\r\n")
+                            await reader.readline()
+                        await reply(b"334 UGFzc3dvcmQ6\r\n")
+                        password = base64.b64decode(await reader.readline())
+                    else:
+                        # AUTH PLAIN <base64 of "\0user\0password">
+                        password = base64.b64decode(words[-1]).split(b"\0")[-1]
+                    if password == REJECTED_PASSWORD:
+                        await reply(b"535 authentication failed\r\n")
+                    else:
+                        await reply(b"235 authenticated\r\n")
+                elif command == b"MAIL":
+                    accepted = 0
+                    await reply(b"250 ok\r\n")
+                elif command == b"RCPT":
+                    address = line.partition(b"<")[2].partition(b">")[0].lower()
+                    roll = random.random()
+                    if address.startswith(REJECT_PREFIX):
+                        self.rejected += 1
+                        await reply(b"550 no such user\r\n")
+                    elif address.startswith(THROTTLE_PREFIX) and address not in self.throttled_once:
+                        self.throttled_once.add(address)
+                        self.throttled += 1
+                        await reply(b"452 too many messages, slow down\r\n")
+                    elif roll < self.failure_rate:
+                        self.rejected += 1
+                        await reply(b"550 no such user\r\n")
+                    elif roll < self.failure_rate + self.throttle_rate:
+                        self.throttled += 1
+                        await reply(b"452 too many messages, slow down\r\n")
+                    else:
+                        accepted += 1
+                        await reply(b"250 ok\r\n")
+                elif command == b"DATA":
+                    if not accepted:
+                        await reply(b"554 no valid recipients\r\n")
+                        continue
+                    await reply(b"354 end with <CRLF>.<CRLF>\r\n")
+                    await reader.readuntil(b"\r\n.\r\n")
+                    if self.latency:
+                        await asyncio.sleep(self.latency)
+                    self.messages += 1
+                    await reply(b"250 queued\r\n")
+                elif command == b"QUIT":
+                    await reply(b"221 bye\r\n")
+                    break
+                else:
+                    # RSET, NOOP
+                    await reply(b"250 ok\r\n")
+        except (ConnectionError, asyncio.IncompleteReadError, ssl.SSLError):
+            pass
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+
+async def serve(host: str, port: int, sink: Sink):
+    server = await asyncio.start_server(sink.handle, host, port, limit=MAX_MESSAGE)
+    print(f"SMTP sink listening on {host}:{port}", flush=True)
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local SMTP sink for benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=2525)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--failure-rate", type=float, default=0)
+    parser.add_argument("--throttle-rate", type=float, default=0)
+    args = parser.parse_args()
+    sink = Sink(args.latency_ms, args.failure_rate, args.throttle_rate)
+    try:
+        asyncio.run(serve(args.host, args.port, sink))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
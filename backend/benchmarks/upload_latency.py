@@ -0,0 +1,115 @@
+"""Latency of other requests while a large file is being uploaded.
+
+Start the backend first (uvicorn app.main:app --port 8000), then:
+
+    python benchmarks/upload_latency.py --size-mb 500
+
+The script probes a cheap endpoint for a few seconds on an idle server,
+then again while a generated file of --size-mb is uploaded through
+/api/upload/asset, and prints the latency percentiles of both phases.
+With the upload I/O off the event loop the two should be close.
+"""
+import argparse
+import http.client
+import os
+import statistics
+import threading
+import time
+import uuid
+from urllib.parse import urlparse
+
+CHUNK = 1024 * 1024
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    if not ordered:
+        return float("nan")
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def probe(url, path, stop, interval):
+    """Request path until stop is set, return latencies in ms"""
+    latencies = []
+    while not stop.is_set():
+        conn = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=30)
+        start = time.perf_counter()
+        conn.request("GET", path)
+        conn.getresponse().read()
+        latencies.append((time.perf_counter() - start) * 1000)
+        conn.close()
+        time.sleep(interval)
+    return latencies
+
+
+def multipart_body(size, boundary):
+    """Multipart form with a 'type' field and a file of size bytes, in chunks"""
+    yield (f"--{boundary}\r\nContent-Disposition: form-data; name=\"type\"\r\n\r\nbenchmark\r\n"
+           f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"benchmark.bin\"\r\n"
+           "Content-Type: application/octet-stream\r\n\r\n").encode()
+    block = os.urandom(CHUNK)
+    sent = 0
+    while sent < size:
+        piece = block[:min(CHUNK, size - sent)]
+        sent += len(piece)
+        yield piece
+    yield f"\r\n--{boundary}--\r\n".encode()
+
+
+def upload(url, size, result):
+    boundary = uuid.uuid4().hex
+    conn = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=600)
+    start = time.perf_counter()
+    conn.request(
+        "POST", "/api/upload/asset",
+        body=multipart_body(size, boundary),
+        headers={"Content-Type": f"multipart/form-data; boundary={boundary}"},
+        encode_chunked=True,
+    )
+    response = conn.getresponse()
+    response.read()
+    result["status"] = response.status
+    result["seconds"] = time.perf_counter() - start
+    conn.close()
+
+
+def summary(name, latencies):
+    print(f"{name:>14}: n={len(latencies):5d}  p50={percentile(latencies, 50):7.1f} ms"
+          f"  p99={percentile(latencies, 99):7.1f} ms  max={max(latencies or [0]):7.1f} ms"
+          f"  mean={statistics.mean(latencies or [0]):7.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--size-mb", type=int, default=500)
+    parser.add_argument("--probe-path", default="/api/scheduler")
+    parser.add_argument("--baseline-seconds", type=float, default=3)
+    parser.add_argument("--interval", type=float, default=0.02)
+    args = parser.parse_args()
+    url = urlparse(args.url)
+
+    stop = threading.Event()
+    timer = threading.Timer(args.baseline_seconds, stop.set)
+    timer.start()
+    baseline = probe(url, args.probe_path, stop, args.interval)
+
+    result = {}
+    uploader = threading.Thread(target=upload, args=(url, args.size_mb * CHUNK, result))
+    stop = threading.Event()
+    uploader.start()
+    probes = []
+    prober = threading.Thread(target=lambda: probes.extend(probe(url, args.probe_path, stop, args.interval)))
+    prober.start()
+    uploader.join()
+    stop.set()
+    prober.join()
+
+    print(f"Upload of {args.size_mb} MB: HTTP {result.get('status')} in {result.get('seconds', 0):.1f} s")
+    summary("idle", baseline)
+    summary("during upload", probes)
+
+
+if __name__ == "__main__":
+    main()
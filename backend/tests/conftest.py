@@ -0,0 +1,73 @@
+import asyncio
+import os
+import sys
+import threading
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from benchmarks.smtp_sink import MAX_MESSAGE, Sink  # noqa: E402
+from app.services.job_store import CredentialBox, JobStore  # noqa: E402
+
+
+class RunningSink:
+    """benchmarks/smtp_sink.py served from a background thread of the test process"""
+
+    def __init__(self):
+        self.sink = Sink()
+        self.loop = asyncio.new_event_loop()
+        self.server = self.loop.run_until_complete(
+            asyncio.start_server(self.sink.handle, "127.0.0.1", 0, limit=MAX_MESSAGE)
+        )
+        self.address = self.server.sockets[0].getsockname()[:2]
+        self.thread = threading.Thread(target=self.loop.run_forever, name="smtp-sink", daemon=True)
+        self.thread.start()
+
+    def drop_connections(self):
+        """Hang up on every client, like a server dropping idle sessions"""
+        future = asyncio.run_coroutine_threadsafe(self._drop(), self.loop)
+        future.result(5)
+
+    async def _drop(self):
+        self.sink.drop_connections()
+        # Let the transports actually close
+        await asyncio.sleep(0.05)
+
+    def stop(self):
+        asyncio.run_coroutine_threadsafe(self._shutdown(), self.loop).result(5)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(5)
+        self.loop.close()
+
+    async def _shutdown(self):
+        self.server.close()
+        await self._drop()
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+@pytest.fixture(scope="session")
+def smtp_sink():
+    """A local SMTP sink for the test session (see benchmarks/smtp_sink.py)"""
+    sink = RunningSink()
+    try:
+        yield sink
+    finally:
+        sink.stop()
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """Run in an empty directory: temp/ and data/ paths are relative"""
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def store(tmp_path):
+    """A job store of its own for one test"""
+    return JobStore(str(tmp_path / "campaigns.db"), CredentialBox(str(tmp_path / "credentials.key")))
@@ -0,0 +1,104 @@
+import hashlib
+import io
+import os
+
+import pytest
+
+from app.services.asset_store import AssetStore, UploadSessions
+
+CONTENT = b"constancia " * 1000
+
+
+def sha(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+@pytest.fixture
+def assets(workdir):
+    return AssetStore()
+
+
+def test_declared_checksum_is_accepted_only_after_the_bytes_match(assets):
+    sessions = UploadSessions(assets)
+    session = sessions.create("folder1", [{"name": "1_ana.pdf", "size": len(CONTENT), "sha256": sha(CONTENT)}])
+    forged = b"x" * len(CONTENT)
+    with pytest.raises(ValueError, match="Checksum mismatch"):
+        session.write(0, 0, forged)
+    entry = session.files[0]
+    assert not entry.done and entry.offset == 0
+    assert assets.lookup(sha(forged), "1_ana.pdf") is None
+
+    session.write(0, 0, CONTENT)
+    assert entry.done and entry.sha256 == sha(CONTENT)
+    with open(entry.path, "rb") as f:
+        assert f.read() == CONTENT
+
+
+def test_content_already_in_the_store_is_not_uploaded_again(assets):
+    stored = assets.put(io.BytesIO(CONTENT), "1_ana.pdf")
+    session = UploadSessions(assets).create("folder1", [{"name": "2_luis.pdf", "size": len(CONTENT), "sha256": sha(CONTENT)}])
+    entry = session.files[0]
+    assert entry.done and entry.deduped
+    assert os.path.dirname(entry.path) == os.path.dirname(stored["path"])
+
+
+def test_session_survives_a_restart(assets):
+    session = UploadSessions(assets).create("folder2", [{"name": "1_ana.pdf", "size": len(CONTENT)}])
+    session.write(0, 0, CONTENT[:4000])
+
+    # A new process: nothing in memory, state and partial file on disk
+    resumed = UploadSessions(assets).get(session.id)
+    assert resumed.folder_type == "folder2"
+    assert resumed.info()["files"][0]["offset"] == 4000
+    with pytest.raises(ValueError, match="Expected offset 4000"):
+        resumed.write(0, 0, CONTENT)
+    resumed.write(0, 4000, CONTENT[4000:])
+    assert resumed.complete
+    assert resumed.files[0].sha256 == sha(CONTENT)
+
+
+def test_resume_drops_bytes_written_after_the_last_save(assets):
+    session = UploadSessions(assets).create("folder1", [{"name": "1_ana.pdf", "size": len(CONTENT)}])
+    session.write(0, 0, CONTENT[:4000])
+    # The process died while writing the next chunk
+    with open(session.files[0].partial_path, "ab") as f:
+        f.write(CONTENT[4000:5000])
+
+    resumed = UploadSessions(assets).get(session.id)
+    assert resumed.files[0].offset == 4000
+    assert os.path.getsize(resumed.files[0].partial_path) == 4000
+
+
+def test_resume_hashes_the_partial_file_on_disk(assets):
+    sessions = UploadSessions(assets)
+    session = sessions.create("folder1", [{"name": "1_ana.pdf", "size": len(CONTENT), "sha256": sha(CONTENT)}])
+    session.write(0, 0, CONTENT[:4000])
+    # Partial file changed while the server was down
+    with open(session.files[0].partial_path, "r+b") as f:
+        f.write(b"X")
+
+    resumed = UploadSessions(assets).get(session.id)
+    with pytest.raises(ValueError, match="Checksum mismatch"):
+        resumed.write(0, 4000, CONTENT[4000:])
+    assert not resumed.files[0].done
+
+
+def test_closed_and_expired_sessions_leave_nothing_behind(assets):
+    sessions = UploadSessions(assets)
+    closed = sessions.create("folder1", [{"name": "1_ana.pdf", "size": len(CONTENT)}])
+    closed.write(0, 0, CONTENT[:10])
+    sessions.close(closed.id)
+    assert not os.path.exists(closed.state_path)
+    assert not os.path.exists(closed.files[0].partial_path)
+    assert UploadSessions(assets).get(closed.id) is None
+
+    old = sessions.create("folder1", [{"name": "1_ana.pdf", "size": len(CONTENT)}])
+    old.write(0, 0, CONTENT[:10])
+    # After a restart, with the TTL already over
+    UploadSessions(assets, ttl=-1).create("folder2", [])
+    assert not os.path.exists(old.state_path)
+    assert not os.path.exists(old.files[0].partial_path)
+
+
+def test_unknown_session_ids_are_not_looked_up_on_disk(assets):
+    assert UploadSessions(assets).get("../../campaigns") is None
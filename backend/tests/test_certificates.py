@@ -0,0 +1,93 @@
+import io
+import json
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from PIL import Image
+
+from app.api import endpoints
+from app.services.certificate_generator import CertificateJob
+
+FIELDS = json.dumps([{"text": "{{Nombre}}", "x": 0.5, "y": 0.5}])
+
+
+class HeldJobs:
+    """Keeps submitted certificate jobs instead of running them"""
+
+    def __init__(self):
+        self.jobs = []
+
+    def start(self, job):
+        self.jobs.append(job)
+        return job
+
+
+@pytest.fixture
+def client(workdir, monkeypatch):
+    monkeypatch.setattr(endpoints, "current_campaign", {"recipients": [], "assets": {}, "attachments": []})
+    monkeypatch.setattr(endpoints, "certificate_jobs", HeldJobs())
+    app = FastAPI()
+    app.include_router(endpoints.router, prefix="/api")
+    return TestClient(app)
+
+
+def upload_recipients(client, *names):
+    sheet = "Nombre,Correo\n" + "".join(f"{name},{name.lower()}@x.com\n" for name in names)
+    response = client.post("/api/upload/excel", files={"file": ("destinatarios.csv", sheet.encode())})
+    assert response.status_code == 200
+
+
+def start_job(client, folder_type: str = "folder1"):
+    template = io.BytesIO()
+    Image.new("RGB", (200, 100), "white").save(template, "PNG")
+    response = client.post("/api/certificates", data={"fields": FIELDS, "folder_type": folder_type},
+                           files={"template": ("plantilla.png", template.getvalue(), "image/png")})
+    assert response.status_code == 200
+    job = endpoints.certificate_jobs.jobs[-1]
+    job.paths = [f"temp/certificates/{i + 1}_constancia.pdf" for i in range(job.total)]
+    return job
+
+
+def test_finished_job_becomes_the_attachment_folder(client):
+    upload_recipients(client, "Ana", "Luis")
+    job = start_job(client)
+    assert job.on_complete(job)
+    assert endpoints.current_campaign["attachments_folder1"] == job.paths
+
+
+def test_job_is_dropped_when_the_recipients_change(client):
+    upload_recipients(client, "Ana", "Luis")
+    job = start_job(client)
+    upload_recipients(client, "Eva", "Pedro")
+    assert not job.on_complete(job)
+    assert "attachments_folder1" not in endpoints.current_campaign
+
+
+def test_job_is_dropped_when_the_campaign_is_cleared(client):
+    upload_recipients(client, "Ana", "Luis")
+    job = start_job(client)
+    client.post("/api/clear-campaign")
+    assert not job.on_complete(job)
+    assert "attachments_folder1" not in endpoints.current_campaign
+
+
+def test_job_is_dropped_when_its_folder_is_uploaded_meanwhile(client):
+    upload_recipients(client, "Ana", "Luis")
+    job = start_job(client, "folder2")
+    files = [("files", (f"{i}_diploma.pdf", b"pdf", "application/pdf")) for i in (1, 2)]
+    client.post("/api/upload/assets-folder", files=files, data={"folder_type": "folder2"})
+    assert not job.on_complete(job)
+    assert endpoints.current_campaign["attachments_folder2"] == ["temp/assets/folder2/1_diploma.pdf",
+                                                                 "temp/assets/folder2/2_diploma.pdf"]
+    # Another folder doesn't matter
+    other = start_job(client, "folder1")
+    folder2 = endpoints.current_campaign["attachments_folder2"]
+    assert other.on_complete(other)
+    assert endpoints.current_campaign["attachments_folder2"] is folder2
+
+
+def test_discarded_job_status():
+    job = CertificateJob("folder1", "plantilla.png", [], [], "pdf", "{{n}}", on_complete=lambda job: False)
+    job._run()
+    assert job.status == "discarded"
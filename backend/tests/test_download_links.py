@@ -0,0 +1,80 @@
+import os
+import time
+
+import pytest
+
+from app.services import download_links
+from app.services.asset_store import asset_store
+from app.services.download_links import InvalidLink, LinkExpired, LinkSigner, resolve_file
+
+CONFIG = {"sender_email": "remitente@sink.test"}
+
+
+@pytest.fixture
+def links(workdir, store, monkeypatch):
+    monkeypatch.setattr(download_links, "job_store", store)
+    download_links.campaign_files.cache_clear()
+    yield store
+    download_links.campaign_files.cache_clear()
+
+
+def upload(path: str, content: bytes) -> str:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(content)
+    return path
+
+
+def test_links_keep_serving_the_file_that_was_sent(links):
+    uploaded = upload("temp/assets/folder1/1_constancia.pdf", b"constancia de Ana")
+    folder1 = asset_store.pin_all([uploaded, ""])
+    campaign_id = links.create_campaign(CONFIG, [{"Correo": "ana@x.com"}, {"Correo": "luis@x.com"}], {}, folder1, [])
+
+    # The next campaign's upload reuses the file name
+    upload("temp/assets/folder1/1_constancia.pdf", b"constancia de otra persona")
+
+    path = resolve_file(campaign_id, 0, 1)
+    assert os.path.basename(path) == "1_constancia.pdf"
+    with open(path, "rb") as f:
+        assert f.read() == b"constancia de Ana"
+    assert resolve_file(campaign_id, 1, 1) is None
+    assert resolve_file(campaign_id, 0, 2) is None
+
+
+def test_files_outside_the_store_are_never_served(links):
+    uploaded = upload("temp/assets/folder1/1_constancia.pdf", b"constancia")
+    campaign_id = links.create_campaign(CONFIG, [{"Correo": "ana@x.com"}], {}, [uploaded], [])
+    assert resolve_file(campaign_id, 0, 1) is None
+    assert resolve_file("no-such-campaign", 0, 1) is None
+
+
+def test_pin_stores_identical_content_once(links):
+    first = upload("temp/assets/folder1/1_a.pdf", b"same bytes")
+    second = upload("temp/assets/folder2/1_a.pdf", b"same bytes")
+    assert asset_store.pin(first) == asset_store.pin(second)
+    assert asset_store.pin(asset_store.pin(first)) == asset_store.pin(first)
+    assert asset_store.pin("temp/assets/missing.pdf") == "temp/assets/missing.pdf"
+
+
+def test_signed_tokens():
+    signer = LinkSigner(b"k" * 32)
+    expires = int(time.time()) + 60
+    token = signer.sign("abc123", 4, 2, expires)
+    assert signer.verify(token) == ("abc123", 4, 2)
+    with pytest.raises(InvalidLink):
+        signer.verify(token.replace("abc123", "abc124"))
+    with pytest.raises(InvalidLink):
+        LinkSigner(b"x" * 32).verify(token)
+    with pytest.raises(LinkExpired):
+        signer.verify(signer.sign("abc123", 4, 2, int(time.time()) - 1))
+
+
+def test_secret_is_kept_in_the_data_directory(workdir, monkeypatch):
+    monkeypatch.delenv("RESU_LINK_SECRET", raising=False)
+    monkeypatch.setattr(download_links, "SECRET_PATH", os.path.join("data", "link_secret.key"))
+    with open(".link_secret", "wb") as f:
+        f.write(b"legacy key")
+    # Links signed with the old key stay valid
+    assert LinkSigner().secret == b"legacy key"
+    assert not os.path.exists(".link_secret")
+    assert oct(os.stat("data/link_secret.key").st_mode & 0o777) == "0o600"
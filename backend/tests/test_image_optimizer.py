@@ -0,0 +1,84 @@
+import os
+import sys
+
+import pytest
+
+from app.services.image_optimizer import OPTIMIZED_DIR, optimize_image, target_size
+
+Image = pytest.importorskip("PIL.Image")
+
+
+def noise(size, mode="RGB"):
+    bands = len(mode)
+    return Image.frombytes(mode, size, os.urandom(size[0] * size[1] * bands))
+
+
+def test_target_size_fits_the_box_and_never_scales_up():
+    assert target_size((2000, 1000), (540, None)) == (540, 270)
+    assert target_size((300, 600), (None, 70)) == (35, 70)
+    assert target_size((100, 50), (540, None)) == (100, 50)
+    assert target_size((5000, 1), (None, 70)) == (5000, 1)
+
+
+def test_flyer_is_resized_recompressed_and_stripped(workdir):
+    exif = Image.Exif()
+    exif[0x010F] = "Camara"  # Make
+    noise((2000, 1000)).save("flyer.jpg", quality=95, exif=exif)
+    optimized = optimize_image("flyer.jpg", "flyer")
+    assert os.path.dirname(optimized) == OPTIMIZED_DIR
+    assert os.path.getsize(optimized) < os.path.getsize("flyer.jpg")
+    with Image.open(optimized) as img:
+        assert img.size == (540, 270)
+        assert img.format == "JPEG"
+        assert not img.getexif()
+
+
+def test_exif_orientation_is_applied(workdir):
+    exif = Image.Exif()
+    exif[0x0112] = 6  # Rotated 90 degrees
+    noise((600, 300)).save("logo.jpg", quality=95, exif=exif)
+    with Image.open(optimize_image("logo.jpg", "logo")) as img:
+        assert img.size == (35, 70)
+
+
+def test_transparent_logo_stays_png(workdir):
+    noise((800, 400), "RGBA").save("logo.png")
+    optimized = optimize_image("logo.png", "logo")
+    assert optimized.endswith(".png")
+    with Image.open(optimized) as img:
+        assert img.mode == "RGBA" and img.size == (140, 70)
+
+
+def test_same_image_is_optimized_once(workdir, monkeypatch):
+    noise((2000, 1000)).save("flyer.jpg", quality=95)
+    optimized = optimize_image("flyer.jpg", "flyer")
+
+    def fail(*args, **kwargs):
+        raise AssertionError("decoded again")
+
+    monkeypatch.setattr(Image, "open", fail)
+    assert optimize_image("flyer.jpg", "flyer") == optimized
+
+
+def test_originals_are_kept_when_optimizing_does_not_apply(workdir):
+    # Already small
+    Image.new("RGB", (40, 20), "white").save("chico.png")
+    assert optimize_image("chico.png", "logo") == "chico.png"
+    # Not an image
+    with open("logo.png", "wb") as f:
+        f.write(b"no es una imagen" * 100)
+    assert optimize_image("logo.png", "logo") == "logo.png"
+    # Animation would be lost
+    frames = [noise((400, 400)).convert("P") for _ in range(2)]
+    frames[0].save("anim.gif", save_all=True, append_images=frames[1:])
+    assert optimize_image("anim.gif", "flyer") == "anim.gif"
+    # Kinds without a display size
+    noise((2000, 1000)).save("firma.jpg")
+    assert optimize_image("firma.jpg", "otro") == "firma.jpg"
+    assert not os.path.exists(OPTIMIZED_DIR)
+
+
+def test_without_pillow_images_are_sent_as_uploaded(workdir, monkeypatch):
+    noise((2000, 1000)).save("flyer.jpg", quality=95)
+    monkeypatch.setitem(sys.modules, "PIL", None)
+    assert optimize_image("flyer.jpg", "flyer") == "flyer.jpg"
@@ -0,0 +1,138 @@
+import threading
+import time
+
+import pytest
+
+from app.services import scheduler
+from app.services.job_store import SORTABLE_FIELDS, STALE_AFTER
+from app.services.scheduler import CampaignScheduler
+
+CONFIG = {"sender_email": "remitente@sink.test"}
+
+
+def campaign(store, rows: int = 3) -> str:
+    return store.create_campaign(CONFIG, [{"Correo": f"u{i}@x.com", "Nombre": f"U{i}"} for i in range(rows)],
+                                 {}, [], [])
+
+
+def age(store, campaign_id: str, seconds: float):
+    """Pretend nothing touched the campaign for this long"""
+    conn = store._conn()
+    with conn:
+        conn.execute("UPDATE campaigns SET updated_at = ? WHERE id = ?", (time.time() - seconds, campaign_id))
+
+
+def test_claim_leaves_live_campaigns_alone(store):
+    running, queued, paused = campaign(store), campaign(store), campaign(store)
+    store.set_status(running, "running")
+    store.set_status(paused, "paused")
+    assert not store.claim(running)
+    assert not store.claim(queued)
+    assert store.claim(paused)
+    assert store.get_campaign(paused)["status"] == "running"
+
+
+def test_claim_takes_over_orphaned_campaigns(store):
+    running, completed = campaign(store), campaign(store)
+    store.set_status(running, "running")
+    store.set_status(completed, "completed")
+    age(store, running, STALE_AFTER + 1)
+    age(store, completed, STALE_AFTER + 1)
+    assert store.claim(running)
+    assert not store.claim(completed)
+
+
+def test_scheduler_heartbeat_keeps_a_slow_campaign_owned(store, monkeypatch):
+    monkeypatch.setattr(scheduler, "job_store", store)
+    campaigns = CampaignScheduler(max_active=1, heartbeat_interval=0.05)
+    slow, waiting = campaign(store), campaign(store)
+    release = threading.Event()
+
+    def send(campaign_id):
+        store.set_status(campaign_id, "running")
+        # No results recorded while it waits, e.g. a low rate_per_minute
+        release.wait(10)
+
+    campaigns.submit(slow, send, slow)
+    campaigns.submit(waiting, send, waiting)
+    for campaign_id in (slow, waiting):
+        age(store, campaign_id, STALE_AFTER + 1)
+    time.sleep(0.3)
+    # Another process's /resume must not send them again
+    assert not store.claim(slow)
+    assert not store.claim(waiting)
+
+    release.set()
+    deadline = time.monotonic() + 5
+    while campaigns._heartbeat is not None and time.monotonic() < deadline:
+        time.sleep(0.05)
+    # The heartbeat stops with the last campaign
+    assert campaigns._heartbeat is None
+
+
+def report_campaign(store) -> str:
+    """25 delivered rows with ties and NULLs in every sortable column, plus one skipped row"""
+    campaign_id = campaign(store, 26)
+    results = []
+    for i in range(25):
+        results.append((i, {
+            "correo": f"u{i}@x.com",
+            "nombre": None if i % 5 == 0 else f"U{i % 3}",
+            "estado": "Error" if i % 4 == 0 else "Enviado",
+            "fecha": "2026-10-01" if i < 12 else "2026-10-02",
+            "hora": f"10:00:{i % 6:02d}",
+            "intentos": 1 + i % 2,
+            "duracion": None if i % 7 == 0 else round(0.5 * (i % 3), 1),
+            "adjunto1": None,
+            "adjunto2": None,
+            "detalle": "" if i % 4 else "550 no such user",
+            "remitente": "remitente@sink.test",
+        }))
+    results.append((25, None))
+    store.record_deliveries(campaign_id, results)
+    # Downloads: some rows twice, some once, most never (NULL)
+    for i in (3, 8, 8, 11, 11, 20):
+        store.record_download(campaign_id, i, 1)
+    return campaign_id
+
+
+def expected_order(store, campaign_id: str, sort: str, descending: bool):
+    rows = [dict(row, row_index=int(row["correo"][1:].split("@")[0])) for row in store.report(campaign_id)]
+    # SQLite: NULLs first ascending, last descending; row_index breaks ties
+    rows.sort(key=lambda row: (row[sort] is not None, row[sort], row["row_index"]), reverse=descending)
+    return [row["correo"] for row in rows]
+
+
+@pytest.mark.parametrize("sort", SORTABLE_FIELDS)
+@pytest.mark.parametrize("descending", [False, True])
+def test_iter_report_pages_through_ties_and_nulls(store, sort, descending):
+    campaign_id = report_campaign(store)
+    expected = expected_order(store, campaign_id, sort, descending)
+    assert len(expected) == 25
+    for page_size in (1, 3, 7, 25, 100):
+        rows = list(store.iter_report(campaign_id, sort, descending, page_size=page_size))
+        assert [row["correo"] for row in rows] == expected
+        assert "row_index" not in rows[0]
+
+
+@pytest.mark.parametrize("sort", ["descargas", "nombre", "duracion"])
+def test_report_pages_cover_every_row_once(store, sort):
+    campaign_id = report_campaign(store)
+    seen = []
+    for offset in range(0, 25, 4):
+        rows, total = store.report_page(campaign_id, offset, 4, sort, True)
+        assert total == 25
+        seen += [row["correo"] for row in rows]
+    assert seen == expected_order(store, campaign_id, sort, True)
+
+
+def test_iter_report_with_filters(store):
+    campaign_id = report_campaign(store)
+    rows = list(store.iter_report(campaign_id, "descargas", True, page_size=2, estado="Enviado"))
+    assert {row["estado"] for row in rows} == {"Enviado"}
+    # Downloaded rows first, then the never downloaded ones (NULL)
+    assert [row["correo"] for row in rows[:3]] == ["u11@x.com", "u3@x.com", "u23@x.com"]
+    assert len(rows) == len({row["correo"] for row in rows}) == 18
+    rows = list(store.iter_report(campaign_id, "hora", False, page_size=2, desde="2026-10-02", dominio="@X.com"))
+    assert {row["fecha"] for row in rows} == {"2026-10-02"}
+    assert len(rows) == len({row["correo"] for row in rows}) == 13
@@ -0,0 +1,130 @@
+import email
+import os
+import stat
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from types import SimpleNamespace
+
+import pytest
+
+from app.services import message_spool
+from app.services.email_service import email_service
+from app.services.message_spool import CampaignSpool, render_to_spool
+from app.services.retry_policy import RetryPolicy
+from app.services.scheduler import CampaignScheduler
+from app.services.send_engine import SendEngine
+
+
+@pytest.fixture
+def spool_dir(tmp_path, monkeypatch):
+    # Absolute: the render processes don't share the test's working directory
+    path = tmp_path / "spool"
+    monkeypatch.setattr(message_spool, "SPOOL_DIR", str(path))
+    return path
+
+
+@pytest.fixture
+def attachment(tmp_path):
+    path = tmp_path / "1_constancia.pdf"
+    path.write_bytes(b"%PDF-1.4 constancia")
+    return str(path)
+
+
+def test_render_writes_a_complete_eml(tmp_path, attachment):
+    path = str(tmp_path / "0.eml")
+    size = render_to_spool("spool-test", path, "remitente@sink.test", "ana@destino.test", "Constancia",
+                           "<p>Hola Ana</p>", {}, [attachment])
+    assert size == os.path.getsize(path)
+    assert not os.path.exists(f"{path}.tmp")
+    with open(path, "rb") as f:
+        msg = email.message_from_binary_file(f)
+    assert msg["To"] == "ana@destino.test"
+    files = [part.get_filename() for part in msg.walk() if part.get_filename()]
+    assert files == ["1_constancia.pdf"]
+
+
+def test_strict_render_fails_on_a_missing_attachment(tmp_path):
+    path = str(tmp_path / "0.eml")
+    missing = str(tmp_path / "falta.pdf")
+    with pytest.raises(FileNotFoundError, match="falta.pdf"):
+        render_to_spool("spool-test", path, "remitente@sink.test", "ana@destino.test", "s", "<p></p>", {},
+                        [missing], strict=True)
+    assert not os.path.exists(path)
+    # Outside a dry run the message goes without it
+    assert render_to_spool("spool-test", path, "remitente@sink.test", "ana@destino.test", "s", "<p></p>", {},
+                           [missing]) > 0
+
+
+def test_rows_are_rendered_in_the_process_pool_and_cleaned_up(spool_dir, attachment):
+    spool = CampaignSpool("spool-pool-test")
+    assert stat.S_IMODE(os.stat(spool.dir).st_mode) == 0o700
+    futures = [spool.submit(i, "remitente@sink.test", f"u{i}@destino.test", "Constancia", "<p>Hola</p>",
+                            {}, [attachment]) for i in range(3)]
+    sizes = [future.result(timeout=60) for future in futures]
+    assert sizes == [os.path.getsize(spool.path(i)) for i in range(3)]
+
+    spool.discard(0)
+    assert not os.path.exists(spool.path(0))
+    assert os.path.exists(spool.path(1))
+    spool.close()
+    assert not os.path.exists(spool.dir)
+
+
+def test_broken_pool_is_replaced(spool_dir, monkeypatch):
+    class BrokenPool:
+        def submit(self, *args):
+            raise BrokenProcessPool("render process died")
+
+    class Pool:
+        def submit(self, fn, *args):
+            future = Future()
+            future.set_result(0)
+            return future
+
+    resets = []
+
+    def executor(reset=False):
+        resets.append(reset)
+        return Pool() if reset else BrokenPool()
+
+    monkeypatch.setattr(message_spool, "spool_executor", executor)
+    future = CampaignSpool("spool-broken-test").submit(0, "remitente@sink.test", "ana@destino.test", "s", "", {}, [])
+    assert future.result() == 0
+    assert resets == [False, True]
+
+
+def run_config(**overrides):
+    config = dict(sender_email="remitente@sink.test", password="secret", subject="Constancia - {{Nombre}}",
+                  body_html="<p>Hola {{Nombre}}</p>", footer_html="", concurrency=2, rate_per_minute=None,
+                  daily_quota=None)
+    config.update(overrides)
+    return SimpleNamespace(**config)
+
+
+@pytest.fixture
+def engine(smtp_sink, monkeypatch):
+    monkeypatch.setattr(email_service, "get_smtp_config", lambda sender_email: smtp_sink.address)
+    return SendEngine(scheduler=CampaignScheduler(), policy=RetryPolicy(base_delay=0.02, max_delay=0.1))
+
+
+def test_prerendered_run_sends_the_spooled_messages(engine, smtp_sink, spool_dir, attachment):
+    messages = smtp_sink.sink.messages
+    rows = [(0, {"Correo": "ana@destino.test", "Nombre": "Ana"}),
+            (1, {"Correo": "reject-spool@destino.test", "Nombre": "Luis"})]
+    report = engine.run(run_config(prerender=True), rows, {}, [attachment, attachment], [],
+                        campaign_id="spool-run-test")
+    assert [row["estado"] for row in report] == ["Enviado", "Error"]
+    assert smtp_sink.sink.messages - messages == 1
+    assert not os.path.exists(spool_dir / "spool-run-test")
+
+
+def test_dry_run_renders_every_row_and_sends_nothing(engine, smtp_sink, spool_dir, attachment, tmp_path):
+    messages = smtp_sink.sink.messages
+    rows = [(0, {"Correo": "ana@destino.test", "Nombre": "Ana"}),
+            (1, {"Correo": "luis@destino.test", "Nombre": "Luis"})]
+    report = engine.run(run_config(dry_run=True), rows, {}, [attachment, str(tmp_path / "falta.pdf")], [],
+                        campaign_id="spool-dry-run-test")
+    assert [row["estado"] for row in report] == ["Validado", "Error"]
+    assert report[0]["detalle"].endswith("KB")
+    assert "falta.pdf" in report[1]["detalle"]
+    assert smtp_sink.sink.messages == messages
@@ -0,0 +1,80 @@
+from app.services.mime_cache import CampaignPartCache, PartCaches
+
+PNG = bytes.fromhex("89504e470d0a1a0a0000000d4948445200000001000000010806000000"
+                    "1f15c4890000000d49444154789c6360000002000154a24f5d0000000049454e44ae426082")
+
+
+def write(tmp_path, name: str, data: bytes) -> str:
+    path = tmp_path / name
+    path.write_bytes(data)
+    return str(path)
+
+
+def test_inline_image_is_encoded_once(tmp_path):
+    cache = CampaignPartCache()
+    path = write(tmp_path, "logo.png", PNG)
+    part = cache.image_part("logo", path)
+    assert part["Content-ID"] == "<logo>"
+    assert cache.image_part("logo", path) is part
+    # Same file under another cid is another part
+    assert cache.image_part("firma", path) is not part
+
+
+def test_attachment_is_cached_from_its_second_row(tmp_path):
+    cache = CampaignPartCache()
+    path = write(tmp_path, "programa.pdf", b"%PDF" * 100)
+    first = cache.attachment_part(path)
+    second = cache.attachment_part(path)
+    assert first is not second
+    assert cache.attachment_part(path) is second
+    assert cache.size > 0
+
+
+def test_rewritten_file_is_not_served_from_the_cache(tmp_path):
+    cache = CampaignPartCache()
+    path = write(tmp_path, "logo.png", PNG)
+    part = cache.image_part("logo", path)
+    write(tmp_path, "logo.png", PNG + b"\0")
+    assert cache.image_part("logo", path) is not part
+
+
+def test_parts_over_the_byte_budget_are_built_per_message(tmp_path):
+    cache = CampaignPartCache(max_bytes=10)
+    path = write(tmp_path, "logo.png", PNG)
+    assert cache.image_part("logo", path) is not cache.image_part("logo", path)
+    assert cache.size == 0
+
+
+def test_missing_file_gives_no_part(tmp_path):
+    cache = CampaignPartCache()
+    assert cache.attachment_part(str(tmp_path / "falta.pdf")) is None
+    assert cache.image_part("logo", str(tmp_path / "falta.png")) is None
+
+
+def test_seen_attachments_are_capped(tmp_path):
+    cache = CampaignPartCache(max_seen=3)
+    paths = [write(tmp_path, f"{i}_constancia.pdf", b"%PDF" * i) for i in range(1, 11)]
+    for path in paths:
+        cache.attachment_part(path)
+    assert len(cache._seen) == 3
+    assert cache.size == 0
+    # Recent files are still remembered
+    part = cache.attachment_part(paths[-1])
+    assert cache.attachment_part(paths[-1]) is part
+
+
+def test_campaign_caches_are_dropped_and_bounded(tmp_path):
+    caches = PartCaches(max_campaigns=2)
+    path = write(tmp_path, "logo.png", PNG)
+    a = caches.get("a")
+    a.image_part("logo", path)
+    assert caches.get("a") is a
+    caches.drop("a")
+    assert a.size == 0
+    assert caches.get("a") is not a
+
+    b = caches.get("b")
+    caches.get("c")
+    caches.get("d")
+    # The least recently used campaign was forgotten
+    assert caches.get("b") is not b
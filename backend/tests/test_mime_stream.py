@@ -0,0 +1,81 @@
+import base64
+import email
+from email.mime.text import MIMEText
+
+from app.services import mime_stream
+from app.services.email_service import email_service
+from app.services.mime_stream import SpooledMessage, StreamedMessage, iter_base64_file
+from app.services.smtp_pool import SMTPConnectionPool
+
+DATA = bytes(range(256)) * 1000  # Not a multiple of the 57-byte line input
+
+
+def test_base64_blocks_are_whole_crlf_lines(tmp_path):
+    path = tmp_path / "grande.bin"
+    path.write_bytes(DATA)
+    chunks = list(iter_base64_file(str(path)))
+    assert len(chunks) > 1
+    lines = b"".join(chunks).split(b"\r\n")
+    assert lines[-1] == b""
+    assert all(len(line) == 76 for line in lines[:-2])
+    assert base64.b64decode(b"".join(lines)) == DATA
+    (tmp_path / "vacio.bin").write_bytes(b"")
+    assert list(iter_base64_file(str(tmp_path / "vacio.bin"))) == []
+
+
+def streamed_message(tmp_path, monkeypatch):
+    monkeypatch.setattr(mime_stream, "STREAM_THRESHOLD", 1000)
+    big = tmp_path / "1_constancia.pdf"
+    big.write_bytes(DATA)
+    small = tmp_path / "2_programa.pdf"
+    small.write_bytes(b"%PDF-1.4 corto")
+    msg, streamed = email_service.build_message("remitente@sink.test", "ana@destino.test", "Constancia",
+                                                "<p>Hola</p>", attachments=[str(big), str(small)])
+    assert list(streamed.values()) == [str(big)]
+    return StreamedMessage(msg, streamed)
+
+
+def test_streamed_message_is_a_regular_mime_message(tmp_path, monkeypatch):
+    message = streamed_message(tmp_path, monkeypatch)
+    # Only the placeholder is in memory, not the file
+    assert len(message.skeleton()) < len(DATA) / 10
+    out = tmp_path / "mensaje.eml"
+    with open(out, "wb") as f:
+        size = message.write_to(f)
+    assert size == out.stat().st_size
+
+    parsed = email.message_from_bytes(out.read_bytes())
+    attachments = {part.get_filename(): part.get_payload(decode=True)
+                   for part in parsed.walk() if part.get_filename()}
+    assert attachments == {"1_constancia.pdf": DATA, "2_programa.pdf": b"%PDF-1.4 corto"}
+
+
+def test_lines_starting_with_a_dot_are_stuffed_for_data():
+    # 7bit text keeps the dots (the HTML of real messages is base64)
+    message = StreamedMessage(MIMEText("Hola\n.\n.fin\n", "plain", "us-ascii"), {})
+    plain = b"".join(message.chunks())
+    stuffed = b"".join(message.chunks(dot_stuff=True))
+    assert b"\r\n.\r\n" in plain and b"\r\n.\r\n" not in stuffed
+    assert stuffed.replace(b"\r\n..", b"\r\n.") == plain
+
+
+def test_spooled_message_is_stuffed_across_read_blocks(tmp_path, monkeypatch):
+    monkeypatch.setattr(mime_stream, "SPOOL_READ", 4)
+    path = tmp_path / "mensaje.eml"
+    # Blocks: "abc." ".x\r\n" ".yz\r" "\n.\r\n"
+    path.write_bytes(b"abc..x\r\n.yz\r\n.\r\n")
+    message = SpooledMessage(str(path))
+    assert b"".join(message.chunks()) == path.read_bytes()
+    assert b"".join(message.chunks(dot_stuff=True)) == b"abc..x\r\n..yz\r\n..\r\n"
+
+
+def test_streamed_message_goes_through_smtp(tmp_path, monkeypatch, smtp_sink):
+    message = streamed_message(tmp_path, monkeypatch)
+    pool = SMTPConnectionPool()
+    host, port = smtp_sink.address
+    messages = smtp_sink.sink.messages
+    refused = pool.send_message(host, port, "remitente@sink.test", "secret", message,
+                                to_addrs=["ana@destino.test"])
+    assert refused == {}
+    assert smtp_sink.sink.messages - messages == 1
+    pool.close_all()
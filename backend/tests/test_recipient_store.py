@@ -0,0 +1,64 @@
+from openpyxl import Workbook
+
+from app.services.recipient_store import SNIFF_BYTES, load_recipients
+
+
+def write(tmp_path, name: str, data: bytes) -> str:
+    path = tmp_path / name
+    path.write_bytes(data)
+    return str(path)
+
+
+def test_excel_csv_export_is_read_as_cp1252(tmp_path):
+    # Excel on Windows: cp1252 and ';'
+    text = "Nombre;Correo;Curso\r\nJosé Muñoz;jose@x.com;“Taller” – 20 €\r\n"
+    table, summary = load_recipients(write(tmp_path, "excel.csv", text.encode("cp1252")))
+    assert table.columns == ["Nombre", "Correo", "Curso"]
+    assert table[0] == {"Nombre": "José Muñoz", "Correo": "jose@x.com", "Curso": "“Taller” – 20 €"}
+    assert summary["valid_count"] == 1
+
+
+def test_bytes_undefined_in_cp1252_fall_back_to_latin1(tmp_path):
+    data = "Nombre,Correo\r\n".encode() + b"Ana\x81,ana@x.com\r\n"
+    table, _ = load_recipients(write(tmp_path, "raro.csv", data))
+    assert table[0]["Nombre"] == "Ana\x81"
+
+
+def test_utf8_with_bom(tmp_path):
+    text = "Nombre,Correo\nJosé,jose@x.com\n"
+    table, _ = load_recipients(write(tmp_path, "bom.csv", text.encode("utf-8-sig")))
+    assert table.columns == ["Nombre", "Correo"]
+    assert table[0]["Nombre"] == "José"
+
+
+def test_utf8_character_cut_by_the_sniff_sample(tmp_path):
+    header = "Nombre,Correo\n"
+    lines = [header]
+    size = len(header)
+    # Fill up to one byte before the end of the sample, then a 2-byte "é"
+    while size < SNIFF_BYTES - 40:
+        line = f"Usuario {len(lines)},u{len(lines)}@x.com\n"
+        lines.append(line)
+        size += len(line)
+    padding = SNIFF_BYTES - 1 - size - len("Jos")
+    lines.append("Jos" + "e" * padding + "é,jose@x.com\n")
+    data = "".join(lines).encode()
+    assert data[SNIFF_BYTES - 1:SNIFF_BYTES + 1] == "é".encode()
+    table, _ = load_recipients(write(tmp_path, "largo.csv", data))
+    assert table[-1]["Nombre"].endswith("eé")
+    assert len(table) == len(lines) - 1
+
+
+def test_blank_lines_are_dropped_and_row_numbers_kept(tmp_path):
+    wb = Workbook()
+    ws = wb.active
+    ws.append(["Correo", "Nombre"])
+    ws.append(["ana@x.com", " Ana "])
+    ws.append([None, None])
+    ws.append(["luis@x.com", "Luis"])
+    path = str(tmp_path / "lista.xlsx")
+    wb.save(path)
+    table, summary = load_recipients(path, chunk_size=1)
+    assert list(table) == [{"Correo": "ana@x.com", "Nombre": "Ana"}, {"Correo": "luis@x.com", "Nombre": "Luis"}]
+    assert table.row_numbers == [2, 4]
+    assert summary["email_column"] == "Correo"
@@ -0,0 +1,55 @@
+from app.services.recipient_store import RecipientTable
+from app.services.recipient_validation import (
+    StaticResolver, recipient_email, skipped_report_rows, validate_recipients,
+)
+
+
+def table(columns, rows) -> RecipientTable:
+    t = RecipientTable(columns)
+    t.append_rows(rows)
+    return t
+
+
+def test_rows_are_validated_with_the_address_they_are_sent_to():
+    t = table(["Nombre", "Correo", "Email"], [
+        ("Ana", "ana@x.com", "otra@x.com"),
+        ("Luis", None, " <Luis@X.COM> "),   # Correo empty: sent to Email
+        ("Eva", None, "no-es-correo"),
+        ("Sin", None, None),
+    ])
+    summary = validate_recipients(t)
+    assert [recipient_email(row) for row in t] == ["ana@x.com", "Luis@x.com", "no-es-correo", None]
+    assert summary["valid_count"] == 2
+    assert summary["skip"] == {2: ("Error", "Correo invalido"), 3: ("Error", "Sin correo")}
+    assert summary["domains"] == [{"dominio": "x.com", "total": 2}]
+
+
+def test_address_that_normalizes_to_nothing_falls_back_like_the_send_loop():
+    t = table(["Correo", "Email"], [("mailto:", "ana@x.com")])
+    summary = validate_recipients(t)
+    assert t[0] == {"Correo": None, "Email": "ana@x.com"}
+    assert recipient_email(t[0]) == "ana@x.com"
+    assert summary["skip"] == {}
+
+
+def test_duplicates_across_columns_and_undeliverable_domains():
+    t = table(["correo", "Email"], [
+        ("ana@x.com", None),
+        (None, "ANA@X.com"),
+        ("luis@nomail.test", None),
+    ])
+    summary = validate_recipients(t, StaticResolver({"nomail.test": None}))
+    assert summary["skip"] == {
+        1: ("Duplicado", "Duplicado de la fila 2"),
+        2: ("Error", "Dominio sin servidor de correo"),
+    }
+    rows = skipped_report_rows(t, summary["skip"])
+    assert [(i, row["correo"], row["estado"]) for i, row in rows] == [
+        (1, "ANA@x.com", "Duplicado"), (2, "luis@nomail.test", "Error"),
+    ]
+
+
+def test_table_without_address_column():
+    summary = validate_recipients(table(["Nombre"], [("Ana",)]))
+    assert summary["valid_count"] == 0
+    assert summary["skip"] == {}
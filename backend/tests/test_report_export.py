@@ -0,0 +1,55 @@
+import io
+import os
+import tempfile
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from openpyxl import load_workbook
+
+from app.api import endpoints
+from app.services.report_export import HEADERS, iter_csv
+
+
+@pytest.fixture
+def client(store, tmp_path, monkeypatch):
+    monkeypatch.setattr(endpoints, "job_store", store)
+    monkeypatch.setattr(tempfile, "tempdir", str(tmp_path / "tmp"))
+    os.makedirs(tempfile.tempdir)
+    app = FastAPI()
+    app.include_router(endpoints.router, prefix="/api")
+    return TestClient(app)
+
+
+def sent_campaign(store, rows: int) -> str:
+    campaign_id = store.create_campaign({"sender_email": "remitente@sink.test"},
+                                        [{"Correo": f"u{i}@x.com"} for i in range(rows)], {}, [], [])
+    store.record_deliveries(campaign_id, [(i, {"correo": f"u{i}@x.com", "nombre": f"Usuario {i}", "estado": "Enviado",
+                                               "intentos": 1}) for i in range(rows)])
+    return campaign_id
+
+
+def test_xlsx_export_leaves_no_file_behind(client, store):
+    campaign_id = sent_campaign(store, 30)
+    response = client.get(f"/api/campaigns/{campaign_id}/report/export", params={"format": "xlsx", "order": "desc"})
+    assert response.status_code == 200
+    assert f"reporte_envios_{campaign_id}_" in response.headers["content-disposition"]
+    ws = load_workbook(io.BytesIO(response.content)).active
+    rows = list(ws.values)
+    assert rows[0][0] == HEADERS["correo"]
+    assert [row[0] for row in rows[1:]] == [f"u{i}@x.com" for i in reversed(range(30))]
+    assert os.listdir(tempfile.tempdir) == []
+
+
+def test_csv_export(client, store):
+    campaign_id = sent_campaign(store, 3)
+    response = client.get(f"/api/campaigns/{campaign_id}/report/export", params={"format": "csv"})
+    lines = response.text.lstrip("\ufeff").splitlines()
+    assert lines[0].startswith("Correo,Nombre,Estado")
+    assert [line.split(",")[0] for line in lines[1:]] == ["u0@x.com", "u1@x.com", "u2@x.com"]
+
+
+def test_csv_is_streamed_in_chunks():
+    chunks = list(iter_csv({"correo": f"u{i}@x.com"} for i in range(1200)))
+    assert len(chunks) == 3
+    assert sum(chunk.count("\n") for chunk in chunks) == 1201
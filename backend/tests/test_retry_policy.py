@@ -0,0 +1,72 @@
+import smtplib
+import socket
+
+import pytest
+
+from app.services.retry_policy import (AUTH, NETWORK, PERMANENT, TRANSIENT, RetryPolicy, classify_error,
+                                       describe_error, not_accepted)
+
+
+@pytest.mark.parametrize("exc, kind", [
+    (None, PERMANENT),
+    (smtplib.SMTPAuthenticationError(535, b"bad credentials"), AUTH),
+    (smtplib.SMTPResponseException(534, b"web login required"), AUTH),
+    (smtplib.SMTPResponseException(451, b"try later"), TRANSIENT),
+    (smtplib.SMTPResponseException(554, b"rejected"), PERMANENT),
+    (smtplib.SMTPDataError(452, b"slow down"), TRANSIENT),
+    (smtplib.SMTPRecipientsRefused({"a@x.com": (452, b"busy")}), TRANSIENT),
+    (smtplib.SMTPRecipientsRefused({"a@x.com": (452, b"busy"), "b@x.com": (550, b"no such user")}), PERMANENT),
+    (smtplib.SMTPServerDisconnected("gone"), NETWORK),
+    (smtplib.SMTPConnectError(421, b"busy"), TRANSIENT),
+    (smtplib.SMTPNotSupportedError("no STARTTLS"), PERMANENT),
+    (socket.timeout("timed out"), NETWORK),
+    (socket.gaierror("no such host"), NETWORK),
+    (ConnectionResetError(), NETWORK),
+    (ConnectionRefusedError(), NETWORK),
+    (TimeoutError(), NETWORK),
+    (FileNotFoundError("constancia.pdf"), PERMANENT),
+    (PermissionError("constancia.pdf"), PERMANENT),
+    (IsADirectoryError("adjuntos"), PERMANENT),
+    (OSError(28, "No space left on device"), PERMANENT),
+    (ValueError("bad template"), PERMANENT),
+])
+def test_classify_error(exc, kind):
+    assert classify_error(exc) == kind
+
+
+@pytest.mark.parametrize("exc, accepted", [
+    (None, False),
+    (smtplib.SMTPRecipientsRefused({"a@x.com": (550, b"no such user")}), False),
+    (socket.gaierror("no such host"), False),
+    (PermissionError("constancia.pdf"), False),
+    (IsADirectoryError("adjuntos"), False),
+    (smtplib.SMTPDataError(554, b"rejected"), True),
+    (smtplib.SMTPServerDisconnected("gone"), True),
+    (socket.timeout("timed out"), True),
+])
+def test_not_accepted(exc, accepted):
+    # "accepted" = the provider may have taken the message
+    assert not_accepted(exc) is not accepted
+
+
+def test_describe_error():
+    assert describe_error(None) == "Correo invalido"
+    assert describe_error(smtplib.SMTPResponseException(550, b"no such user")) == "550 no such user"
+    assert describe_error(smtplib.SMTPRecipientsRefused({"a@x.com": (452, b"busy")})) == "452 busy"
+    assert describe_error(ValueError("x" * 300)) == ("ValueError: " + "x" * 300)[:200]
+
+
+def test_should_retry_only_transient_and_network_errors():
+    policy = RetryPolicy(max_attempts=3)
+    assert policy.should_retry(TRANSIENT, 1)
+    assert policy.should_retry(NETWORK, 2)
+    assert not policy.should_retry(TRANSIENT, 3)
+    assert not policy.should_retry(PERMANENT, 1)
+    assert not policy.should_retry(AUTH, 1)
+
+
+def test_delay_backs_off_with_jitter_up_to_max_delay():
+    policy = RetryPolicy(base_delay=2, max_delay=10)
+    for attempts, backoff in [(1, 2), (2, 4), (3, 8), (4, 10), (10, 10)]:
+        for _ in range(20):
+            assert backoff / 2 <= policy.delay(attempts) <= backoff
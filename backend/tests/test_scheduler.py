@@ -0,0 +1,111 @@
+from datetime import date, timedelta
+
+import pytest
+
+from app.services import scheduler
+from app.services.scheduler import CampaignScheduler, DailyQuota, QuotaExceeded, TokenBucket
+
+
+class Clock:
+    """Stands in for the time module so buckets refill on demand"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(scheduler, "time", clock)
+    return clock
+
+
+def test_bucket_allows_a_burst_then_spaces_out_sends(clock):
+    bucket = TokenBucket(60)
+    # Five seconds worth of messages right away
+    assert [bucket.reserve() for _ in range(5)] == [0.0] * 5
+    assert bucket.reserve() == pytest.approx(1.0)
+    assert bucket.reserve() == pytest.approx(2.0)
+    clock.now += 10
+    assert bucket.reserve() == 0.0
+
+
+def test_bucket_reserves_a_token_per_recipient(clock):
+    bucket = TokenBucket(60)
+    assert bucket.reserve(5) == 0.0
+    assert bucket.reserve(3) == pytest.approx(3.0)
+
+
+def test_bucket_halves_its_rate_when_throttled_and_recovers(clock):
+    bucket = TokenBucket(60, min_rate_per_minute=20)
+    bucket.penalize()
+    assert bucket.rate_per_minute == 30
+    # The burst is gone: the lower rate applies to the next send
+    assert bucket.reserve() == pytest.approx(2.0)
+    bucket.penalize()
+    assert bucket.rate_per_minute == 20
+    for _ in range(100):
+        bucket.reward()
+    assert bucket.rate_per_minute == 60
+
+
+def test_daily_quota():
+    quota = DailyQuota(3)
+    assert quota.try_consume(2)
+    assert not quota.try_consume(2)
+    assert quota.try_consume()
+    assert not quota.try_consume()
+    quota.refund(2)
+    assert quota.used == 1
+    quota.refund(5)
+    assert quota.used == 0
+
+
+def test_daily_quota_resets_on_a_new_day():
+    quota = DailyQuota(2, used=2)
+    assert not quota.try_consume()
+    quota.day = date.today() - timedelta(days=1)
+    assert quota.try_consume(2)
+    assert quota.used == 2
+
+
+def test_daily_quota_without_limit():
+    quota = DailyQuota(None)
+    assert all(quota.try_consume(100) for _ in range(10))
+
+
+def test_provider_limits_are_opt_in():
+    campaigns = CampaignScheduler()
+    campaigns.configure_sender("a@gmail.com", "smtp.gmail.com")
+    assert campaigns.sender_buckets == {} and campaigns.host_buckets == {}
+    assert campaigns.quotas["a@gmail.com"].limit is None
+
+    campaigns.configure_sender("a@gmail.com", "smtp.gmail.com", provider_limits=True)
+    assert campaigns.sender_buckets["a@gmail.com"].rate_per_minute == 60
+    assert campaigns.host_buckets["smtp.gmail.com"].rate_per_minute == 240
+    assert campaigns.quotas["a@gmail.com"].limit == 500
+
+
+def test_slot_raises_when_the_quota_runs_out(clock):
+    campaigns = CampaignScheduler()
+    campaigns.configure_sender("a@x.com", "smtp.x.com", daily_quota=2, sent_today=1)
+    with campaigns.slot("c1", "a@x.com", "smtp.x.com"):
+        pass
+    with pytest.raises(QuotaExceeded):
+        with campaigns.slot("c1", "a@x.com", "smtp.x.com"):
+            pass
+
+
+def test_refund_only_when_asked():
+    campaigns = CampaignScheduler()
+    campaigns.configure_sender("a@x.com", "smtp.x.com", daily_quota=10, sent_today=5)
+    campaigns.record_result("a@x.com", "smtp.x.com", False, 550)
+    assert campaigns.quotas["a@x.com"].used == 5
+    campaigns.record_result("a@x.com", "smtp.x.com", False, 550, recipients=2, refund=True)
+    assert campaigns.quotas["a@x.com"].used == 3
@@ -0,0 +1,83 @@
+from types import SimpleNamespace
+
+import pytest
+
+from app.services.email_service import email_service
+from app.services.retry_policy import RetryPolicy
+from app.services.scheduler import CampaignScheduler
+from app.services.send_engine import CampaignAborted, SendEngine
+
+
+@pytest.fixture
+def engine(smtp_sink, monkeypatch):
+    """An engine that sends every sender's mail to the local SMTP sink"""
+    monkeypatch.setattr(email_service, "get_smtp_config", lambda sender_email: smtp_sink.address)
+    return SendEngine(scheduler=CampaignScheduler(), policy=RetryPolicy(base_delay=0.02, max_delay=0.1))
+
+
+def make_config(**overrides):
+    config = dict(sender_email="remitente@sink.test", password="secret", subject="Constancia - {{Nombre}}",
+                  body_html="<p>Hola {{Nombre}}</p>", footer_html="", concurrency=2, rate_per_minute=None,
+                  daily_quota=None)
+    config.update(overrides)
+    return SimpleNamespace(**config)
+
+
+def rows(*addresses):
+    return [(i, {"Correo": address, "Nombre": f"Usuario {i}"}) for i, address in enumerate(addresses)]
+
+
+def test_run_reports_sent_rejected_and_retried_rows(engine):
+    progress = []
+    report = engine.run(make_config(), rows("ana@destino.test", "reject-luis@destino.test",
+                                            "throttle-eva@destino.test", "pedro@destino.test"),
+                        {}, [], [], on_progress=progress.extend, campaign_id="engine-test")
+
+    assert [row["correo"] for row in report] == ["ana@destino.test", "reject-luis@destino.test",
+                                                 "throttle-eva@destino.test", "pedro@destino.test"]
+    assert [row["estado"] for row in report] == ["Enviado", "Error", "Enviado", "Enviado"]
+    sent, rejected, retried, _ = report
+    assert sent["intentos"] == 1 and sent["detalle"] == ""
+    assert sent["remitente"] == "remitente@sink.test"
+    # 550 is permanent: reported after a single attempt
+    assert rejected["intentos"] == 1
+    assert rejected["detalle"].startswith("550")
+    # 452 is transient: retried, then accepted
+    assert retried["intentos"] == 2 and retried["detalle"] == ""
+    assert sorted(i for i, _ in progress) == [0, 1, 2, 3]
+
+
+def test_rejected_credentials_abort_the_run(engine):
+    progress = []
+    # Its own sender: pooled sessions are per sender and would skip the login
+    config = make_config(sender_email="bloqueado@sink.test", password="wrong-password")
+    with pytest.raises(CampaignAborted, match="Authentication failed for bloqueado@sink.test: 535"):
+        engine.run(config, rows("ana@destino.test", "pedro@destino.test"),
+                   {}, [], [], on_progress=progress.extend, campaign_id="engine-auth-test")
+    # Nothing was sent: every row is sent again once the password is fixed
+    assert progress == []
+
+
+def test_batch_splits_rcpt_replies_between_its_rows(engine, smtp_sink):
+    messages = smtp_sink.sink.messages
+    # No placeholders: every row gets the same message
+    config = make_config(subject="Constancia", body_html="<p>Hola</p>", batch_size=10)
+    report = engine.run(config, rows("ana@destino.test", "reject-luis@destino.test", "throttle-batch@destino.test",
+                                     "pedro@destino.test", "eva@destino.test"),
+                        {}, [], [], campaign_id="engine-batch-test")
+
+    assert [row["estado"] for row in report] == ["Enviado", "Error", "Enviado", "Enviado", "Enviado"]
+    assert report[1]["detalle"].startswith("550")
+    # Everyone in the batch made one attempt; the 452 row was retried on its own
+    assert [row["intentos"] for row in report] == [1, 1, 2, 1, 1]
+    assert smtp_sink.sink.messages - messages == 2
+
+
+def test_batch_with_every_recipient_refused(engine, smtp_sink):
+    messages = smtp_sink.sink.messages
+    config = make_config(subject="Constancia", body_html="<p>Hola</p>", batch_size=10)
+    report = engine.run(config, rows("reject-a@destino.test", "reject-b@destino.test"), {}, [], [],
+                        campaign_id="engine-batch-refused-test")
+    assert [(row["estado"], row["intentos"]) for row in report] == [("Error", 1), ("Error", 1)]
+    assert all(row["detalle"].startswith("550") for row in report)
+    assert smtp_sink.sink.messages == messages
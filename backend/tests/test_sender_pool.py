@@ -0,0 +1,106 @@
+import threading
+
+import pytest
+
+from app.services.sender_pool import MAX_THROTTLE_COOLDOWN, THROTTLE_COOLDOWN, SenderAccount, SenderPool
+
+
+def make_pool(*concurrency):
+    return SenderPool([SenderAccount(f"s{i}@x.com", "secret", "smtp.x.com", c) for i, c in enumerate(concurrency)])
+
+
+def test_acquire_takes_the_least_loaded_account():
+    pool = make_pool(2, 1)
+    first, second = pool.accounts
+    assert pool.acquire() is first
+    # first is at 1/2, second at 0/1
+    assert pool.acquire() is second
+    assert pool.acquire() is first
+    assert (first.in_flight, second.in_flight) == (2, 1)
+
+
+def test_acquire_prefers_the_given_account_while_it_has_room():
+    pool = make_pool(2, 2)
+    first, second = pool.accounts
+    assert pool.acquire(prefer=second) is second
+    assert pool.acquire(prefer=second) is second
+    assert pool.acquire(prefer=second) is first
+
+
+def test_acquire_waits_for_a_release():
+    pool = make_pool(1)
+    account = pool.acquire()
+    taken = []
+    waiter = threading.Thread(target=lambda: taken.append(pool.acquire()))
+    waiter.start()
+    waiter.join(0.2)
+    assert waiter.is_alive() and not taken
+    pool.release(account)
+    waiter.join(5)
+    assert taken == [account]
+
+
+def test_disabled_accounts_leave_the_rotation():
+    pool = make_pool(1, 1)
+    first, second = pool.accounts
+    assert pool.disable(first, "535 bad credentials", "auth")
+    assert pool.acquire() is second
+    pool.release(second)
+    assert pool.assign() is second
+    assert not pool.disable(second, "Daily quota reached", "quota")
+    assert pool.acquire() is None
+    assert pool.stop_reason() == "535 bad credentials; Daily quota reached"
+    assert not pool.all_disabled_by("auth")
+
+
+def test_disable_wakes_waiting_senders():
+    pool = make_pool(1)
+    account = pool.acquire()
+    taken = []
+    waiter = threading.Thread(target=lambda: taken.append(pool.acquire()))
+    waiter.start()
+    pool.disable(account, "535 bad credentials", "auth")
+    waiter.join(5)
+    assert taken == [None]
+
+
+def test_throttled_account_cools_down():
+    pool = make_pool(1, 1)
+    first, second = pool.accounts
+    pool.record(first, False, throttled=True)
+    assert first.failed == 1
+    assert first.cooldown_until > 0
+    assert pool.acquire(prefer=first) is second
+    pool.release(second)
+    assert pool.acquire() is second
+
+
+def test_cooling_accounts_are_used_when_all_are_cooling():
+    pool = make_pool(1, 1)
+    first, second = pool.accounts
+    pool.record(first, False, throttled=True)
+    pool.record(second, False, throttled=True)
+    pool.record(second, False, throttled=True)
+    # first is out of its cooldown sooner
+    assert pool.acquire() is first
+
+
+def test_cooldown_doubles_while_throttling_and_resets_on_success():
+    pool = make_pool(1, 1)
+    account = pool.accounts[0]
+    for cooldown in [THROTTLE_COOLDOWN, THROTTLE_COOLDOWN * 2, THROTTLE_COOLDOWN * 4]:
+        pool.record(account, False, throttled=True)
+        assert account.info()["cooling_down"] == pytest.approx(cooldown, abs=1)
+    for _ in range(10):
+        pool.record(account, False, throttled=True)
+    assert account.info()["cooling_down"] == pytest.approx(MAX_THROTTLE_COOLDOWN, abs=1)
+    pool.record(account, True)
+    assert account.throttle_streak == 0 and account.sent == 1
+
+
+def test_a_single_account_never_cools_down():
+    pool = make_pool(1)
+    account = pool.accounts[0]
+    pool.record(account, False, throttled=True)
+    assert account.cooldown_until == 0.0
+    assert pool.acquire() is account
@@ -0,0 +1,85 @@
+import smtplib
+from email.message import EmailMessage
+
+import pytest
+
+from app.services.smtp_pool import SMTPConnectionPool
+
+
+def message(to: str) -> EmailMessage:
+    msg = EmailMessage()
+    msg["From"] = "remitente@sink.test"
+    msg["To"] = to
+    msg["Subject"] = "Constancia"
+    msg.set_content("Hola")
+    return msg
+
+
+def send(pool: SMTPConnectionPool, smtp_sink, to: str = "ana@destino.test", sender: str = "remitente@sink.test"):
+    host, port = smtp_sink.address
+    return pool.send_message(host, port, sender, "secret", message(to))
+
+
+def test_sessions_are_reused(smtp_sink):
+    pool = SMTPConnectionPool()
+    connections, messages = smtp_sink.sink.connections, smtp_sink.sink.messages
+    for _ in range(3):
+        assert send(pool, smtp_sink) == {}
+    assert smtp_sink.sink.messages - messages == 3
+    assert smtp_sink.sink.connections - connections == 1
+    pool.close_all()
+
+
+def test_dropped_session_is_replaced_and_the_message_sent_once(smtp_sink):
+    pool = SMTPConnectionPool()
+    send(pool, smtp_sink)
+    smtp_sink.drop_connections()
+    connections, messages = smtp_sink.sink.connections, smtp_sink.sink.messages
+    assert send(pool, smtp_sink) == {}
+    assert smtp_sink.sink.messages - messages == 1
+    assert smtp_sink.sink.connections - connections == 1
+    pool.close_all()
+
+
+def test_session_is_replaced_after_the_message_cap(smtp_sink):
+    pool = SMTPConnectionPool(max_messages_per_connection=2)
+    connections = smtp_sink.sink.connections
+    for _ in range(5):
+        send(pool, smtp_sink)
+    # 2 + 2 + 1 messages
+    assert smtp_sink.sink.connections - connections == 3
+    pool.close_all()
+
+
+def test_idle_session_gets_a_noop_before_reuse(smtp_sink):
+    pool = SMTPConnectionPool(health_check_after=0)
+    host, port = smtp_sink.address
+    send(pool, smtp_sink)
+    conn = pool.acquire(host, port, "remitente@sink.test", "secret")
+    assert conn.reused
+    pool.release(conn)
+    smtp_sink.drop_connections()
+    # The dead session fails its NOOP and a new one is opened
+    conn = pool.acquire(host, port, "remitente@sink.test", "secret")
+    assert not conn.reused
+    pool.release(conn)
+    pool.close_all()
+
+
+def test_session_is_reset_and_kept_after_a_rejected_recipient(smtp_sink):
+    pool = SMTPConnectionPool()
+    connections = smtp_sink.sink.connections
+    send(pool, smtp_sink)
+    with pytest.raises(smtplib.SMTPRecipientsRefused):
+        send(pool, smtp_sink, to="reject-luis@destino.test")
+    send(pool, smtp_sink)
+    assert smtp_sink.sink.connections - connections == 1
+    pool.close_all()
+
+
+def test_failed_login_is_not_pooled(smtp_sink):
+    pool = SMTPConnectionPool()
+    host, port = smtp_sink.address
+    with pytest.raises(smtplib.SMTPAuthenticationError):
+        pool.send_message(host, port, "bloqueado@sink.test", "wrong-password", message("ana@destino.test"))
+    assert pool._idle == {}
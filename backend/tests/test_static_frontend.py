@@ -0,0 +1,118 @@
+import asyncio
+import gzip
+
+import pytest
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+from app.services import static_frontend
+from app.services.static_frontend import IMMUTABLE_CACHE, REVALIDATE_CACHE, StaticFrontend, accepted_encodings
+
+SCRIPT = b"console.log('constancias');\n" * 200
+INDEX = b"<!doctype html><div id=root></div>" + b" " * 2000
+
+
+@pytest.fixture
+def dist(tmp_path):
+    (tmp_path / "assets").mkdir()
+    (tmp_path / "index.html").write_bytes(INDEX)
+    (tmp_path / "assets" / "index-3f2a.js").write_bytes(SCRIPT)
+    (tmp_path / "assets" / "logo-9c1d.png").write_bytes(b"\x89PNG" + bytes(4000))
+    (tmp_path / "favicon.ico").write_bytes(b"ico")
+    return tmp_path
+
+
+def client(root) -> TestClient:
+    return TestClient(StaticFrontend(root))
+
+
+def test_manifest_indexes_the_build_once(dist):
+    (dist / "assets" / "index-3f2a.js.gz").write_bytes(gzip.compress(SCRIPT))
+    app = StaticFrontend(dist)
+    assert sorted(app.files) == ["assets/index-3f2a.js", "assets/logo-9c1d.png", "favicon.ico", "index.html"]
+    assert app.index is app.files["index.html"]
+    assert app.files["assets/index-3f2a.js"].body == SCRIPT
+    # Images aren't compressed, small files aren't worth it
+    assert not app.files["assets/logo-9c1d.png"].variants
+    assert not app.files["favicon.ico"].variants
+    # The manifest is all a request looks at
+    (dist / "nuevo.txt").write_text("despues")
+    assert app.lookup("/nuevo.txt") is app.index
+
+
+def test_client_routes_get_index_but_missing_bundles_404(dist):
+    c = client(dist)
+    response = c.get("/campanas/123")
+    assert response.status_code == 200
+    assert response.content == INDEX
+    assert response.headers["cache-control"] == REVALIDATE_CACHE
+    assert c.get("/assets/index-0000.js").status_code == 404
+
+
+def test_hashed_bundles_are_immutable_and_compressed(dist):
+    response = client(dist).get("/assets/index-3f2a.js", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["cache-control"] == IMMUTABLE_CACHE
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert response.headers["content-type"].startswith(("text/javascript", "application/javascript"))
+    assert response.content == SCRIPT
+
+
+def test_encoding_follows_accept_encoding(dist):
+    (dist / "assets" / "index-3f2a.js.br").write_bytes(b"brotli del build")
+    c = client(dist)
+    br = c.get("/assets/index-3f2a.js", headers={"Accept-Encoding": "gzip, br"})
+    assert br.headers["content-encoding"] == "br"
+    identity = c.get("/assets/index-3f2a.js", headers={"Accept-Encoding": "gzip;q=0, br;q=0"})
+    assert "content-encoding" not in identity.headers
+    assert identity.content == SCRIPT
+    assert len({br.headers["etag"], identity.headers["etag"]}) == 2
+    assert accepted_encodings("*") >= {"br", "gzip"}
+    assert accepted_encodings("gzip;q=bad, identity") == {"identity"}
+
+
+def test_etag_revalidation(dist):
+    c = client(dist)
+    first = c.get("/index.html", headers={"Accept-Encoding": "gzip"})
+    etag = first.headers["etag"]
+    again = c.get("/index.html", headers={"Accept-Encoding": "gzip", "If-None-Match": f"W/{etag}"})
+    assert again.status_code == 304
+    assert again.content == b""
+    # Same tag, other representation: full response
+    plain = c.get("/index.html", headers={"Accept-Encoding": "identity", "If-None-Match": etag})
+    assert plain.status_code == 200
+
+
+def test_large_files_are_streamed_from_disk(dist, monkeypatch):
+    monkeypatch.setattr(static_frontend, "MAX_IN_MEMORY", 1000)
+    app = StaticFrontend(dist)
+    assert app.files["assets/index-3f2a.js"].body is None
+    assert not app.files["assets/index-3f2a.js"].variants
+    response = TestClient(app).get("/assets/index-3f2a.js")
+    assert response.content == SCRIPT
+
+
+def test_only_get_and_head(dist):
+    c = client(dist)
+    assert c.head("/assets/index-3f2a.js").status_code == 200
+    response = c.post("/index.html")
+    assert response.status_code == 405
+    assert response.headers["allow"] == "GET, HEAD"
+
+
+def test_non_http_scopes(dist):
+    app = StaticFrontend(dist)
+    with pytest.raises(WebSocketDisconnect):
+        with TestClient(app).websocket_connect("/ws"):
+            pass
+
+    sent = []
+
+    async def receive():
+        return {"type": "lifespan.startup"}
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(app({"type": "lifespan"}, receive, send))
+    assert sent == []
@@ -0,0 +1,51 @@
+from app.services.template_engine import LINKS_FIELD, CampaignTemplates, CompiledTemplate
+
+
+def test_placeholders_are_filled_from_the_row():
+    template = CompiledTemplate("Hola {{Nombre}}, curso {{ Curso }} del {{Fecha de emision}}.")
+    assert template.fields == ["Nombre", "Curso", "Fecha de emision"]
+    assert len(template.literals) == len(template.fields) + 1
+    row = {"Nombre": "Ana", "Curso": "Excel", "Fecha de emision": "2024-05-01"}
+    assert template.render(row) == "Hola Ana, curso Excel del 2024-05-01."
+
+
+def test_empty_and_missing_cells_render_empty():
+    template = CompiledTemplate("[{{a}}|{{b}}|{{c}}|{{d}}]")
+    assert template.render({"a": None, "b": float("nan"), "c": 7}) == "[||7|]"
+
+
+def test_repeated_placeholders_and_static_text():
+    template = CompiledTemplate("{{x}}-{{x}}")
+    assert template.placeholders == {"x"}
+    assert template.render({"x": "1"}) == "1-1"
+    static = CompiledTemplate("Sin campos {no} {{}}")
+    assert static.is_static
+    assert static.render({}) == "Sin campos {no} {{}}"
+    assert CompiledTemplate(None).render({}) == ""
+
+
+def test_values_are_not_parsed_as_templates():
+    assert CompiledTemplate("{{a}}").render({"a": "{{b}}"}) == "{{b}}"
+
+
+def test_campaign_templates_render_subject_and_full_html():
+    templates = CampaignTemplates("Constancia de {{Nombre}}", "<p>Hola {{Nombre}}</p>", "<small>{{Area}}</small>")
+    subject, html = templates.render({"Nombre": "Luis", "Area": "RRHH"})
+    assert subject == "Constancia de Luis"
+    assert "<p>Hola Luis</p>" in html and "<small>RRHH</small>" in html
+    assert html.index("Hola Luis") < html.index("RRHH")
+    assert templates.unknown_placeholders(["Nombre"]) == ["Area"]
+    assert not templates.is_static
+
+
+def test_links_go_where_the_body_asks_or_at_its_end():
+    placed = CampaignTemplates("s", "<p>{{enlaces}}</p><p>Fin</p>", links=True)
+    html = placed.render({LINKS_FIELD: "LINKS"})[1]
+    assert html.index("LINKS") < html.index("Fin")
+    assert html.count("LINKS") == 1
+
+    appended = CampaignTemplates("s", "<p>Fin</p>", links=True)
+    html = appended.render({LINKS_FIELD: "LINKS"})[1]
+    assert html.index("Fin") < html.index("LINKS")
+    assert appended.unknown_placeholders([]) == []
+    assert CampaignTemplates("s", "<p>Fin</p>").unknown_placeholders([]) == []